@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the NVP codec against the urlencode/parse_qs/force_text
+path it replaced.
+
+    python benchmarks/nvp_codec.py [iterations]
+"""
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import timeit
+from decimal import Decimal as D
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure()
+
+from django.utils.encoding import force_text
+from django.utils.http import urlencode
+from django.utils.six.moves.urllib.parse import parse_qs
+
+from paypal import nvp
+
+PARAMS = {
+    'METHOD': 'SetExpressCheckout',
+    'VERSION': '88.0',
+    'USER': 'sdk-three_api1.sdk.com',
+    'PWD': 'QFZCWN5HZM8VBG7Q',
+    'SIGNATURE': 'A-IzJhZZjhg29XQ2qnhapuwxIDzyAZQ92FRP5dqBzVesOkzbdUONzmOU',
+    'PAYMENTREQUEST_0_AMT': D('33.98'),
+    'PAYMENTREQUEST_0_CURRENCYCODE': 'GBP',
+    'PAYMENTREQUEST_0_ITEMAMT': D('33.98'),
+    'PAYMENTREQUEST_0_SHIPPINGAMT': D('0.00'),
+    'PAYMENTREQUEST_0_PAYMENTACTION': 'Sale',
+    'L_PAYMENTREQUEST_0_NAME0': 'The shellcoder\'s handbook & more',
+    'L_PAYMENTREQUEST_0_DESC0': 'Café crème = 5% off',
+    'L_PAYMENTREQUEST_0_AMT0': D('16.99'),
+    'L_PAYMENTREQUEST_0_QTY0': 2,
+    'RETURNURL': 'http://localhost:8000/checkout/paypal/place-order/1/',
+    'CANCELURL': 'http://localhost:8000/checkout/paypal/cancel/1/',
+    'NOSHIPPING': 1,
+    'ALLOWNOTE': True,
+}
+
+RESPONSE = (
+    'TOKEN=EC%2d6WY34243AN3588740&CHECKOUTSTATUS=PaymentActionCompleted'
+    '&TIMESTAMP=2012%2d04%2d19T10%3a07%3a46Z&CORRELATIONID=7e9c5efbda3c0'
+    '&ACK=Success&VERSION=88%2e0&BUILD=2808426'
+    '&EMAIL=david%2e_1332854868_per%40gmail%2ecom&PAYERID=7ZTRBDFYYA47W'
+    '&PAYERSTATUS=verified&FIRSTNAME=David&LASTNAME=Winterbottom'
+    '&COUNTRYCODE=GB&SHIPTONAME=David%20Winterbottom'
+    '&SHIPTOSTREET=1%20Main%20Terrace&SHIPTOSTREET2=line2'
+    '&SHIPTOCITY=Wolverhampton&SHIPTOSTATE=West%20Midlands'
+    '&SHIPTOZIP=W12%204LQ&SHIPTOCOUNTRYCODE=GB'
+    '&SHIPTOCOUNTRYNAME=United%20Kingdom&ADDRESSSTATUS=Confirmed'
+    '&CURRENCYCODE=GBP&AMT=33%2e98&SHIPPINGAMT=0%2e00&HANDLINGAMT=0%2e00'
+    '&TAXAMT=0%2e00&INSURANCEAMT=0%2e00&SHIPDISCAMT=0%2e00'
+    '&PAYMENTREQUEST_0_CURRENCYCODE=GBP&PAYMENTREQUEST_0_AMT=33%2e98'
+    '&PAYMENTREQUEST_0_TRANSACTIONID=51963679RW630412N'
+    '&PAYMENTREQUESTINFO_0_ERRORCODE=0').encode('utf8')
+
+
+def old_encode():
+    return urlencode(PARAMS)
+
+
+def old_decode():
+    pairs = {}
+    for key, values in parse_qs(RESPONSE.decode('utf8')).items():
+        pairs[force_text(key)] = force_text(values[0])
+    return pairs
+
+
+def old_value():
+    ctx = parse_qs(RESPONSE.decode('utf8'))
+    return force_text(ctx['PAYERID'][0])
+
+
+def new_encode():
+    return nvp.encode(PARAMS)
+
+
+def new_decode():
+    return nvp.decode(RESPONSE)
+
+
+def new_value():
+    return nvp.decode(RESPONSE).get('PAYERID')
+
+
+def main(number):
+    for name in ('encode', 'decode', 'value'):
+        old = timeit.timeit(globals()['old_%s' % name], number=number)
+        new = timeit.timeit(globals()['new_%s' % name], number=number)
+        print('%-7s old %8.2fus  new %8.2fus  speedup %.1fx' % (
+            name, old / number * 1e6, new / number * 1e6, old / new))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Benchmark of the hot transaction lookups against a synthetic SQLite table,
+before and after adding the indexes declared on the models.
+
+    python benchmarks/transaction_indexes.py [rows]
+
+The tables mirror the columns that the lookups touch, rather than the full
+models, so the benchmark runs without Django.
+"""
+from __future__ import print_function, unicode_literals
+import datetime
+import random
+import sqlite3
+import sys
+import time
+
+SCHEMA = """
+CREATE TABLE express (
+    id INTEGER PRIMARY KEY, method VARCHAR(32), token VARCHAR(32),
+    correlation_id VARCHAR(32), date_created DATETIME);
+CREATE TABLE preauth (id INTEGER PRIMARY KEY, token VARCHAR(32),
+                      email VARCHAR(128));
+CREATE TABLE payflow (
+    id INTEGER PRIMARY KEY, comment1 VARCHAR(128), trxtype VARCHAR(12),
+    date_created DATETIME);
+"""
+
+# The indexes declared on the models, other than comment1's existing one
+INDEXES = """
+CREATE INDEX express_token_method ON express (token, method, date_created);
+CREATE INDEX express_correlation_id ON express (correlation_id);
+CREATE INDEX express_date_created ON express (date_created);
+CREATE INDEX preauth_token ON preauth (token);
+CREATE INDEX payflow_comment1_trxtype
+    ON payflow (comment1, trxtype, date_created);
+CREATE INDEX payflow_date_created ON payflow (date_created);
+"""
+
+EXPRESS_METHODS = ('SetExpressCheckout', 'GetExpressCheckoutDetails',
+                   'GetExpressCheckoutDetails', 'DoExpressCheckoutPayment')
+
+
+def populate(db, rows):
+    start = datetime.datetime(2012, 1, 1)
+    checkouts = rows // len(EXPRESS_METHODS)
+
+    def express():
+        for i in range(checkouts):
+            created = start + datetime.timedelta(seconds=i * 30)
+            for j, method in enumerate(EXPRESS_METHODS):
+                yield (method, 'EC-%017d' % i, '%013x' % (i * 4 + j),
+                       created + datetime.timedelta(seconds=j))
+    db.executemany('INSERT INTO express (method, token, correlation_id, '
+                   'date_created) VALUES (?, ?, ?, ?)', express())
+    db.executemany('INSERT INTO preauth (token, email) VALUES (?, ?)',
+                   (('EC-%017d' % i, 'buyer%d@example.com' % i)
+                    for i in range(checkouts)))
+
+    def payflow():
+        for i in range(rows // 2):
+            created = start + datetime.timedelta(seconds=i * 60)
+            yield ('%08d' % i, 'A', created)
+            yield ('%08d' % i, 'D', created + datetime.timedelta(days=1))
+    db.executemany('INSERT INTO payflow (comment1, trxtype, date_created) '
+                   'VALUES (?, ?, ?)', payflow())
+    db.execute('CREATE INDEX payflow_comment1 ON payflow (comment1)')
+    db.commit()
+    return checkouts
+
+
+def queries(checkouts):
+    token = 'EC-%017d' % random.randrange(checkouts)
+    settled = ['%013x' % (random.randrange(checkouts) * 4 + 3)
+               for i in range(200)]
+    return [
+        ('express token + method',
+         'SELECT id FROM express WHERE token = ? AND method = ?',
+         (token, 'DoExpressCheckoutPayment')),
+        ('preauth token',
+         'SELECT email FROM preauth WHERE token = ?', (token,)),
+        ('express without order',
+         'SELECT id FROM express WHERE correlation_id NOT IN (%s) '
+         'AND method != ? ORDER BY date_created DESC LIMIT 50' % ', '.join(
+             '?' * len(settled)), tuple(settled) + ('SetExpressCheckout',)),
+        ('express list page',
+         'SELECT id FROM express ORDER BY date_created DESC LIMIT 50 '
+         'OFFSET 5000', ()),
+        ('payflow order + type',
+         'SELECT id FROM payflow WHERE comment1 = ? AND trxtype = ?',
+         ('%08d' % random.randrange(checkouts), 'A')),
+    ]
+
+
+def run(db, checkouts, number=5):
+    random.seed(0)
+    results = {}
+    for i in range(number):
+        for name, sql, params in queries(checkouts):
+            start = time.time()
+            db.execute(sql, params).fetchall()
+            results.setdefault(name, []).append(time.time() - start)
+    return dict((name, sorted(times)[len(times) // 2] * 1000)
+                for name, times in results.items())
+
+
+def main(rows):
+    db = sqlite3.connect(':memory:')
+    db.executescript(SCHEMA)
+    start = time.time()
+    checkouts = populate(db, rows)
+    print('Populated %d express and %d payflow rows in %.1fs' % (
+        checkouts * len(EXPRESS_METHODS), rows, time.time() - start))
+    before = run(db, checkouts)
+    db.executescript(INDEXES)
+    db.execute('ANALYZE')
+    after = run(db, checkouts)
+    for name, sql, params in queries(checkouts):
+        print('%-24s before %9.3fms  after %9.3fms  speedup %.0fx' % (
+            name, before[name], after[name], before[name] / after[name]))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
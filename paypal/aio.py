@@ -0,0 +1,250 @@
+"""
+Asynchronous twin of the gateway module for use on an asyncio event loop.
+
+This module requires Python 3.7+ and aiohttp.  Settings for timeouts, circuit
+breaking and retries are shared with the synchronous gateway.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+import weakref
+from contextlib import contextmanager
+
+import aiohttp
+
+from django.conf import settings
+
+from paypal import exceptions, gateway, nvp, timing, transport
+
+logger = logging.getLogger('paypal.gateway')
+
+# Maximum number of connections kept open to each PayPal host from each event
+# loop.
+DEFAULT_POOL_SIZE = 100
+
+# Transport used to send requests
+DEFAULT_TRANSPORT = 'paypal.aio.AiohttpTransport'
+
+_deadline = contextvars.ContextVar('paypal_deadline', default=None)
+
+# One client session per event loop as sessions can't be shared between loops
+_sessions = weakref.WeakKeyDictionary()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Limit the total time that gateway calls made by the current task within
+    the block can take.
+    """
+    previous = _deadline.get()
+    expires = time.time() + seconds
+    if previous is not None:
+        expires = min(expires, previous)
+    token = _deadline.set(expires)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining():
+    expires = _deadline.get()
+    if expires is None:
+        return gateway.time_remaining()
+    return expires - time.time()
+
+
+def _timing_trace_config():
+    """
+    Return a trace config that records phase timings in the dict passed as
+    the ``trace_request_ctx`` of a request.  aiohttp doesn't separate the TLS
+    handshake from connecting so it is included in the connect time.
+    """
+    def mark(name):
+        async def callback(session, context, params):
+            setattr(context, name, time.time())
+        return callback
+
+    def phase(name, start):
+        async def callback(session, context, params):
+            if context.trace_request_ctx is not None:
+                timing.record(name, getattr(context, start),
+                              context.trace_request_ctx)
+        return callback
+
+    async def on_request_end(session, context, params):
+        timings = context.trace_request_ctx
+        if timings is not None:
+            # Time since the request started, less the time spent getting a
+            # connection
+            timing.record('first_byte', context.request_start, timings)
+            timings['first_byte'] -= (timings.get('pool_wait', 0) +
+                                      timings.get('connect', 0))
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(mark('request_start'))
+    trace_config.on_connection_queued_start.append(mark('queued'))
+    trace_config.on_connection_queued_end.append(phase('pool_wait', 'queued'))
+    trace_config.on_connection_create_start.append(mark('connecting'))
+    trace_config.on_connection_create_end.append(
+        phase('connect', 'connecting'))
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def get_session():
+    """
+    Return the pooled HTTP client for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        size = getattr(settings, 'PAYPAL_ASYNC_POOL_SIZE', DEFAULT_POOL_SIZE)
+        keep_alive = getattr(settings, 'PAYPAL_KEEP_ALIVE',
+                             gateway.DEFAULT_KEEP_ALIVE)
+        if keep_alive:
+            connector = aiohttp.TCPConnector(
+                limit=0, limit_per_host=size, keepalive_timeout=keep_alive)
+        else:
+            connector = aiohttp.TCPConnector(
+                limit=0, limit_per_host=size, force_close=True)
+        session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar(),
+            trace_configs=[_timing_trace_config()])
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    """
+    Close the HTTP client of the running event loop.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Run a blocking function (eg one that uses the ORM) in a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs))
+
+
+class AiohttpTransport(transport.AsyncTransport):
+    """
+    Transport that uses a pooled aiohttp client per event loop.  This is the
+    default for the asynchronous API.
+    """
+
+    async def post(self, url, body, headers, timeout, timings):
+        connect, read = timeout
+        client_timeout = aiohttp.ClientTimeout(
+            total=time_remaining(), sock_connect=connect, sock_read=read)
+        try:
+            async with get_session().post(
+                    url, data=body, headers=headers, timeout=client_timeout,
+                    trace_request_ctx=timings) as response:
+                read_start = time.time()
+                content = await response.read()
+                timing.record('read', read_start, timings)
+                return response.status, content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise exceptions.TransportError(repr(e))
+
+    async def close(self):
+        await close_session()
+
+
+def get_transport():
+    """
+    Return the transport selected by the ``PAYPAL_ASYNC_TRANSPORT`` setting.
+    """
+    return gateway.load_transport(getattr(
+        settings, 'PAYPAL_ASYNC_TRANSPORT', DEFAULT_TRANSPORT))
+
+
+async def async_post(url, params, headers=None, length_tags=False):
+    """
+    Make a POST request to the URL using the key-value pairs.  Return
+    a ``paypal.gateway.Response``.
+
+    :url: URL to post to
+    :params: Dict of parameters to include in post payload
+    :headers: Dict of additional HTTP headers to send
+    :length_tags: Whether to encode the payload with Payflow length tags
+                  rather than URL encoding
+    """
+    method = gateway.api_method(params)
+    timeout = gateway.get_timeout(method, time_remaining())
+    breaker = gateway.get_breaker(url, method)
+    # The breakers' state is in Django's cache, which may block, so they are
+    # called from a worker thread like the ORM
+    if breaker:
+        await run_sync(breaker.before_call)
+
+    payload = nvp.encode(params, length_tags)
+    request_headers = {'content-type': 'text/namevalue; charset=utf-8'}
+    if headers:
+        request_headers.update(headers)
+    timings = {}
+    start_time = time.time()
+    try:
+        # The timeouts only bound each connect and read, so the deadline is
+        # enforced on the call as a whole too
+        status, content = await asyncio.wait_for(
+            get_transport().post(
+                url, payload, request_headers, timeout, timings),
+            time_remaining())
+    except (exceptions.TransportError, asyncio.TimeoutError) as e:
+        logger.warning("Error communicating with %s: %r", url, e)
+        if breaker:
+            await run_sync(breaker.record_failure)
+        raise exceptions.PayPalError("Unable to communicate with PayPal")
+    if status != 200:
+        if breaker:
+            await run_sync(breaker.record_failure)
+        raise exceptions.PayPalError("Unable to communicate with PayPal")
+    if breaker:
+        await run_sync(breaker.record_success)
+
+    return gateway.parse_response(payload, content, start_time, timings)
+
+
+async def async_retry(call, idempotent, should_retry=None):
+    """
+    Asynchronous version of ``paypal.gateway.retry``.  ``call`` should
+    return an awaitable.
+    """
+    retries = getattr(settings, 'PAYPAL_RETRIES', gateway.DEFAULT_RETRIES)
+    attempt = 0
+    while True:
+        try:
+            result = await call()
+        except exceptions.CircuitOpenError:
+            raise
+        except exceptions.PayPalError as e:
+            if not idempotent or attempt >= retries:
+                raise
+            error = e
+        else:
+            if not (idempotent and should_retry and attempt < retries and
+                    should_retry(result)):
+                return result
+            error = None
+
+        delay = gateway.backoff(attempt)
+        remaining = time_remaining()
+        if remaining is not None and delay >= remaining:
+            if error:
+                raise error
+            return result
+        attempt += 1
+        logger.info("Retrying PayPal call in %.2fs (retry %d of %d)",
+                    delay, attempt, retries)
+        await asyncio.sleep(delay)
@@ -0,0 +1,222 @@
+"""
+Archiving of old transaction rows.
+
+The transaction tables only grow, but rows older than a few months are
+rarely looked at.  ``archive`` moves the rows created before a cutoff into
+gzipped JSON lines files on local disk, one per model and month (eg
+``paypal.ExpressTransaction-2014-03.jsonl.gz``), and then deletes them from
+the database.
+
+Rows are read in primary key order, a chunk at a time, and each chunk is
+written and synced to its archives before any of it is deleted.  Deletes
+are made in small batches, each in its own transaction, so that no lock is
+held for long.  If the archiver stops between writing a chunk and deleting
+it, the chunk is archived again on the next run; readers keep the last copy
+of each row.
+
+``Archive`` reads the archived rows of a model back, eg to search them from
+the dashboard.  It never writes to the database.
+"""
+from __future__ import unicode_literals
+import collections
+import datetime
+import glob
+import gzip
+import io
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
+from django.utils import timezone
+
+from paypal import journal
+
+# Rows older than this many days are archived
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+
+# Number of rows read per query, and deleted per transaction
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_DELETE_BATCH_SIZE = 200
+
+# Fields that archived rows are searched on, per model
+SEARCH_FIELDS = {
+    'paypal.ExpressTransaction': ('correlation_id', 'token', 'method',
+                                  'error_code', 'raw_response'),
+    'paypal.PayflowTransaction': ('comment1', 'pnref', 'ppref', 'trxtype',
+                                  'raw_response'),
+}
+
+
+def is_enabled():
+    """
+    Return whether transactions are archived, ie ``PAYPAL_ARCHIVE_DIR`` is
+    set
+    """
+    return bool(getattr(settings, 'PAYPAL_ARCHIVE_DIR', None))
+
+
+def get_directory():
+    directory = getattr(settings, 'PAYPAL_ARCHIVE_DIR', None)
+    if not directory:
+        raise ImproperlyConfigured(
+            "PAYPAL_ARCHIVE_DIR must be set to archive transactions")
+    return directory
+
+
+def get_cutoff(days=None):
+    """
+    Return the time before which rows are archived
+    """
+    if days is None:
+        days = getattr(settings, 'PAYPAL_ARCHIVE_AFTER_DAYS',
+                       DEFAULT_ARCHIVE_AFTER_DAYS)
+    return timezone.now() - datetime.timedelta(days=days)
+
+
+def archive_path(directory, model, month):
+    """
+    Return the path of a model's archive for a month ('YYYY-MM')
+    """
+    return os.path.join(directory, '%s-%s.jsonl.gz' % (
+        journal.model_label(model), month))
+
+
+def _write(directory, model, instances):
+    months = collections.OrderedDict()
+    for instance in instances:
+        record = journal.serialize(instance)
+        record['pk'] = instance.pk
+        month = instance.date_created.strftime('%Y-%m')
+        months.setdefault(month, []).append(
+            json.dumps(record, sort_keys=True, separators=(',', ':')))
+    for month, lines in months.items():
+        # Each write adds a gzip member, which readers see as one stream
+        with io.open(archive_path(directory, model, month), 'ab') as f:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f) as gz:
+                gz.write('\n'.join(lines).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def archive(model, directory, cutoff, chunk_size=DEFAULT_CHUNK_SIZE,
+            delete_batch_size=DEFAULT_DELETE_BATCH_SIZE, pause=0):
+    """
+    Archive and delete the rows of a model created before the cutoff.
+    Return the number of rows archived.
+
+    :pause: Seconds to wait between delete batches, eg to let replicas
+            catch up
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    count, last_pk = 0, 0
+    while True:
+        chunk = list(model.objects.with_payloads().filter(
+            date_created__lt=cutoff, pk__gt=last_pk).order_by('pk')[
+                :chunk_size])
+        if not chunk:
+            return count
+        _write(directory, model, chunk)
+        pks = [instance.pk for instance in chunk]
+        for i in range(0, len(pks), delete_batch_size):
+            model._default_manager.filter(
+                pk__in=pks[i:i + delete_batch_size]).delete()
+            if pause:
+                time.sleep(pause)
+        count += len(chunk)
+        last_pk = pks[-1]
+
+
+class Archive(object):
+    """
+    Read-only access to the archived rows of a model.
+
+    Rows are returned as model instances with their original primary key.
+    They aren't in the database, so mustn't be saved.
+    """
+
+    def __init__(self, model, directory=None):
+        self.model = model
+        self.directory = directory or get_directory()
+
+    def months(self):
+        """
+        Return the months ('YYYY-MM') that have archives, newest first
+        """
+        pattern = archive_path(self.directory, self.model, '*')
+        prefix, suffix = pattern.split('*')
+        return sorted((path[len(prefix):-len(suffix)]
+                       for path in glob.glob(pattern)), reverse=True)
+
+    def rows(self, month):
+        """
+        Return the archived rows for a month, newest first
+        """
+        path = archive_path(self.directory, self.model, month)
+        if not os.path.exists(path):
+            return []
+        models = {journal.model_label(self.model): self.model}
+        records = collections.OrderedDict()
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                record = json.loads(line.decode('utf-8'))
+                # A row archived twice is read as its last copy
+                records[record['pk']] = record
+        instances = []
+        for pk, record in records.items():
+            instance = journal.deserialize(record, models)
+            instance.pk = pk
+            instances.append(instance)
+        instances.sort(key=lambda instance: instance.date_created,
+                       reverse=True)
+        return instances
+
+    def search(self, query, month=None):
+        """
+        Return the archived rows (for a month, or for all months) that
+        contain the query in one of their search fields, newest first
+        """
+        query = query.lower()
+        fields = SEARCH_FIELDS.get(journal.model_label(self.model), ())
+        months = [month] if month else self.months()
+        return [
+            instance for month in months for instance in self.rows(month)
+            if any(query in (getattr(instance, field) or '').lower()
+                   for field in fields)]
+
+
+class ArchiveListMixin(object):
+    """
+    Mixin for list views of a model's archived rows.  One month is shown at
+    a time (the newest, unless the ``month`` parameter is passed), filtered
+    by the ``q`` parameter.  The view is not found if transactions aren't
+    archived.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not is_enabled():
+            raise Http404("PayPal transactions aren't archived")
+        self.archive = Archive(self.model)
+        self.months = self.archive.months()
+        self.month = request.GET.get('month')
+        if self.month not in self.months:
+            self.month = self.months[0] if self.months else None
+        self.query = request.GET.get('q', '').strip()
+        return super(ArchiveListMixin, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if self.month is None:
+            return []
+        if self.query:
+            return self.archive.search(self.query, self.month)
+        return self.archive.rows(self.month)
+
+    def get_context_data(self, **kwargs):
+        ctx = super(ArchiveListMixin, self).get_context_data(**kwargs)
+        ctx['months'] = self.months
+        ctx['month'] = self.month
+        ctx['query'] = self.query
+        return ctx
@@ -0,0 +1,326 @@
+"""
+Persistence of the transaction rows that record each gateway call.
+
+By default each row is saved as soon as the call returns, which puts an
+INSERT on the customer's request path.  With ``PAYPAL_AUDIT_WRITE_BEHIND``
+enabled, rows for calls that nothing reads back later (eg
+``SetExpressCheckout`` and ``GetExpressCheckoutDetails``) are instead
+buffered and written with ``bulk_create`` by a background thread, once
+enough rows are waiting or at a fixed interval.  Buffered rows are flushed
+when the process exits.
+
+Rows for money-moving calls are always saved straight away, as the facades
+look them up to capture, void or refund.  The facades also flush the buffer
+before looking rows up, so changing which calls are buffered never hides a
+row that is needed.
+
+If the journal is enabled (see ``paypal.journal``), rows are journalled
+before they are saved or buffered, and buffered rows that the journal's
+ingester has saved in the meantime are skipped.
+"""
+from __future__ import unicode_literals
+import atexit
+import collections
+import logging
+import os
+import random
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import (
+    DatabaseError, IntegrityError, close_old_connections, transaction)
+
+from paypal import journal
+
+logger = logging.getLogger('paypal.audit')
+
+# Express methods and Payflow TRXTYPEs that move money.  Their rows are
+# always stored in full, whatever the persistence policy.
+MONEY_MOVING_METHODS = (
+    'DoExpressCheckoutPayment', 'DoCapture', 'DoVoid', 'RefundTransaction',
+    'S', 'C', 'A', 'D', 'V')
+
+# Calls that are always saved synchronously, as their rows are looked up
+# later by the facades.
+DEFAULT_SYNC_METHODS = MONEY_MOVING_METHODS
+
+# Persistence policies: store the row with its raw request and response,
+# store it without them, or don't store it.  'sample:<rate>' stores a
+# proportion of rows in full and drops the rest.
+FULL, SLIM, NONE = 'full', 'slim', 'none'
+
+# Write-behind defaults: the number of waiting rows that triggers a flush,
+# the maximum number of seconds a row waits, and the number of rows kept
+# while the database is unavailable before the oldest are dropped.
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BUFFER = 10000
+
+
+class BufferedWriter(object):
+    """
+    Buffers unsaved model instances and writes them in bulk from a
+    background thread.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE,
+                 interval=DEFAULT_FLUSH_INTERVAL,
+                 max_buffer=DEFAULT_MAX_BUFFER):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.buffer = collections.deque()
+        self.thread = None
+        self.pid = None
+        self.stopped = False
+
+    def write(self, instance):
+        """
+        Queue an unsaved instance to be written
+        """
+        # bulk_create doesn't call save(), which masks sensitive data
+        instance.hide_sensitive_data()
+        with self.condition:
+            self._ensure_thread()
+            self.buffer.append(instance)
+            if len(self.buffer) > self.max_buffer:
+                self.buffer.popleft()
+                logger.error("PayPal audit buffer is full, dropping a row")
+            if len(self.buffer) >= self.batch_size:
+                self.condition.notify()
+
+    def flush(self):
+        """
+        Write all the buffered instances.  Return the number written.
+        """
+        with self.flush_lock:
+            with self.condition:
+                instances = list(self.buffer)
+                self.buffer.clear()
+            if not instances:
+                return 0
+            batches = collections.OrderedDict()
+            for instance in instances:
+                batches.setdefault(type(instance), []).append(instance)
+            written = 0
+            for model, batch in batches.items():
+                try:
+                    written += self._write(model, batch)
+                except Exception:
+                    logger.exception("Unable to write %d PayPal audit rows",
+                                     len(batch))
+                    # Keep the rows to try again on the next flush
+                    with self.condition:
+                        self.buffer.extendleft(reversed(batch))
+            return written
+
+    def _write(self, model, batch):
+        batch_size = getattr(settings, 'PAYPAL_BATCH_SIZE', 500)
+        # The journal's ingester may already have saved journalled rows
+        # that were waiting here, as may an earlier flush that failed
+        batch = _unsaved(model, batch, batch_size)
+        using = model._default_manager.db
+        try:
+            # Atomic, so that a failed flush hasn't saved some of the chunks
+            with transaction.atomic(using=using):
+                model._default_manager.bulk_create(
+                    batch, batch_size=batch_size)
+            return len(batch)
+        except IntegrityError:
+            logger.warning("Unable to write %d PayPal audit rows in bulk, "
+                           "writing them one at a time", len(batch))
+        # A row was saved after the check, or can never be.  Either way
+        # keeping it would block the rest of the buffer.
+        written = 0
+        for instance in batch:
+            try:
+                with transaction.atomic(using=using):
+                    model._default_manager.bulk_create([instance])
+            except IntegrityError:
+                logger.exception("Dropping PayPal audit row %s",
+                                 instance.journal_id)
+            else:
+                written += 1
+        return written
+
+    def stop(self):
+        """
+        Stop the background thread and write any buffered instances
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join(self.interval + 5)
+        self.flush()
+
+    def _ensure_thread(self):
+        # A forked worker inherits the buffer but not the thread
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.buffer.clear()
+            self.stopped = False
+            self.thread = threading.Thread(
+                target=self._run, name='paypal-audit-writer')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.stopped and len(self.buffer) < self.batch_size:
+                    self.condition.wait(self.interval)
+                stopped = self.stopped
+            if stopped:
+                return
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def _unsaved(model, instances, batch_size):
+    """
+    Return the instances whose journal ID isn't already saved
+    """
+    journal_ids = [instance.journal_id for instance in instances
+                   if instance.journal_id is not None]
+    existing = set()
+    for i in range(0, len(journal_ids), batch_size):
+        existing.update(model._default_manager.filter(
+            journal_id__in=journal_ids[i:i + batch_size]
+        ).values_list('journal_id', flat=True))
+    return [instance for instance in instances
+            if instance.journal_id is None or
+            instance.journal_id not in existing]
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Return the process-wide writer, creating it if needed
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = BufferedWriter(
+                    batch_size=getattr(settings, 'PAYPAL_AUDIT_BATCH_SIZE',
+                                       DEFAULT_BATCH_SIZE),
+                    interval=getattr(settings, 'PAYPAL_AUDIT_FLUSH_INTERVAL',
+                                     DEFAULT_FLUSH_INTERVAL),
+                    max_buffer=getattr(settings, 'PAYPAL_AUDIT_MAX_BUFFER',
+                                       DEFAULT_MAX_BUFFER))
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def get_policy(method, successful):
+    """
+    Return how to store the row for a call: ``FULL``, ``SLIM`` or ``NONE``.
+
+    Failed calls and calls that move money are always stored in full.
+    Otherwise the ``PAYPAL_AUDIT_POLICY`` setting, a dict of Express method
+    or Payflow TRXTYPE (or ``'default'``) to policy, is used.
+    """
+    if not successful or method in MONEY_MOVING_METHODS:
+        return FULL
+    policies = getattr(settings, 'PAYPAL_AUDIT_POLICY', {})
+    policy = policies.get(method, policies.get('default', FULL))
+    if policy.startswith('sample:'):
+        rate = float(policy[len('sample:'):])
+        return FULL if random.random() < rate else NONE
+    if policy not in (FULL, SLIM, NONE):
+        raise ImproperlyConfigured(
+            "Unknown PayPal audit policy '%s'" % policy)
+    return policy
+
+
+def _slim_copy(txn):
+    """
+    Return an unsaved copy of the transaction without the raw request and
+    response.  The passed transaction is left as it is, as callers read the
+    response from it.
+    """
+    fields = dict((field.attname, getattr(txn, field.attname))
+                  for field in txn._meta.concrete_fields)
+    fields.update(raw_request='', raw_response='')
+    return type(txn)(**fields)
+
+
+def save(txn, method, successful=True):
+    """
+    Store a transaction row according to the persistence policy, either now
+    or in the background.  If journalling is enabled, the row is journalled
+    first and a database error is logged rather than raised, as the row will
+    be saved when the journal is ingested.
+
+    :txn: Unsaved transaction instance
+    :method: The Express method or Payflow TRXTYPE of the call
+    :successful: Whether the call succeeded
+    """
+    policy = get_policy(method, successful)
+    if policy == NONE:
+        return
+    if policy == SLIM:
+        txn = _slim_copy(txn)
+    journal.record(txn)
+    sync_methods = getattr(settings, 'PAYPAL_AUDIT_SYNC_METHODS',
+                           DEFAULT_SYNC_METHODS)
+    if (getattr(settings, 'PAYPAL_AUDIT_WRITE_BEHIND', False) and
+            method not in sync_methods):
+        get_writer().write(txn)
+        return
+    try:
+        # In a savepoint, so that a failure doesn't abort the transaction of
+        # the request that made the call
+        with transaction.atomic(using=type(txn)._default_manager.db):
+            txn.save()
+    except DatabaseError:
+        if txn.journal_id is None:
+            raise
+        logger.exception("Unable to save journalled PayPal transaction %s",
+                         txn.journal_id)
+
+
+def save_many(model, calls):
+    """
+    Store transaction rows in bulk according to the persistence policy,
+    journalling them first if enabled.
+
+    :model: Transaction model
+    :calls: List of (txn, method, successful) tuples, as for ``save``
+    """
+    txns = []
+    for txn, method, successful in calls:
+        policy = get_policy(method, successful)
+        if policy == NONE:
+            continue
+        if policy == SLIM:
+            txn = _slim_copy(txn)
+        txn.hide_sensitive_data()
+        txns.append(txn)
+    journal.record(*txns)
+    try:
+        with transaction.atomic(using=model._default_manager.db):
+            model.objects.bulk_create(
+                txns, batch_size=getattr(settings, 'PAYPAL_BATCH_SIZE', 500))
+    except DatabaseError:
+        if not txns or txns[0].journal_id is None:
+            raise
+        logger.exception("Unable to save %d journalled PayPal transactions",
+                         len(txns))
+
+
+def flush():
+    """
+    Write any buffered rows, so that they can be read back
+    """
+    if _writer is not None:
+        _writer.flush()
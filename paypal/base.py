@@ -1,53 +1,131 @@
 from __future__ import unicode_literals
-from django.utils.six.moves.urllib.parse import parse_qs
 from django.utils.translation import ugettext_lazy as _
-from django.utils.encoding import force_text
 
 from django.db import models
+from django.utils import timezone
+
+from paypal import nvp
+from paypal.compression import CompressedTextField
+
+
+# Large fields that are only read when a transaction is shown in full
+PAYLOAD_FIELDS = ('raw_request', 'raw_response')
+
+
+class ResponseQuerySet(models.query.QuerySet):
+
+    def with_payloads(self):
+        """
+        Also load the raw request and response, which are deferred by
+        default.
+        """
+        return self.defer(None)
+
+
+class ResponseManager(models.Manager):
+    """
+    Manager that leaves out the raw request and response, so that lists and
+    lookups only read the narrow columns.  Use ``with_payloads()`` when the
+    raw data is needed.
+    """
+
+    def get_queryset(self):
+        return ResponseQuerySet(self.model, using=self._db).defer(
+            *PAYLOAD_FIELDS)
+
+    def with_payloads(self):
+        return self.get_queryset().with_payloads()
 
 
 class ResponseModel(models.Model):
 
-    # Debug information
-    raw_request = models.TextField(max_length=512)
-    raw_response = models.TextField(max_length=512)
+    # Debug information, stored compressed
+    raw_request = CompressedTextField(max_length=512)
+    raw_response = CompressedTextField(max_length=512)
 
     response_time = models.FloatField(help_text=_("Response time in milliseconds"))
 
-    date_created = models.DateTimeField(auto_now_add=True)
+    # Breakdown of the response time by phase (see paypal.timing).  The
+    # connect and TLS times are only set when a new connection was made.
+    pool_wait_time = models.FloatField(
+        null=True, blank=True,
+        help_text=_("Time waiting for a connection in milliseconds"))
+    connect_time = models.FloatField(
+        null=True, blank=True, help_text=_("Connect time in milliseconds"))
+    tls_time = models.FloatField(
+        null=True, blank=True,
+        help_text=_("TLS handshake time in milliseconds"))
+    first_byte_time = models.FloatField(
+        null=True, blank=True,
+        help_text=_("Time to first byte in milliseconds"))
+    read_time = models.FloatField(
+        null=True, blank=True,
+        help_text=_("Response read time in milliseconds"))
+    decode_time = models.FloatField(
+        null=True, blank=True,
+        help_text=_("Response decode time in milliseconds"))
+
+    # Set for rows written to the journal, so that they're only ingested once
+    # (see paypal.journal)
+    journal_id = models.CharField(max_length=32, unique=True, null=True,
+                                  blank=True, editable=False)
+
+    # Not auto_now_add, so rows written in bulk later (see paypal.audit) keep
+    # the time of the call
+    date_created = models.DateTimeField(default=timezone.now, editable=False,
+                                        db_index=True)
+
+    objects = ResponseManager()
 
     class Meta:
         abstract = True
         ordering = ('-date_created',)
         app_label = 'paypal'
 
+    def record_timings(self, timings):
+        """
+        Set the phase timing fields from a dict of phases to milliseconds
+        """
+        for phase, elapsed in timings.items():
+            setattr(self, '%s_time' % phase, elapsed)
+
     def request(self):
-        request_params = parse_qs(self.raw_request)
-        return self._as_dl(request_params)
+        return self._as_dl(nvp.decode(self.raw_request))
     request.allow_tags = True
 
     def response(self):
-        return self._as_dl(self.context)
+        return self._as_dl(self.pairs)
     response.allow_tags = True
 
     def _as_table(self, params):
         rows = []
         for k, v in sorted(params.items()):
-            rows.append('<tbody><tr><th>%s</th><td>%s</td></tr></tbody>' % (k, v[0]))
+            rows.append('<tbody><tr><th>%s</th><td>%s</td></tr></tbody>' % (k, v))
         return '<table>%s</table>' % ''.join(rows)
 
     def _as_dl(self, params):
         rows = []
         for k, v in sorted(params.items()):
-            rows.append('<dt>%s</dt><dd>%s</dd>' % (k, v[0]))
+            rows.append('<dt>%s</dt><dd>%s</dd>' % (k, v))
         return '<dl>%s</dl>' % ''.join(rows)
 
+    @property
+    def pairs(self):
+        """
+        Dict of the name-value pairs in the response.  The response is only
+        parsed again if it changes.
+        """
+        raw_response = self.raw_response
+        cached = self.__dict__.get('_pairs')
+        if cached is None or cached[0] is not raw_response:
+            cached = self.__dict__['_pairs'] = (
+                raw_response, nvp.decode(raw_response))
+        return cached[1]
+
     @property
     def context(self):
-        return parse_qs(self.raw_response)
+        # Each value is wrapped in a list, as returned by parse_qs
+        return dict((k, [v]) for k, v in self.pairs.items())
 
     def value(self, key, default=None):
-        ctx = self.context
-        #return ctx[key][0] if key in ctx else default
-        #return ctx[key][0].decode('utf8') if key in ctx else None
-        return force_text(ctx[key][0]) if key in ctx else default
+        return self.pairs.get(key, default)
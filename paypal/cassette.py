@@ -0,0 +1,228 @@
+"""
+Recording and replaying of gateway calls.
+
+In record mode, ``CassetteTransport`` sends calls on to a real transport and
+appends each request and response to a cassette file, with credentials and
+card details redacted.  In replay mode it answers calls from the cassette
+without any network access, waiting for the recorded latency (optionally
+scaled) so that benchmarks see realistic timings.
+
+A cassette is a file of JSON lines, one per call, gzipped if its name ends in
+``.gz``.  When it is loaded, calls are indexed by their API method and
+parameters so that each lookup is a dict access.
+"""
+from __future__ import unicode_literals
+from contextlib import contextmanager
+import collections
+import gzip
+import io
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from paypal import exceptions, gateway, nvp, transport
+
+# Parameters whose values are never written to a cassette
+REDACTED_PARAMS = ('USER', 'PWD', 'SIGNATURE', 'VENDOR', 'PARTNER', 'SUBJECT',
+                   'ACCT', 'CVV2', 'EXPDATE', 'SWIPE')
+
+# Parameters that vary between runs (eg URLs containing a basket ID) and so
+# are ignored when matching a call to a recording
+DEFAULT_MATCH_IGNORE = ('RETURNURL', 'CANCELURL', 'CALLBACK', 'INVNUM',
+                        'CUSTOM', 'NOTIFYURL', 'PAYMENTREQUEST_0_INVNUM',
+                        'PAYMENTREQUEST_0_CUSTOM',
+                        'PAYMENTREQUEST_0_NOTIFYURL')
+
+RECORD, REPLAY = 'record', 'replay'
+
+
+def redact(body):
+    """
+    Return the request or response body with sensitive values replaced
+    """
+    params = nvp.decode(body)
+    if not any(name in params for name in REDACTED_PARAMS):
+        return body
+    for name in REDACTED_PARAMS:
+        if name in params:
+            params[name] = 'X' * len(params[name])
+    return nvp.encode(sorted(params.items()), 'TRXTYPE' in params)
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return io.open(path, mode)
+
+
+class Cassette(object):
+    """
+    A set of recorded calls, stored in a file.
+
+    :path: Path of the cassette file
+    :match: ``'params'`` to match calls on their API method and parameters,
+            or ``'method'`` to replay the calls to each method in the order
+            they were recorded, whatever their parameters.
+    :ignore: Parameters to ignore when matching on parameters
+    """
+
+    def __init__(self, path, match='params', ignore=DEFAULT_MATCH_IGNORE):
+        if match not in ('params', 'method'):
+            raise ValueError("Unknown match type '%s'" % match)
+        self.path = path
+        self.match = match
+        self.ignore = frozenset(ignore)
+        self.lock = threading.Lock()
+        self._index = None
+
+    def key(self, url, body):
+        """
+        Return the key that a call is recorded and looked up under
+        """
+        params = nvp.decode(body)
+        method = gateway.api_method(params)
+        if self.match == 'method':
+            return '%s %s' % (url, method)
+        for name in REDACTED_PARAMS:
+            params.pop(name, None)
+        params = '&'.join('%s=%s' % item for item in sorted(params.items())
+                          if item[0] not in self.ignore)
+        return '%s %s %s' % (url, method, params)
+
+    def load(self):
+        """
+        Read the cassette into a dict of key to a list of recordings, in the
+        order they were made.
+        """
+        index = collections.defaultdict(collections.deque)
+        try:
+            with _open(self.path, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line.decode('utf-8'))
+                        key = self.key(entry['url'],
+                                       entry['request'].encode('utf-8'))
+                        index[key].append(entry)
+        except IOError as e:
+            raise ImproperlyConfigured(
+                "Unable to read PayPal cassette '%s': %s" % (self.path, e))
+        return index
+
+    def find(self, url, body):
+        """
+        Return the next recording for the call, or None if there isn't one.
+        Once the recordings for a call are used up, the last is repeated.
+        """
+        with self.lock:
+            if self._index is None:
+                self._index = self.load()
+            entries = self._index.get(self.key(url, body))
+            if not entries:
+                return None
+            if len(entries) > 1:
+                return entries.popleft()
+            return entries[0]
+
+    def append(self, url, body, status_code, content, response_time,
+               timings):
+        """
+        Add a call to the cassette
+        """
+        entry = {
+            'url': url,
+            'request': redact(body).decode('utf-8'),
+            'status': status_code,
+            'response': redact(content).decode('utf-8'),
+            'ms': round(response_time, 1),
+            'timings': dict((phase, round(ms, 1))
+                            for phase, ms in timings.items()),
+        }
+        line = json.dumps(entry, sort_keys=True, separators=(',', ':'))
+        with self.lock:
+            with _open(self.path, 'ab') as f:
+                f.write(line.encode('utf-8') + b'\n')
+
+
+class CassetteTransport(transport.Transport):
+    """
+    Transport that records calls to, or replays them from, a cassette.
+
+    Without arguments (ie when used as ``PAYPAL_TRANSPORT``) it is
+    configured by the ``PAYPAL_CASSETTE``, ``PAYPAL_CASSETTE_MODE``,
+    ``PAYPAL_CASSETTE_MATCH``, ``PAYPAL_CASSETTE_LATENCY`` and
+    ``PAYPAL_CASSETTE_TRANSPORT`` settings.
+
+    :cassette: ``Cassette`` to use
+    :mode: ``'record'`` or ``'replay'``
+    :latency: Factor that recorded latencies are scaled by when replaying,
+              so ``0`` replays calls without waiting.
+    :recorder: Transport that calls are sent through when recording
+    """
+
+    def __init__(self, cassette=None, mode=None, latency=None, recorder=None):
+        if cassette is None:
+            path = getattr(settings, 'PAYPAL_CASSETTE', None)
+            if not path:
+                raise ImproperlyConfigured(
+                    "PAYPAL_CASSETTE must be set to use a cassette")
+            cassette = Cassette(
+                path, match=getattr(settings, 'PAYPAL_CASSETTE_MATCH',
+                                    'params'))
+        if mode is None:
+            mode = getattr(settings, 'PAYPAL_CASSETTE_MODE', REPLAY)
+        if mode not in (RECORD, REPLAY):
+            raise ImproperlyConfigured(
+                "Unknown PayPal cassette mode '%s'" % mode)
+        if latency is None:
+            latency = getattr(settings, 'PAYPAL_CASSETTE_LATENCY', 1.0)
+        if recorder is None and mode == RECORD:
+            recorder = gateway.load_transport(getattr(
+                settings, 'PAYPAL_CASSETTE_TRANSPORT',
+                gateway.DEFAULT_TRANSPORT))
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency
+        self.recorder = recorder
+
+    def post(self, url, body, headers, timeout, timings):
+        if self.mode == RECORD:
+            start_time = time.time()
+            status_code, content = self.recorder.post(
+                url, body, headers, timeout, timings)
+            self.cassette.append(url, body, status_code, content,
+                                 (time.time() - start_time) * 1000.0, timings)
+            return status_code, content
+
+        entry = self.cassette.find(url, body)
+        if entry is None:
+            # Not a TransportError, as that would count against the breaker
+            # and be retried
+            raise exceptions.PayPalError(
+                "No recorded response in %s for %s" % (
+                    self.cassette.path, gateway.api_method(nvp.decode(body))))
+        if self.latency:
+            time.sleep(entry['ms'] * self.latency / 1000.0)
+        for phase, ms in entry.get('timings', {}).items():
+            timings[phase] = ms * self.latency
+        return entry['status'], entry['response'].encode('utf-8')
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+@contextmanager
+def use_cassette(path, mode=REPLAY, latency=1.0, match='params'):
+    """
+    Record or replay the gateway calls made within the block::
+
+        with cassette.use_cassette('checkout.jsonl.gz', mode='record'):
+            ...
+    """
+    transport = CassetteTransport(Cassette(path, match=match), mode,
+                                  latency)
+    with gateway.use_transport(transport):
+        yield transport.cassette
@@ -0,0 +1,153 @@
+"""
+Compression of stored request and response payloads.
+
+NVP payloads are short and repetitive, so they compress poorly on their own
+but very well with a preset dictionary of the names and values that appear
+in most Express and Payflow calls.  Compressed values are stored as text,
+base64 encoded behind a prefix that identifies the dictionary, so
+uncompressed rows and rows compressed with an older dictionary can still be
+read.
+"""
+from __future__ import unicode_literals
+import base64
+import logging
+import zlib
+
+from django.conf import settings
+from django.db import models
+from django.utils import six
+
+logger = logging.getLogger('paypal.compression')
+
+# Names and values common to Express and Payflow payloads.  zlib favours
+# matches near the end of the dictionary so the most common are last.
+DICTIONARY = (
+    b'SHIPTOCOUNTRYNAME=United Kingdom&SHIPTOCOUNTRYNAME=United States&'
+    b'ADDRESSSTATUS=Confirmed&PAYERSTATUS=verified&PAYERSTATUS=unverified&'
+    b'CHECKOUTSTATUS=PaymentActionNotInitiated&'
+    b'CHECKOUTSTATUS=PaymentActionCompleted&'
+    b'PAYMENTINFO_0_TRANSACTIONTYPE=expresscheckout&'
+    b'PAYMENTINFO_0_PAYMENTTYPE=instant&PAYMENTINFO_0_ORDERTIME=&'
+    b'PAYMENTINFO_0_PENDINGREASON=None&PAYMENTINFO_0_REASONCODE=None&'
+    b'PAYMENTINFO_0_PROTECTIONELIGIBILITY=Eligible&'
+    b'PAYMENTINFO_0_PROTECTIONELIGIBILITYTYPE=ItemNotReceivedEligible,'
+    b'UnauthorizedPaymentEligible&PAYMENTINFO_0_SECUREMERCHANTACCOUNTID=&'
+    b'PAYMENTINFO_0_ERRORCODE=0&PAYMENTINFO_0_ACK=Success&'
+    b'PAYMENTINFO_0_PAYMENTSTATUS=Completed&PAYMENTINFO_0_PAYMENTSTATUS='
+    b'Pending&PAYMENTINFO_0_TRANSACTIONID=&PAYMENTINFO_0_FEEAMT=&'
+    b'PAYMENTINFO_0_TAXAMT=0.00&PAYMENTINFO_0_CURRENCYCODE=GBP&'
+    b'PAYMENTINFO_0_AMT=&L_ERRORCODE0=&L_SHORTMESSAGE0=&L_LONGMESSAGE0=&'
+    b'L_SEVERITYCODE0=Error&L_SEVERITYCODE0=Warning&'
+    b'L_PAYMENTREQUEST_0_NAME0=&L_PAYMENTREQUEST_0_NUMBER0=&'
+    b'L_PAYMENTREQUEST_0_DESC0=&L_PAYMENTREQUEST_0_AMT0=&'
+    b'L_PAYMENTREQUEST_0_QTY0=1&L_SHIPPINGOPTIONISDEFAULT0=true&'
+    b'L_SHIPPINGOPTIONNAME0=&L_SHIPPINGOPTIONAMOUNT0=&'
+    b'L_SHIPPINGOPTIONISDEFAULT1=false&'
+    b'PAYMENTREQUEST_0_SHIPTONAME=&PAYMENTREQUEST_0_SHIPTOSTREET=&'
+    b'PAYMENTREQUEST_0_SHIPTOSTREET2=&PAYMENTREQUEST_0_SHIPTOCITY=&'
+    b'PAYMENTREQUEST_0_SHIPTOSTATE=&PAYMENTREQUEST_0_SHIPTOZIP=&'
+    b'PAYMENTREQUEST_0_SHIPTOCOUNTRYCODE=GB&'
+    b'PAYMENTREQUEST_0_SHIPTOCOUNTRYNAME=United Kingdom&'
+    b'PAYMENTREQUEST_0_ADDRESSSTATUS=Confirmed&'
+    b'PAYMENTREQUEST_0_ITEMAMT=&PAYMENTREQUEST_0_SHIPPINGAMT=&'
+    b'PAYMENTREQUEST_0_HANDLINGAMT=0.00&PAYMENTREQUEST_0_TAXAMT=0.00&'
+    b'PAYMENTREQUEST_0_INSURANCEAMT=0.00&PAYMENTREQUEST_0_SHIPDISCAMT=0.00&'
+    b'PAYMENTREQUEST_0_MAXAMT=&PAYMENTREQUEST_0_CURRENCYCODE=GBP&'
+    b'PAYMENTREQUEST_0_PAYMENTACTION=Sale&'
+    b'PAYMENTREQUEST_0_PAYMENTACTION=Authorization&'
+    b'PAYMENTREQUEST_0_INSURANCEOPTIONOFFERED=false&'
+    b'PAYMENTREQUEST_0_AMT=&PAYMENTREQUESTINFO_0_ERRORCODE=0&'
+    b'SHIPPINGCALCULATIONMODE=&INSURANCEOPTIONSELECTED=false&'
+    b'SHIPPINGOPTIONISDEFAULT=true&SHIPPINGOPTIONNAME=&SHIPPINGOPTIONAMOUNT=&'
+    b'SHIPTONAME=&SHIPTOSTREET=&SHIPTOCITY=&SHIPTOSTATE=&SHIPTOZIP=&'
+    b'SHIPTOCOUNTRYCODE=GB&COUNTRYCODE=GB&FIRSTNAME=&LASTNAME=&EMAIL=&'
+    b'PAYERID=&CURRENCYCODE=GBP&SHIPPINGAMT=0.00&HANDLINGAMT=0.00&'
+    b'TAXAMT=0.00&INSURANCEAMT=0.00&SHIPDISCAMT=0.00&ITEMAMT=&MAXAMT=&AMT=&'
+    b'RETURNURL=https%3A%2F%2F&CANCELURL=https%3A%2F%2F&CALLBACK=https%3A'
+    b'%2F%2F&CALLBACKTIMEOUT=3&ALLOWNOTE=1&REQCONFIRMSHIPPING=0&'
+    b'NOSHIPPING=1&ADDROVERRIDE=1&LOCALECODE=GB&'
+    b'RESULT=0&RESPMSG=Approved&PNREF=&PPREF=&AUTHCODE=&AVSADDR=Y&AVSZIP=Y&'
+    b'CVV2MATCH=Y&IAVS=N&PROCAVS=&PROCCVV2=M&TRXTYPE=S&TRXTYPE=A&TENDER=C&'
+    b'ACCT=XXXXXXXXXXXX&EXPDATE=&CVV2=XXX&ORIGID=&COMMENT1=&CURRENCY=GBP&'
+    b'PARTNER=PayPal&VENDOR=&USER=&PWD=XXXXXX&SIGNATURE=&'
+    b'METHOD=SetExpressCheckout&METHOD=GetExpressCheckoutDetails&'
+    b'METHOD=DoExpressCheckoutPayment&VERSION=119.0&BUILD=&'
+    b'TIMESTAMP=20&CORRELATIONID=&ACK=Success&TOKEN=EC-'
+)
+
+# Prefix of values compressed with the dictionary, and of those compressed
+# without it (by Pythons whose zlib doesn't support preset dictionaries).
+PREFIX = 'z1:'
+PLAIN_PREFIX = 'z0:'
+
+# Whether this Python's zlib supports preset dictionaries (3.3+)
+try:
+    zlib.compressobj(zdict=DICTIONARY)
+except TypeError:
+    HAS_ZDICT = False
+else:
+    HAS_ZDICT = True
+
+
+def compress(text):
+    """
+    Return the compressed form of a payload, or the payload itself if
+    compressing doesn't make it smaller.
+    """
+    if not text or text.startswith((PREFIX, PLAIN_PREFIX)):
+        return text
+    data = text.encode('utf-8')
+    if HAS_ZDICT:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9,
+                                      zlib.Z_DEFAULT_STRATEGY, DICTIONARY)
+        prefix = PREFIX
+    else:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+        prefix = PLAIN_PREFIX
+    compressed = prefix + base64.b64encode(
+        compressor.compress(data) + compressor.flush()).decode('ascii')
+    return compressed if len(compressed) < len(text) else text
+
+
+def decompress(value):
+    """
+    Return the payload for a stored value, which may or may not be
+    compressed.  Values compressed with the dictionary can't be read without
+    Python 3.3+, and are returned as they are (so that saving them again
+    leaves them intact).
+    """
+    if not value:
+        return value
+    if value.startswith(PREFIX):
+        if not HAS_ZDICT:
+            logger.warning("Unable to decompress a PayPal payload, which "
+                           "needs Python 3.3+")
+            return value
+        decompressor = zlib.decompressobj(-15, zdict=DICTIONARY)
+    elif value.startswith(PLAIN_PREFIX):
+        decompressor = zlib.decompressobj(-15)
+    else:
+        return value
+    data = base64.b64decode(value[len(PREFIX):].encode('ascii'))
+    return (decompressor.decompress(data) +
+            decompressor.flush()).decode('utf-8')
+
+
+class CompressedTextField(six.with_metaclass(models.SubfieldBase,
+                                             models.TextField)):
+    """
+    Text field that is stored compressed when ``PAYPAL_COMPRESS_PAYLOADS``
+    is on (the default).  Values are always read back uncompressed, whether
+    or not they were stored compressed.
+    """
+
+    def to_python(self, value):
+        if isinstance(value, six.string_types):
+            return decompress(value)
+        return value
+
+    def get_prep_value(self, value):
+        value = super(CompressedTextField, self).get_prep_value(value)
+        if getattr(settings, 'PAYPAL_COMPRESS_PAYLOADS', True):
+            return compress(value)
+        return value
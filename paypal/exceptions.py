@@ -9,5 +9,14 @@ class PayPalError(PaymentError):
     pass
 
 
-class PayPalError(PaymentError):
-    pass
+class CircuitOpenError(PayPalError):
+    """
+    For when calls to a PayPal endpoint are being short-circuited because
+    it has been failing.
+    """
+
+
+class TransportError(PayPalError):
+    """
+    For when a transport can't communicate with PayPal.
+    """
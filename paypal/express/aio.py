@@ -0,0 +1,66 @@
+"""
+Asynchronous versions of the Express gateway functions.
+
+Each function takes the same arguments as its counterpart in
+``paypal.express.gateway``.  Transactions are recorded in a worker thread as
+the ORM is synchronous.
+"""
+from paypal import aio
+from paypal.express import gateway
+from paypal.express.gateway import (
+    SET_EXPRESS_CHECKOUT, GET_EXPRESS_CHECKOUT, DO_EXPRESS_CHECKOUT,
+    DO_CAPTURE, DO_VOID, REFUND_TRANSACTION, SALE)
+
+
+async def _fetch_response(method, extra_params):
+    """
+    Fetch the response from PayPal and return a transaction object
+    """
+    url, params = gateway._build_request(method, extra_params)
+    response = await aio.async_retry(
+        lambda: aio.async_post(url, params),
+        idempotent=method in gateway.IDEMPOTENT_METHODS,
+        should_retry=gateway._is_retryable)
+    return await aio.run_sync(gateway._record_response, method, params,
+                              response)
+
+
+async def set_txn(basket, shipping_methods, currency, return_url, cancel_url,
+                  **kwargs):
+    """
+    Register the transaction with PayPal and return the URL to redirect the
+    customer to.
+    """
+    # Building the parameters reads the basket and shipping methods, which
+    # can hit the database.
+    params = await aio.run_sync(
+        gateway._set_txn_params, basket, shipping_methods, currency,
+        return_url, cancel_url, **kwargs)
+    txn = await _fetch_response(SET_EXPRESS_CHECKOUT, params)
+    return gateway._express_checkout_url(txn.token)
+
+
+async def get_txn(token):
+    return await _fetch_response(GET_EXPRESS_CHECKOUT, {'TOKEN': token})
+
+
+async def do_txn(payer_id, token, amount, currency, action=SALE):
+    return await _fetch_response(DO_EXPRESS_CHECKOUT, gateway._do_txn_params(
+        payer_id, token, amount, currency, action))
+
+
+async def do_capture(txn_id, amount, currency, complete_type='Complete',
+                     note=None):
+    return await _fetch_response(DO_CAPTURE, gateway._do_capture_params(
+        txn_id, amount, currency, complete_type, note))
+
+
+async def do_void(txn_id, note=None):
+    return await _fetch_response(DO_VOID, gateway._do_void_params(
+        txn_id, note))
+
+
+async def refund_txn(txn_id, is_partial=False, amount=None, currency=None):
+    return await _fetch_response(
+        REFUND_TRANSACTION, gateway._refund_txn_params(
+            txn_id, is_partial, amount, currency))
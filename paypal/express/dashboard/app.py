@@ -11,6 +11,7 @@ class ExpressDashboardApplication(Application):
     index_view = views.IndexView
     list_view = views.TransactionListView
     list_wo_order_view = views.TransactionWoOrderListView
+    archive_view = views.ArchivedTransactionListView
     detail_view = views.TransactionDetailView
 
     def get_urls(self):
@@ -22,6 +23,8 @@ class ExpressDashboardApplication(Application):
             url(r'^transactions_wo_order/$',
                 self.list_wo_order_view.as_view(),
                 name='paypal-express-transaction-wo-order-list'),
+            url(r'^transactions_archived/$', self.archive_view.as_view(),
+                name='paypal-express-transaction-archive'),
             url(r'^transactions/(?P<pk>\d+)/$', self.detail_view.as_view(),
                 name='paypal-express-detail'),
         )
@@ -0,0 +1,25 @@
+from django import forms
+from django.utils.translation import ugettext_lazy as _
+
+from paypal.search import TransactionSearchForm
+
+
+class ExpressTransactionSearchForm(TransactionSearchForm):
+    identifier_fields = (
+        ('token', 'token'),
+        ('correlation_id', 'correlation_id'),
+        ('payer_email', 'payer_email'),
+    )
+
+    token = forms.CharField(label=_("Token"), required=False)
+    correlation_id = forms.CharField(label=_("Correlation ID"),
+                                     required=False)
+    payer_email = forms.CharField(label=_("Payer email"), required=False)
+    error_code = forms.CharField(label=_("Error code"), required=False)
+
+    def filter(self, queryset):
+        queryset = super(ExpressTransactionSearchForm, self).filter(queryset)
+        if self.cleaned_data.get('error_code'):
+            queryset = queryset.filter(
+                error_code=self.cleaned_data['error_code'])
+        return queryset
@@ -2,34 +2,52 @@
 
 from django.views import generic
 from django.conf import settings
+from django.db import connection
 
 from oscar.core.loading import get_model
 
 from core.utils import cart_to_html, addrs_to_html
 
+from paypal import archive, pagination, search
+from paypal.express.dashboard import forms
 from paypal.express import models
 
 # PaymentSourceType = get_model("payment", "SourceType")
 # PaymentSource = get_model("payment", "Source")
 PaymentEventType = get_model("order", "PaymentEventType")
+PaymentEvent = get_model("order", "PaymentEvent")
+
+qn = connection.ops.quote_name
 
 
 class IndexView(generic.TemplateView):
     template_name = 'paypal/express/dashboard/index.html'
 
+    def get_context_data(self, **kwargs):
+        ctx = super(IndexView, self).get_context_data(**kwargs)
+        ctx['archive_enabled'] = archive.is_enabled()
+        return ctx
+
 
-class TransactionListView(generic.ListView):
+class TransactionListView(search.TransactionSearchMixin,
+                          pagination.KeysetPaginationMixin,
+                          generic.ListView):
     model = models.ExpressTransaction
     template_name = 'paypal/express/dashboard/transaction_list.html'
     context_object_name = 'transactions'
-    paginate_by = 50
+    search_form_class = forms.ExpressTransactionSearchForm
 
     def get_context_data(self, **kwargs):
-        # verknuepfe mit preauth data
+        # verknuepfe mit preauth data, nur fuer die Transaktionen dieser Seite
         ctx = super(TransactionListView, self).get_context_data(**kwargs)
+        tokens = set(txn.token for txn in ctx['transactions'] if txn.token)
         emails = {}
-        for pa in models.ExpressTransactionPreAuth.objects.all():
-            emails[pa.token] = pa.email if pa.email else pa.customer.email
+        for pa in models.ExpressTransactionPreAuth.objects.filter(
+                token__in=tokens).select_related('customer'):
+            if pa.email:
+                emails[pa.token] = pa.email
+            elif pa.customer is not None:
+                emails[pa.token] = pa.customer.email
         ctx['emails'] = emails
         return ctx
 
@@ -58,10 +76,25 @@ class TransactionWoOrderListView(TransactionListView):
         # Aktion mit `Settled' kennzeichnet.  Deshalb filtern wir alle
         # PaymentEvents auf dessen ID (bzw. gehen dies im Code mit Back-
         # reference von der umgekehrten Seite an) ...
-        pet = PaymentEventType.objects.get(code="settled")
-        wo_orders = [p.reference for p in pet.paymentevent_set.all()]
-        q = models.ExpressTransaction.objects.exclude(
-           correlation_id__in=wo_orders)
+        #
+        # Die Events werden nicht mehr nach Python geladen, sondern per
+        # NOT EXISTS in der Datenbank ausgeschlossen.
+        q = super(TransactionWoOrderListView, self).get_queryset()
+        try:
+            pet = PaymentEventType.objects.get(code="settled")
+        except PaymentEventType.DoesNotExist:
+            pass
+        else:
+            event_meta = PaymentEvent._meta
+            q = q.extra(
+                where=["NOT EXISTS (SELECT 1 FROM %s WHERE %s = %%s "
+                       "AND %s = %s.%s)" % (
+                           qn(event_meta.db_table),
+                           qn(event_meta.get_field('event_type').column),
+                           qn(event_meta.get_field('reference').column),
+                           qn(models.ExpressTransaction._meta.db_table),
+                           qn('correlation_id'))],
+                params=[pet.pk])
 
         # Da kommen jetzt natürlich verdammt viele Ergebnisse rein, die
         # könnten wir verringern indem wir einfach alle mit SetExpressCheckout
@@ -70,11 +103,22 @@ class TransactionWoOrderListView(TransactionListView):
         return q.order_by("-date_created")
 
 
+class ArchivedTransactionListView(archive.ArchiveListMixin,
+                                  generic.ListView):
+    model = models.ExpressTransaction
+    template_name = 'paypal/express/dashboard/archived_transaction_list.html'
+    context_object_name = 'transactions'
+    paginate_by = 50
+
+
 class TransactionDetailView(generic.DetailView):
     model = models.ExpressTransaction
     template_name = 'paypal/express/dashboard/transaction_detail.html'
     context_object_name = 'txn'
 
+    def get_queryset(self):
+        return self.model.objects.with_payloads()
+
     def get_context_data(self, **kwargs):
         ctx = super(TransactionDetailView, self).get_context_data(**kwargs)
         ctx['show_form_buttons'] = getattr(
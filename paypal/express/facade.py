@@ -7,10 +7,14 @@ from django.contrib.sites.models import Site
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
+from paypal import audit
+from paypal.exceptions import PayPalError
 from paypal.express.models import ExpressTransaction as Transaction
 from paypal.express.gateway import (
     set_txn, get_txn, do_txn, SALE, AUTHORIZATION, ORDER,
-    do_capture, DO_EXPRESS_CHECKOUT, do_void, refund_txn
+    do_capture, DO_EXPRESS_CHECKOUT, do_void, refund_txn, fetch_many,
+    DO_CAPTURE, DO_VOID, REFUND_TRANSACTION, _do_capture_params,
+    _do_void_params, _refund_txn_params
 )
 
 
@@ -101,27 +105,107 @@ def confirm_transaction(payer_id, token, amount, currency):
                   action=_get_payment_action())
 
 
+def _transaction_id(txn):
+    """
+    Return the PayPal transaction ID of a DoExpressCheckoutPayment
+    transaction.  Rows written before the ID was stored in its own column
+    read it from the (deferred) raw response.
+    """
+    return txn.transaction_id or txn.value('PAYMENTINFO_0_TRANSACTIONID')
+
+
 def refund_transaction(token, amount, currency, note=None):
-    txn = Transaction.objects.get(token=token,
-                                  method=DO_EXPRESS_CHECKOUT)
+    audit.flush()
+    txn = Transaction.objects.get(token=token, method=DO_EXPRESS_CHECKOUT)
     is_partial = amount < txn.amount
-    return refund_txn(txn.value('PAYMENTINFO_0_TRANSACTIONID'), is_partial, amount, currency)
+    return refund_txn(_transaction_id(txn), is_partial, amount, currency)
 
 
 def capture_authorization(token, note=None):
     """
     Capture a previous authorization.
     """
-    txn = Transaction.objects.get(token=token,
-                                  method=DO_EXPRESS_CHECKOUT)
-    return do_capture(txn.value('PAYMENTINFO_0_TRANSACTIONID'),
-                      txn.amount, txn.currency, note=note)
+    audit.flush()
+    txn = Transaction.objects.get(token=token, method=DO_EXPRESS_CHECKOUT)
+    return do_capture(_transaction_id(txn), txn.amount, txn.currency,
+                      note=note)
 
 
 def void_authorization(token, note=None):
     """
     Void a previous authorization.
     """
-    txn = Transaction.objects.get(token=token,
-                                  method=DO_EXPRESS_CHECKOUT)
-    return do_void(txn.value('PAYMENTINFO_0_TRANSACTIONID'), note=note)
+    audit.flush()
+    txn = Transaction.objects.get(token=token, method=DO_EXPRESS_CHECKOUT)
+    return do_void(_transaction_id(txn), note=note)
+
+
+def _get_transactions(tokens):
+    """
+    Return a dict of the DoExpressCheckoutPayment transactions for the passed
+    tokens, looked up in chunks to keep the IN clauses a sensible size.
+    """
+    audit.flush()
+    txns = {}
+    tokens = list(tokens)
+    chunk_size = getattr(settings, 'PAYPAL_BATCH_SIZE', 500)
+    for i in range(0, len(tokens), chunk_size):
+        for txn in Transaction.objects.filter(
+                token__in=tokens[i:i + chunk_size],
+                method=DO_EXPRESS_CHECKOUT):
+            txns[txn.token] = txn
+    return txns
+
+
+def _batch(requests, build_call):
+    """
+    Make a call to PayPal for each request concurrently.  Each request is a
+    tuple of a token and any further arguments for build_call, which is
+    passed the token's DoExpressCheckoutPayment transaction followed by
+    them.  Requests whose token has no such transaction get a PayPalError
+    as their result.
+    """
+    txns = _get_transactions(set(request[0] for request in requests))
+    calls = [build_call(txns[request[0]], *request[1:])
+             for request in requests if request[0] in txns]
+    responses = iter(fetch_many(calls))
+    return [next(responses) if request[0] in txns else
+            PayPalError("No transaction found for token %s" % request[0])
+            for request in requests]
+
+
+def capture_authorizations(tokens, note=None):
+    """
+    Capture a batch of previous authorizations.
+
+    Return a list with a transaction or PayPalError for each token.
+    """
+    return _batch([(token,) for token in tokens],
+                  lambda txn: (DO_CAPTURE, _do_capture_params(
+                      _transaction_id(txn), txn.amount, txn.currency,
+                      note=note)))
+
+
+def void_authorizations(tokens, note=None):
+    """
+    Void a batch of previous authorizations.
+
+    Return a list with a transaction or PayPalError for each token.
+    """
+    return _batch([(token,) for token in tokens],
+                  lambda txn: (DO_VOID, _do_void_params(
+                      _transaction_id(txn), note=note)))
+
+
+def refund_transactions(refunds):
+    """
+    Refund a batch of transactions.  A token may appear more than once, eg
+    for several partial refunds.
+
+    Return a list with a transaction or PayPalError for each refund.
+
+    :refunds: List of (token, amount, currency) tuples
+    """
+    return _batch(list(refunds), lambda txn, amount, currency: (
+        REFUND_TRANSACTION, _refund_txn_params(
+            _transaction_id(txn), amount < txn.amount, amount, currency)))
@@ -1,4 +1,5 @@
 from __future__ import unicode_literals
+import functools
 import logging
 from decimal import Decimal as D
 
@@ -11,7 +12,7 @@ from django.template.defaultfilters import truncatewords, striptags
 from localflavor.us import us_states
 
 from . import models, exceptions as express_exceptions
-from paypal import gateway
+from paypal import audit, gateway
 from paypal import exceptions
 
 
@@ -25,6 +26,15 @@ REFUND_TRANSACTION = 'RefundTransaction'
 
 SALE, AUTHORIZATION, ORDER = 'Sale', 'Authorization', 'Order'
 
+# Methods that are safe to call again if a call fails.  Setting up a checkout
+# just creates a new token and fetching details has no side-effects, whereas
+# repeating the other methods could move money twice.
+IDEMPOTENT_METHODS = (SET_EXPRESS_CHECKOUT, GET_EXPRESS_CHECKOUT)
+
+# Error codes that indicate a temporary problem on PayPal's side (eg 10001 is
+# an internal error) - all others are treated as terminal.
+RETRYABLE_ERROR_CODES = ('10001', '10445')
+
 # The latest version of the PayPal Express API can be found here:
 # https://developer.paypal.com/docs/classic/release-notes/
 API_VERSION = getattr(settings, 'PAYPAL_API_VERSION', '119')
@@ -42,9 +52,19 @@ def _format_currency(amt):
     return amt.quantize(D('0.01'))
 
 
-def _fetch_response(method, extra_params):
+def _is_retryable(response):
+    if response.ack in (models.ExpressTransaction.SUCCESS,
+                        models.ExpressTransaction.SUCCESS_WITH_WARNING):
+        return False
+    codes = getattr(settings, 'PAYPAL_RETRYABLE_ERROR_CODES',
+                    RETRYABLE_ERROR_CODES)
+    errors = response.errors
+    return bool(errors) and errors[0]['code'] in codes
+
+
+def _build_request(method, extra_params):
     """
-    Fetch the response from PayPal and return a transaction object
+    Return the URL and the full set of parameters for a call to PayPal
     """
     # Build parameter string
     params = {
@@ -56,7 +76,9 @@ def _fetch_response(method, extra_params):
     }
     params.update(extra_params)
 
-    if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
+    if getattr(settings, 'PAYPAL_API_URL', None):
+        url = settings.PAYPAL_API_URL
+    elif getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
         url = 'https://api-3t.sandbox.paypal.com/nvp'
     else:
         url = 'https://api-3t.paypal.com/nvp'
@@ -65,30 +87,35 @@ def _fetch_response(method, extra_params):
     param_str = "\n".join(["%s: %s" % x for x in sorted(params.items())])
     logger.debug("Making %s request to %s with params:\n%s", method, url,
                  param_str)
+    return url, params
 
-    # Make HTTP request
-    pairs = gateway.post(url, params)
 
-    pairs_str = "\n".join(["%s: %s" % x for x in sorted(pairs.items())
-                           if not x[0].startswith('_')])
-    logger.debug("Response with params:\n%s", pairs_str)
+def _build_txn(method, params, response):
+    """
+    Return an unsaved transaction object for a response from PayPal
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        pairs_str = "\n".join(
+            ["%s: %s" % x for x in sorted(response.items())])
+        logger.debug("Response with params:\n%s", pairs_str)
 
     # Record transaction data - we save this model whether the txn
     # was successful or not
+    pairs = response.pairs
     txn = models.ExpressTransaction(
         method=method,
         version=API_VERSION,
-        ack=pairs['ACK'],
-        raw_request=pairs['_raw_request'],
-        raw_response=pairs['_raw_response'],
-        response_time=pairs['_response_time'],
+        ack=response['ACK'],
+        correlation_id=response.correlation_id,
+        raw_request=response.raw_request,
+        raw_response=response.raw_response,
+        response_time=response.response_time,
     )
     if txn.is_successful:
-        txn.correlation_id = pairs['CORRELATIONID']
         if method == SET_EXPRESS_CHECKOUT:
             txn.amount = params['PAYMENTREQUEST_0_AMT']
             txn.currency = params['PAYMENTREQUEST_0_CURRENCYCODE']
-            txn.token = pairs['TOKEN']
+            txn.token = response.token
         elif method == GET_EXPRESS_CHECKOUT:
             txn.token = params['TOKEN']
             txn.amount = D(pairs['PAYMENTREQUEST_0_AMT'])
@@ -98,33 +125,103 @@ def _fetch_response(method, extra_params):
             txn.amount = D(pairs['PAYMENTINFO_0_AMT'])
             txn.currency = pairs['PAYMENTINFO_0_CURRENCYCODE']
     else:
-        # There can be more than one error, each with its own number.
-        if 'L_ERRORCODE0' in pairs:
-            txn.error_code = pairs['L_ERRORCODE0']
-        if 'L_LONGMESSAGE0' in pairs:
-            txn.error_message = pairs['L_LONGMESSAGE0']
-        if 'TOKEN' in pairs:
-            txn.token = pairs['TOKEN']
-        elif 'TOKEN' in params:
-            txn.token = params['TOKEN']
-        if 'CORRELATIONID' in pairs:
-            txn.correlation_id = pairs['CORRELATIONID']
-    txn.save()
+        # There can be more than one error, each with its own number.  We
+        # record the first.
+        errors = response.errors
+        if errors:
+            txn.error_code = errors[0]['code']
+            txn.error_message = errors[0]['msg']
+        txn.token = response.token or params.get('TOKEN')
+    txn.promote_fields()
+    txn.record_timings(response.timings)
+    return txn
 
-    if not txn.is_successful:
-        msg = "Error %s - %s" % (txn.error_code, txn.error_message)
-        logger.error(msg)
-        err = {
-            'code': txn.error_code,
-            'token': txn.token,
-            'msg': txn.error_message,
-            'correlation_id': txn.correlation_id
-        }
-        raise exceptions.PayPalError(err)
 
+def _txn_error(txn):
+    """
+    Return the PayPalError for an unsuccessful transaction
+    """
+    msg = "Error %s - %s" % (txn.error_code, txn.error_message)
+    logger.error(msg)
+    err = {
+        'code': txn.error_code,
+        'token': txn.token,
+        'msg': txn.error_message,
+        'correlation_id': txn.correlation_id
+    }
+    return exceptions.PayPalError(err)
+
+
+def _record_response(method, params, response):
+    """
+    Record the response from PayPal and return a transaction object.  A
+    PayPalError is raised if the call was unsuccessful.
+    """
+    txn = _build_txn(method, params, response)
+    audit.save(txn, method, txn.is_successful)
+    if not txn.is_successful:
+        raise _txn_error(txn)
     return txn
 
 
+def _fetch_response(method, extra_params):
+    """
+    Fetch the response from PayPal and return a transaction object
+    """
+    url, params = _build_request(method, extra_params)
+
+    # Make HTTP request
+    response = gateway.retry(lambda: gateway.post(url, params),
+                             idempotent=method in IDEMPOTENT_METHODS,
+                             should_retry=_is_retryable)
+
+    return _record_response(method, params, response)
+
+
+def fetch_many(calls, max_workers=None):
+    """
+    Make many calls to PayPal concurrently, eg to capture or void a batch of
+    authorizations.
+
+    Return a list with a transaction object or PayPalError for each call, in
+    the same order as the calls.  The transactions are saved in bulk so they
+    won't have a primary key set on most databases.
+
+    :calls: List of (method, extra_params) tuples
+    :max_workers: The number of threads to use
+    """
+    requests = [(method,) + _build_request(method, extra_params)
+                for method, extra_params in calls]
+
+    def fetch(method, url, params):
+        return gateway.retry(lambda: gateway.post(url, params),
+                             idempotent=method in IDEMPOTENT_METHODS,
+                             should_retry=_is_retryable)
+    responses = gateway.run_many(
+        [functools.partial(fetch, *request) for request in requests],
+        max_workers)
+
+    results, rows = [], []
+    try:
+        for (method, url, params), response in zip(requests, responses):
+            if isinstance(response, exceptions.PayPalError):
+                results.append(response)
+                continue
+            try:
+                txn = _build_txn(method, params, response)
+            except Exception:
+                logger.exception("Invalid response to %s from PayPal", method)
+                results.append(exceptions.PayPalError(
+                    "Invalid response from PayPal"))
+                continue
+            rows.append((txn, method, txn.is_successful))
+            results.append(txn if txn.is_successful else _txn_error(txn))
+    finally:
+        # Calls that did go through are recorded whatever happens to the rest
+        audit.save_many(models.ExpressTransaction, rows)
+    return results
+
+
 def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_url=None,
             action=SALE, user=None, user_address=None, shipping_method=None,
             shipping_address=None, no_shipping=False, paypal_params=None):
@@ -135,6 +232,24 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
     There are quite a few options that can be passed to PayPal to configure
     this request - most are controlled by PAYPAL_* settings.
     """
+    params = _set_txn_params(
+        basket, shipping_methods, currency, return_url, cancel_url,
+        update_url=update_url, action=action, user=user,
+        user_address=user_address, shipping_method=shipping_method,
+        shipping_address=shipping_address, no_shipping=no_shipping,
+        paypal_params=paypal_params)
+    txn = _fetch_response(SET_EXPRESS_CHECKOUT, params)
+    return _express_checkout_url(txn.token)
+
+
+def _set_txn_params(basket, shipping_methods, currency, return_url,
+                    cancel_url, update_url=None, action=SALE, user=None,
+                    user_address=None, shipping_method=None,
+                    shipping_address=None, no_shipping=False,
+                    paypal_params=None):
+    """
+    Return the parameters for a 'SetExpressCheckout' call
+    """
     # Default parameters (taken from global settings).  These can be overridden
     # and customised using the paypal_params parameter.
     _params = {
@@ -357,16 +472,21 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
     # Ensure that the total is formatted correctly.
     params['PAYMENTREQUEST_0_AMT'] = _format_currency(
         params['PAYMENTREQUEST_0_AMT'])
+    return params
 
-    txn = _fetch_response(SET_EXPRESS_CHECKOUT, params)
 
-    # Construct return URL
-    if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
+def _express_checkout_url(token):
+    """
+    Return the URL to redirect the customer to for the passed token
+    """
+    if getattr(settings, 'PAYPAL_EXPRESS_URL', None):
+        url = settings.PAYPAL_EXPRESS_URL
+    elif getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
         url = 'https://www.sandbox.paypal.com/webscr'
     else:
         url = 'https://www.paypal.com/webscr'
     params = (('cmd', '_express-checkout'),
-              ('token', txn.token),)
+              ('token', token),)
     return '%s?%s' % (url, urlencode(params))
 
 
@@ -382,7 +502,12 @@ def do_txn(payer_id, token, amount, currency, action=SALE):
     """
     DoExpressCheckoutPayment
     """
-    params = {
+    return _fetch_response(DO_EXPRESS_CHECKOUT, _do_txn_params(
+        payer_id, token, amount, currency, action))
+
+
+def _do_txn_params(payer_id, token, amount, currency, action=SALE):
+    return {
         'PAYERID': payer_id,
         'TOKEN': token,
         #'PAYMENTREQUEST_0_AMT': 104.86,
@@ -392,7 +517,6 @@ def do_txn(payer_id, token, amount, currency, action=SALE):
         'PAYMENTREQUEST_0_CURRENCYCODE': currency,
         'PAYMENTREQUEST_0_PAYMENTACTION': action,
     }
-    return _fetch_response(DO_EXPRESS_CHECKOUT, params)
 
 
 def do_capture(txn_id, amount, currency, complete_type='Complete',
@@ -402,6 +526,12 @@ def do_capture(txn_id, amount, currency, complete_type='Complete',
 
     See https://cms.paypal.com/uk/cgi-bin/?&cmd=_render-content&content_ID=developer/e_howto_api_soap_r_DoCapture
     """
+    return _fetch_response(DO_CAPTURE, _do_capture_params(
+        txn_id, amount, currency, complete_type, note))
+
+
+def _do_capture_params(txn_id, amount, currency, complete_type='Complete',
+                       note=None):
     params = {
         'AUTHORIZATIONID': txn_id,
         #'AMT': 104.86, #amount,
@@ -413,21 +543,30 @@ def do_capture(txn_id, amount, currency, complete_type='Complete',
     }
     if note:
         params['NOTE'] = note
-    return _fetch_response(DO_CAPTURE, params)
+    return params
 
 
 def do_void(txn_id, note=None):
+    return _fetch_response(DO_VOID, _do_void_params(txn_id, note))
+
+
+def _do_void_params(txn_id, note=None):
     params = {
         'AUTHORIZATIONID': txn_id,
     }
     if note:
         params['NOTE'] = note
-    return _fetch_response(DO_VOID, params)
+    return params
 
 
 FULL_REFUND = 'Full'
 PARTIAL_REFUND = 'Partial'
 def refund_txn(txn_id, is_partial=False, amount=None, currency=None):
+    return _fetch_response(REFUND_TRANSACTION, _refund_txn_params(
+        txn_id, is_partial, amount, currency))
+
+
+def _refund_txn_params(txn_id, is_partial=False, amount=None, currency=None):
     params = {
         'TRANSACTIONID': txn_id,
         'REFUNDTYPE': PARTIAL_REFUND if is_partial else FULL_REFUND,
@@ -435,4 +574,4 @@ def refund_txn(txn_id, is_partial=False, amount=None, currency=None):
     if is_partial:
         params['AMT'] = amount
         params['CURRENCYCODE'] = currency
-    return _fetch_response(REFUND_TRANSACTION, params)
+    return params
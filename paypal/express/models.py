@@ -29,20 +29,65 @@ class ExpressTransaction(base.ResponseModel):
     SUCCESS, SUCCESS_WITH_WARNING, FAILURE = 'Success', 'SuccessWithWarning', 'Failure'
     ack = models.CharField(max_length=32)
 
-    correlation_id = models.CharField(max_length=32, null=True, blank=True)
+    correlation_id = models.CharField(max_length=32, null=True, blank=True,
+                                      db_index=True)
     token = models.CharField(max_length=32, null=True, blank=True)
 
-    error_code = models.CharField(max_length=32, null=True, blank=True)
+    error_code = models.CharField(max_length=32, null=True, blank=True,
+                                  db_index=True)
     error_message = models.CharField(max_length=256, null=True, blank=True)
 
+    # Response values that are looked up or filtered on, copied from the raw
+    # response when the row is written (see promote_fields)
+    transaction_id = models.CharField(max_length=32, null=True, blank=True,
+                                      db_index=True)
+    payer_id = models.CharField(max_length=32, null=True, blank=True,
+                                db_index=True)
+    payer_email = models.CharField(max_length=128, null=True, blank=True,
+                                   db_index=True)
+    payment_status = models.CharField(max_length=32, null=True, blank=True,
+                                      db_index=True)
+
+    # Response parameters that each promoted field is read from, in order
+    PROMOTED_FIELDS = (
+        ('transaction_id', ('PAYMENTINFO_0_TRANSACTIONID', 'TRANSACTIONID',
+                            'REFUNDTRANSACTIONID')),
+        ('payer_id', ('PAYERID',)),
+        ('payer_email', ('EMAIL',)),
+        ('payment_status', ('PAYMENTINFO_0_PAYMENTSTATUS', 'PAYMENTSTATUS')),
+    )
+
     class Meta:
         ordering = ('-date_created',)
         app_label = 'paypal'
+        # The facade looks up transactions by token and method
+        index_together = (('token', 'method', 'date_created'),)
 
     def save(self, *args, **kwargs):
-        self.raw_request = re.sub(r'PWD=\d+&', 'PWD=XXXXXX&', self.raw_request)
+        self.hide_sensitive_data()
         return super(ExpressTransaction, self).save(*args, **kwargs)
 
+    def hide_sensitive_data(self):
+        """
+        Mask the API password in the raw request.  This is called on save but
+        needs calling explicitly when rows are created with bulk_create.
+        """
+        self.raw_request = re.sub(r'PWD=\d+&', 'PWD=XXXXXX&', self.raw_request)
+
+    def promote_fields(self):
+        """
+        Copy the promoted values from the raw response.  Return a dict of the
+        values set.
+        """
+        values = {}
+        for field, keys in self.PROMOTED_FIELDS:
+            for key in keys:
+                if key in self.pairs:
+                    values[field] = self.pairs[key]
+                    setattr(self, field, values[field])
+                    break
+        return values
+
     @property
     def is_successful(self):
         return self.ack in (self.SUCCESS, self.SUCCESS_WITH_WARNING)
@@ -60,7 +105,7 @@ class ExpressTransactionPreAuth(models.Model):
     shipping_addr = models.TextField(blank=True, null=True)
     shopping_cart = models.TextField(blank=True, null=True)
     token = models.CharField(_("Token"), max_length=32, null=False,
-                             blank=False)
+                             blank=False, db_index=True)
     email = models.CharField(_("E-Mail"), max_length=128, null=True,
                              blank=True)
     customer = models.ForeignKey(get_user_model(), blank=True, null=True,
@@ -10,7 +10,6 @@ from django.contrib import messages
 from django.contrib.auth.models import AnonymousUser
 from django.core.urlresolvers import reverse
 from django.http import HttpResponseRedirect
-from django.utils.http import urlencode
 from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 
@@ -22,10 +21,12 @@ from oscar.apps.checkout import signals
 
 from paypal.express.facade import (
     get_paypal_url, fetch_transaction_details, confirm_transaction)
+from paypal.express.gateway import _express_checkout_url
 from paypal.express.exceptions import (
     EmptyBasketException, MissingShippingAddressException,
     MissingShippingMethodException, InvalidBasket)
 from paypal.exceptions import PayPalError
+from paypal import gateway, nvp
 
 # Load views dynamically
 PaymentDetailsView = get_class('checkout.views', 'PaymentDetailsView')
@@ -45,7 +46,25 @@ OrderPlacementMixin = get_class('checkout.mixins', 'OrderPlacementMixin')
 logger = logging.getLogger('paypal.express')
 
 
-class RedirectView(CheckoutSessionMixin, RedirectView):
+class GatewayDeadlineMixin(object):
+    """
+    Stop calls to PayPal from outliving the time budget of the view.
+    """
+
+    def get_gateway_deadline(self):
+        return getattr(settings, 'PAYPAL_CHECKOUT_DEADLINE', None)
+
+    def dispatch(self, request, *args, **kwargs):
+        seconds = self.get_gateway_deadline()
+        if not seconds:
+            return super(GatewayDeadlineMixin, self).dispatch(
+                request, *args, **kwargs)
+        with gateway.deadline(seconds):
+            return super(GatewayDeadlineMixin, self).dispatch(
+                request, *args, **kwargs)
+
+
+class RedirectView(GatewayDeadlineMixin, CheckoutSessionMixin, RedirectView):
     """
     Initiate the transaction with Paypal and redirect the user
     to PayPal's Express Checkout to perform the transaction.
@@ -216,22 +235,19 @@ class HandlePaymentView(OrderPlacementMixin, RedirectView):
             confirm_txn = confirm_transaction(
                 payer_id, token, amount, currency)
         except PayPalError as e:
+            # Communication errors (eg timeouts) don't carry error details
+            details = e.args[0] if e.args else None
+            if not isinstance(details, dict):
+                details = {'code': None, 'correlation_id': None}
             # 10486 error should be redirect to paypal
-            if e.message['code'] == '10486':
-                if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
-                    url = 'https://www.sandbox.paypal.com/webscr'
-                else:
-                    url = 'https://www.paypal.com/webscr'
-                params = (('cmd', '_express-checkout'),
-                          ('token', token),)
-                url = '%s?%s' % (url, urlencode(params))
+            if details['code'] == '10486':
                 # we need to redirect to paypal so do so
-                self._redirect_url = url
+                self._redirect_url = _express_checkout_url(token)
             else:
                 handle_paypal_error(order_number,
                                     amount,
-                                    e.message["correlation_id"],
-                                    code=e.message["code"])
+                                    details["correlation_id"],
+                                    code=details["code"])
         else:
             if not confirm_txn.is_successful:
                 # irgend ein anderer Grund wieso es nicht geklappt hat
@@ -256,7 +272,7 @@ class HandlePaymentView(OrderPlacementMixin, RedirectView):
 # Upgrading notes: when we drop support for Oscar 0.6, this class can be
 # refactored to pass variables around more explicitly (instead of assigning
 # things to self so they are accessible in a later method).
-class SuccessResponseView(PaymentDetailsView):
+class SuccessResponseView(GatewayDeadlineMixin, PaymentDetailsView):
     template_name_preview = 'paypal/express/preview.html'
     preview = True
 
@@ -607,8 +623,7 @@ class ShippingOptionsView(View):
             # No shipping methods available - we flag this up to PayPal indicating that we
             # do not ship to the shipping address.
             pairs.append(('NO_SHIPPING_OPTION_DETAILS', 1))
-        payload = urlencode(pairs)
-        return HttpResponse(payload)
+        return HttpResponse(nvp.encode(pairs))
 
     def get_shipping_methods(self, user, basket, shipping_address):
         repo = Repository()
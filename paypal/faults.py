@@ -0,0 +1,141 @@
+"""
+Fault injection for gateway calls.
+
+``FaultInjectingTransport`` wraps another transport and, per API method,
+slows calls down, drops them, answers them with a non-200 status or with a
+PayPal error code, each with a given probability.  This shows how the
+checkout and worker pool behave when PayPal is slow or flaky, before it
+happens in production.
+
+Faults are given as a dict of Express method (or Payflow TRXTYPE) to the
+faults for that method, with ``'default'`` covering the other methods::
+
+    {
+        'DoExpressCheckoutPayment': {
+            'latency': 'lognormal:800,0.6',
+            'drop': 0.01,
+            'status': {503: 0.02},
+            'error': {'10001': 0.05},
+        },
+        'default': {'latency': 'uniform:100,300'},
+    }
+
+* ``latency`` - a latency spec, as for the simulator (see
+  ``paypal.simulator.parse_latency``).  Calls that would take longer than
+  the read timeout time out.
+* ``drop`` - the probability that the connection is dropped
+* ``status`` - a dict of HTTP status code to probability
+* ``error`` - a dict of ``L_ERRORCODE0`` (Express) or ``RESULT`` (Payflow)
+  code to probability
+"""
+from __future__ import unicode_literals
+from contextlib import contextmanager
+import datetime
+import random
+import time
+
+from django.conf import settings
+
+from paypal import exceptions, gateway, nvp, simulator, transport
+
+
+class FaultInjectingTransport(transport.Transport):
+    """
+    Transport that injects faults into the calls it passes to another
+    transport.
+
+    Without arguments (ie when used as ``PAYPAL_TRANSPORT``) it is
+    configured by the ``PAYPAL_FAULTS``, ``PAYPAL_FAULTS_TRANSPORT`` and
+    ``PAYPAL_FAULTS_SEED`` settings.
+
+    :faults: Dict of method to faults, as described above
+    :transport: Transport to pass calls on to
+    :seed: Seed for the choice of faults
+    """
+
+    def __init__(self, faults=None, transport=None, seed=None):
+        if faults is None:
+            faults = getattr(settings, 'PAYPAL_FAULTS', {})
+            seed = getattr(settings, 'PAYPAL_FAULTS_SEED', None)
+        if transport is None:
+            transport = gateway.load_transport(getattr(
+                settings, 'PAYPAL_FAULTS_TRANSPORT',
+                gateway.DEFAULT_TRANSPORT))
+        self.random = random.Random(seed)
+        self.faults = {}
+        for method, method_faults in faults.items():
+            method_faults = dict(method_faults)
+            if 'latency' in method_faults:
+                method_faults['latency'] = simulator.parse_latency(
+                    method_faults['latency'], self.random)
+            self.faults[method] = method_faults
+        self.transport = transport
+
+    def _happens(self, probability):
+        return self.random.random() < probability
+
+    def post(self, url, body, headers, timeout, timings):
+        params = nvp.decode(body)
+        method = gateway.api_method(params)
+        faults = self.faults.get(method, self.faults.get('default'))
+        if not faults:
+            return self.transport.post(url, body, headers, timeout, timings)
+
+        if 'latency' in faults:
+            delay = faults['latency']()
+            if delay >= timeout[1]:
+                time.sleep(timeout[1])
+                raise exceptions.TransportError("Read timed out (injected)")
+            time.sleep(delay)
+        if self._happens(faults.get('drop', 0)):
+            raise exceptions.TransportError("Connection dropped (injected)")
+        for status_code, probability in faults.get('status', {}).items():
+            if self._happens(probability):
+                return int(status_code), b''
+        for code, probability in faults.get('error', {}).items():
+            if self._happens(probability):
+                return 200, error_response(params, '%s' % code,
+                                            self.random)
+        return self.transport.post(url, body, headers, timeout, timings)
+
+    def close(self):
+        self.transport.close()
+
+
+def error_response(params, code, rng=random):
+    """
+    Return the body of an error response with the passed code to a request
+    with the passed parameters.  Its IDs are drawn from ``rng``.
+    """
+    if 'TRXTYPE' in params:
+        return nvp.encode({
+            'RESULT': code,
+            'RESPMSG': simulator.PAYFLOW_RESULTS.get(code, "Error"),
+            'PNREF': 'FAULT%07d' % rng.randint(0, 9999999),
+        }, length_tags=True)
+    message = simulator.EXPRESS_ERRORS.get(code, "Error")
+    return nvp.encode({
+        'ACK': 'Failure',
+        'TIMESTAMP': datetime.datetime.utcnow().strftime(
+            '%Y-%m-%dT%H:%M:%SZ'),
+        'CORRELATIONID': 'fault%08x' % rng.getrandbits(32),
+        'L_ERRORCODE0': code,
+        'L_SHORTMESSAGE0': message,
+        'L_LONGMESSAGE0': message,
+        'L_SEVERITYCODE0': 'Error',
+    })
+
+
+@contextmanager
+def inject(faults, seed=None):
+    """
+    Inject faults into the gateway calls made within the block, in every
+    thread.  Calls are passed on to the transport that would otherwise have
+    been used, so this can be combined with a cassette::
+
+        with faults.inject({'DoCapture': {'drop': 0.1}}):
+            ...
+    """
+    wrapper = FaultInjectingTransport(faults, gateway.get_transport(), seed)
+    with gateway.use_transport(wrapper):
+        yield wrapper
@@ -1,39 +1,678 @@
 from __future__ import unicode_literals
-import requests
+from contextlib import contextmanager
+import functools
+import importlib
+import logging
+import os
+import random
+import sys
+import threading
 import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.six.moves import http_cookiejar
+from django.utils.six.moves.urllib.parse import urlparse
+from django.utils import six
+
+from paypal import exceptions, nvp, timing
+
+logger = logging.getLogger('paypal.gateway')
+
+# Number of connections kept open to each PayPal host
+DEFAULT_POOL_SIZE = 10
+
+# Number of seconds a pool can sit idle before its connections are dropped.
+# PayPal close idle connections on their side so reusing very old sockets
+# tends to fail with a reset.
+DEFAULT_KEEP_ALIVE = 15
+
+# Default (connect, read) timeouts in seconds for calls that don't have a
+# method-specific timeout configured.
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Circuit breaker defaults: the number of communication failures within the
+# failure window that trips the breaker, and the number of seconds it stays
+# open before a trial call is let through.
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_WINDOW = 60
+DEFAULT_BREAKER_RESET_TIMEOUT = 30
+
+# Retry defaults: the number of retries after the first attempt, and the base
+# and maximum backoff delays in seconds.
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.2
+DEFAULT_MAX_BACKOFF = 2.0
+
+# Transport used to send requests (see paypal.transport)
+DEFAULT_TRANSPORT = 'paypal.transport.RequestsTransport'
+
+
+class ConnectionPool(object):
+    """
+    A pool of keep-alive connections to a single PayPal endpoint.
+
+    The pool wraps a ``requests`` session so that TCP connections and TLS
+    sessions are reused across calls rather than being set up for every
+    request.
+    """
+
+    def __init__(self, prefix, size=DEFAULT_POOL_SIZE,
+                 keep_alive=DEFAULT_KEEP_ALIVE):
+        self.prefix = prefix
+        self.size = size
+        self.keep_alive = keep_alive
+        self.pid = os.getpid()
+        self.last_used = None
+        # Counters from sessions that have been recycled
+        self._requests = 0
+        self._connections = 0
+        self._lock = threading.Lock()
+        self.session = self._create_session()
+
+    def _create_session(self):
+        session = requests.Session()
+        # PayPal don't need cookies and a shared cookie jar isn't thread-safe
+        session.cookies.set_policy(
+            http_cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        session.mount(self.prefix, timing.TimedHTTPAdapter(
+            pool_connections=1, pool_maxsize=self.size))
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def _urllib3_pools(self):
+        adapter = self.session.get_adapter(self.prefix)
+        pools = adapter.poolmanager.pools
+        return [pools[key] for key in list(pools.keys())]
+
+    def _recycle(self):
+        for pool in self._urllib3_pools():
+            self._requests += pool.num_requests
+            self._connections += pool.num_connections
+        self.session.close()
+        self.session = self._create_session()
+
+    def post(self, url, data, **kwargs):
+        with self._lock:
+            now = time.time()
+            idle = now - self.last_used if self.last_used else 0
+            if self.keep_alive and idle > self.keep_alive:
+                self._recycle()
+            self.last_used = now
+            session = self.session
+        return session.post(url, data, **kwargs)
+
+    def stats(self):
+        """
+        Return a dict of request, connection and reuse counts for this pool.
+        """
+        requests_made, connections = self._requests, self._connections
+        for pool in self._urllib3_pools():
+            requests_made += pool.num_requests
+            connections += pool.num_connections
+        return {
+            'requests': requests_made,
+            'connections': connections,
+            'reused': max(requests_made - connections, 0),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_prefix(url):
+    parts = urlparse(url)
+    return '%s://%s' % (parts.scheme, parts.netloc)
+
+
+def get_pool(url):
+    """
+    Return the process-wide connection pool for the host of the passed URL.
+    """
+    prefix = _pool_prefix(url)
+    pool = _pools.get(prefix)
+    # A pool inherited from a parent process (eg a pre-forking server) can't
+    # share its sockets with us.
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(prefix)
+            if pool is None or pool.pid != os.getpid():
+                pool = ConnectionPool(
+                    prefix,
+                    size=getattr(settings, 'PAYPAL_POOL_SIZE',
+                                 DEFAULT_POOL_SIZE),
+                    keep_alive=getattr(settings, 'PAYPAL_KEEP_ALIVE',
+                                       DEFAULT_KEEP_ALIVE))
+                _pools[prefix] = pool
+    return pool
+
+
+def pool_stats():
+    """
+    Return connection reuse counts for each endpoint, keyed by URL prefix.
+    """
+    return dict((prefix, pool.stats()) for prefix, pool in
+                list(_pools.items()))
+
+
+def close_pools():
+    """
+    Close all pooled connections.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Limit the total time that gateway calls made within the block can take.
+    No call is started after the deadline, and a call that is still running
+    at it fails with a ``PayPalError``.
+
+    Deadlines nest: an inner deadline can only shorten the outer one.
+    """
+    previous = getattr(_local, 'deadline', None)
+    expires = time.time() + seconds
+    if previous is not None:
+        expires = min(expires, previous)
+    _local.deadline = expires
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def time_remaining():
+    """
+    Return the number of seconds left before the current deadline, or None if
+    no deadline has been set.
+    """
+    expires = getattr(_local, 'deadline', None)
+    if expires is None:
+        return None
+    return expires - time.time()
+
+
+def api_method(params):
+    """
+    Return the API method of a request - the METHOD for Express calls and the
+    TRXTYPE for Payflow ones.
+    """
+    return params.get('METHOD') or params.get('TRXTYPE')
+
+
+def get_timeout(method, remaining=None):
+    """
+    Return the (connect, read) timeout to use for the passed API method,
+    taking into account any deadline that has been set.  As for
+    ``requests``, these bound each connect and each wait for data; the
+    transport enforces the deadline on the call as a whole.
+
+    :remaining: Seconds left before the deadline.  Defaults to the deadline
+                set with ``deadline``.
+    """
+    timeout = getattr(settings, 'PAYPAL_TIMEOUTS', {}).get(method)
+    if timeout is None:
+        timeout = getattr(settings, 'PAYPAL_TIMEOUT', DEFAULT_TIMEOUT)
+    if not isinstance(timeout, (tuple, list)):
+        timeout = (timeout, timeout)
+    connect, read = timeout
+
+    if remaining is None:
+        remaining = time_remaining()
+    if remaining is not None:
+        if remaining <= 0:
+            raise exceptions.PayPalError(
+                "Deadline exceeded before calling PayPal")
+        connect, read = min(connect, remaining), min(read, remaining)
+    return connect, read
+
+
+class CircuitBreaker(object):
+    """
+    A circuit breaker for calls to one API method of a PayPal endpoint.
+
+    The breaker is *closed* while calls succeed.  Once ``threshold``
+    communication failures happen within ``window`` seconds it *opens* and
+    calls fail immediately with a ``CircuitOpenError``.  After
+    ``reset_timeout`` seconds it is *half-open*: a single trial call is let
+    through, which closes the breaker if it succeeds and re-opens it if not.
+
+    State lives in Django's cache so it is shared between worker processes
+    (and nodes, with a shared cache backend).
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, endpoint, method, threshold=DEFAULT_BREAKER_THRESHOLD,
+                 window=DEFAULT_BREAKER_WINDOW,
+                 reset_timeout=DEFAULT_BREAKER_RESET_TIMEOUT):
+        key = 'paypal-breaker:%s:%s' % (endpoint, method)
+        self.failures_key = key + ':failures'
+        self.opened_key = key + ':opened'
+        self.trial_key = key + ':trial'
+        self.endpoint = endpoint
+        self.method = method
+        self.threshold = threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self._dirty = False
+        self._is_trial = False
+
+    @property
+    def state(self):
+        opened = cache.get(self.opened_key)
+        if opened is None:
+            return self.CLOSED
+        if time.time() - opened < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def before_call(self):
+        """
+        Raise a ``CircuitOpenError`` if the call should not be made.
+        """
+        values = cache.get_many([self.failures_key, self.opened_key])
+        self._dirty = bool(values)
+        opened = values.get(self.opened_key)
+        if opened is None:
+            return
+        if time.time() - opened >= self.reset_timeout:
+            # Only one caller gets to make the trial call
+            if cache.add(self.trial_key, 1, self.reset_timeout):
+                self._is_trial = True
+                return
+        logger.warning("Circuit open for %s on %s - not calling PayPal",
+                       self.method, self.endpoint)
+        raise exceptions.CircuitOpenError(
+            "PayPal is currently unavailable")
+
+    def record_success(self):
+        if self._dirty:
+            cache.delete_many(
+                [self.failures_key, self.opened_key, self.trial_key])
+
+    def record_failure(self):
+        if self._is_trial:
+            self._open()
+            return
+        cache.add(self.failures_key, 0, self.window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # The key expired between the add and the incr
+            failures = 1
+            cache.set(self.failures_key, failures, self.window)
+        if failures >= self.threshold:
+            self._open()
+
+    def _open(self):
+        logger.error("Opening circuit for %s on %s", self.method,
+                     self.endpoint)
+        cache.set(self.opened_key, time.time(), None)
+        cache.delete_many([self.failures_key, self.trial_key])
 
-from django.utils.http import urlencode
-from django.utils.six.moves.urllib.parse import parse_qs
-from django.utils.encoding import force_text
 
-from paypal import exceptions
+def get_breaker(url, method):
+    """
+    Return the circuit breaker for the passed URL and API method, or None if
+    circuit breaking is disabled.
+    """
+    threshold = getattr(settings, 'PAYPAL_BREAKER_THRESHOLD',
+                        DEFAULT_BREAKER_THRESHOLD)
+    if not threshold:
+        return None
+    return CircuitBreaker(
+        urlparse(url).netloc, method, threshold=threshold,
+        window=getattr(settings, 'PAYPAL_BREAKER_WINDOW',
+                       DEFAULT_BREAKER_WINDOW),
+        reset_timeout=getattr(settings, 'PAYPAL_BREAKER_RESET_TIMEOUT',
+                              DEFAULT_BREAKER_RESET_TIMEOUT))
+
+
+def backoff(attempt):
+    """
+    Return the number of seconds to wait before retry number ``attempt``
+    (counting from zero), using exponential backoff with full jitter.
+    """
+    base = getattr(settings, 'PAYPAL_RETRY_BACKOFF', DEFAULT_BACKOFF)
+    cap = getattr(settings, 'PAYPAL_RETRY_MAX_BACKOFF', DEFAULT_MAX_BACKOFF)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
 
+def retry(call, idempotent, should_retry=None):
+    """
+    Make a gateway call, retrying it if it fails in a way that is likely to be
+    transient.
 
-def post(url, params):
+    :call: Callable that makes the call and returns its result
+    :idempotent: Whether the call can safely be repeated.  Non-idempotent
+                 calls are never retried.
+    :should_retry: Optional callable that is passed the result of a
+                   successful call and returns True if the call should be
+                   retried (eg PayPal returned a temporary error code).
+    """
+    retries = getattr(settings, 'PAYPAL_RETRIES', DEFAULT_RETRIES)
+    attempt = 0
+    while True:
+        try:
+            result = call()
+        except exceptions.CircuitOpenError:
+            raise
+        except exceptions.PayPalError:
+            if not idempotent or attempt >= retries:
+                raise
+            error = sys.exc_info()
+        else:
+            if not (idempotent and should_retry and attempt < retries and
+                    should_retry(result)):
+                return result
+            error = None
+
+        delay = backoff(attempt)
+        remaining = time_remaining()
+        if remaining is not None and delay >= remaining:
+            # No time left to try again
+            if error:
+                six.reraise(*error)
+            return result
+        attempt += 1
+        logger.info("Retrying PayPal call in %.2fs (retry %d of %d)",
+                    delay, attempt, retries)
+        time.sleep(delay)
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def load_transport(path):
+    """
+    Return the shared instance of the transport class with the passed dotted
+    path.
+    """
+    transport = _transports.get(path)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(path)
+            if transport is None:
+                module_name, class_name = path.rsplit('.', 1)
+                try:
+                    transport_class = getattr(
+                        importlib.import_module(module_name), class_name)
+                except (ImportError, AttributeError) as e:
+                    raise ImproperlyConfigured(
+                        "Unable to load PayPal transport '%s': %s" % (
+                            path, e))
+                transport = _transports[path] = transport_class()
+    return transport
+
+
+# Transports installed with use_transport, innermost last
+_transport_overrides = []
+
+
+def get_transport():
+    """
+    Return the transport installed with ``use_transport``, or else the one
+    selected by the ``PAYPAL_TRANSPORT`` setting.
+    """
+    if _transport_overrides:
+        return _transport_overrides[-1]
+    return load_transport(getattr(settings, 'PAYPAL_TRANSPORT',
+                                  DEFAULT_TRANSPORT))
+
+
+@contextmanager
+def use_transport(transport):
+    """
+    Send all gateway calls made within the block through the passed
+    transport instance.  This applies to every thread (so batch calls and
+    concurrent requests in a benchmark are covered), not only the caller's.
+    """
+    with _transports_lock:
+        _transport_overrides.append(transport)
+    try:
+        yield transport
+    finally:
+        with _transports_lock:
+            _transport_overrides.remove(transport)
+
+
+def post(url, params, headers=None, length_tags=False):
     """
     Make a POST request to the URL using the key-value pairs.  Return
-    a set of key-value pairs.
+    a ``Response``.
 
     :url: URL to post to
     :params: Dict of parameters to include in post payload
+    :headers: Dict of additional HTTP headers to send
+    :length_tags: Whether to encode the payload with Payflow length tags
+                  rather than URL encoding
     """
-    payload = urlencode(params)
+    method = api_method(params)
+    timeout = get_timeout(method)
+    breaker = get_breaker(url, method)
+    if breaker:
+        breaker.before_call()
+
+    payload = nvp.encode(params, length_tags)
+    request_headers = {'content-type': 'text/namevalue; charset=utf-8'}
+    if headers:
+        request_headers.update(headers)
+    timings = {}
     start_time = time.time()
-    response = requests.post(
-        url, payload,
-        headers={'content-type': 'text/namevalue; charset=utf-8'})
-    if response.status_code != requests.codes.ok:
+    try:
+        status_code, content = get_transport().post(
+            url, payload, request_headers, timeout, timings)
+    except exceptions.TransportError as e:
+        logger.warning("Error communicating with %s: %s", url, e)
+        if breaker:
+            breaker.record_failure()
+        raise exceptions.PayPalError("Unable to communicate with PayPal")
+    if status_code != requests.codes.ok:
+        if breaker:
+            breaker.record_failure()
         raise exceptions.PayPalError("Unable to communicate with PayPal")
+    if breaker:
+        breaker.record_success()
+
+    return parse_response(payload, content, start_time, timings)
+
+
+def run_many(calls, max_workers=None):
+    """
+    Run many gateway calls concurrently on a bounded pool of threads.
+
+    Return a list with the result of each call, in the same order as the
+    calls.  A call that raises an exception has a ``PayPalError`` as its
+    result (the exception itself if it is one) so that one failure doesn't
+    affect the others.
+
+    :calls: List of callables that take no arguments
+    :max_workers: The number of threads to use.  Defaults to the
+                  ``PAYPAL_BATCH_WORKERS`` setting.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'PAYPAL_BATCH_WORKERS',
+                              getattr(settings, 'PAYPAL_POOL_SIZE',
+                                      DEFAULT_POOL_SIZE))
 
-    # Convert response into a simple key-value format
-    pairs = {}
-    for key, values in parse_qs(response.text).items():
-        pairs[force_text(key)] = force_text(values[0])
-        #pairs[key] = values[0]
+    def run(call):
+        try:
+            return call()
+        except exceptions.PayPalError as e:
+            return e
+        except Exception:
+            logger.exception("Error in a batch call to PayPal")
+            return exceptions.PayPalError("Unable to communicate with PayPal")
 
-    # Add audit information
-    pairs['_raw_request'] = payload
-    pairs['_raw_response'] = response.content
-    pairs['_response_time'] = (time.time() - start_time) * 1000.0
+    calls = list(calls)
+    if not calls:
+        return []
+    pool = ThreadPool(min(max_workers, len(calls)))
+    try:
+        return pool.map(run, calls, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
 
-    return pairs
+
+def post_many(jobs, max_workers=None):
+    """
+    Make many POST requests concurrently.  Return a list of the
+    ``Response`` (or ``PayPalError``) for each job, in the same order as the
+    jobs.
+
+    :jobs: List of (url, params), (url, params, headers) or
+           (url, params, headers, length_tags) tuples
+    :max_workers: The number of threads to use
+    """
+    return run_many([functools.partial(post, *job) for job in jobs],
+                    max_workers)
+
+
+class Response(object):
+    """
+    A response from PayPal.
+
+    The raw request and response bodies are held once, as bytes, and the
+    response is only decoded when a field is first accessed.  Fields can be
+    read using the accessors or by name, as with a dict.  The
+    ``_raw_request``, ``_raw_response`` and ``_response_time`` keys are
+    supported for code that expects the pairs dict this replaced.
+    """
+    __slots__ = ('request_body', 'response_body', 'response_time', 'timings',
+                 '_pairs')
+
+    def __init__(self, request_body, response_body, response_time,
+                 timings=None):
+        self.request_body = request_body
+        self.response_body = response_body
+        self.response_time = response_time
+        # Milliseconds spent in each phase of the call (see paypal.timing)
+        self.timings = timings if timings is not None else {}
+        self._pairs = None
+
+    @property
+    def pairs(self):
+        """
+        Dict of the decoded name-value pairs
+        """
+        if self._pairs is None:
+            start_time = time.time()
+            self._pairs = nvp.decode(self.response_body)
+            timing.record('decode', start_time, self.timings)
+        return self._pairs
+
+    @property
+    def raw_request(self):
+        return self.request_body.decode('utf-8', 'replace')
+
+    @property
+    def raw_response(self):
+        return self.response_body.decode('utf-8', 'replace')
+
+    # Express fields
+
+    @property
+    def ack(self):
+        return self.pairs.get('ACK')
+
+    @property
+    def token(self):
+        return self.pairs.get('TOKEN')
+
+    @property
+    def correlation_id(self):
+        return self.pairs.get('CORRELATIONID')
+
+    @property
+    def errors(self):
+        """
+        List of dicts with the code and message of each error
+        """
+        errors, pairs = [], self.pairs
+        while 'L_ERRORCODE%d' % len(errors) in pairs:
+            index = len(errors)
+            errors.append({
+                'code': pairs['L_ERRORCODE%d' % index],
+                'msg': pairs.get('L_LONGMESSAGE%d' % index),
+            })
+        return errors
+
+    # Payflow fields
+
+    @property
+    def result(self):
+        return self.pairs.get('RESULT')
+
+    @property
+    def pnref(self):
+        return self.pairs.get('PNREF')
+
+    @property
+    def respmsg(self):
+        return self.pairs.get('RESPMSG')
+
+    # Mapping interface
+
+    _audit_keys = {
+        '_raw_request': 'raw_request',
+        '_raw_response': 'raw_response',
+        '_response_time': 'response_time',
+    }
+
+    def __getitem__(self, key):
+        if key in self._audit_keys:
+            return getattr(self, self._audit_keys[key])
+        return self.pairs[key]
+
+    def __contains__(self, key):
+        return key in self._audit_keys or key in self.pairs
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return self.pairs.items()
+
+    def __repr__(self):
+        return '<Response: %s>' % self.raw_response
+
+
+def parse_response(payload, content, start_time, timings=None):
+    """
+    Return a ``Response`` for the request and response bodies, including
+    audit information about the call.
+
+    :payload: Request body as bytes
+    :content: Response body as bytes
+    :start_time: Time the request was sent
+    :timings: Dict of the time spent in each phase of the call
+    """
+    return Response(payload, content, (time.time() - start_time) * 1000.0,
+                    timings)
@@ -0,0 +1,282 @@
+"""
+A local, append-only journal of transaction rows.
+
+When ``PAYPAL_JOURNAL_DIR`` is set, each transaction row is appended to the
+journal (and made durable) before it is saved to the database.  If the save
+is slow to fail or the database is unavailable, the record of the call isn't
+lost: the ``paypal_ingest_journal`` command replays the journal into the
+database, skipping rows that were saved already.
+
+Each process writes to its own segment files, named
+``<host>-<pid>-<sequence>.open`` while being written and renamed to ``.log``
+once full.  Records are JSON lines.  Writes are made durable with
+``fsync``, batched across threads so that concurrent calls share a sync
+rather than each waiting for its own.
+"""
+from __future__ import unicode_literals
+import glob
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger('paypal.journal')
+
+# Size in bytes beyond which a segment is closed and a new one started
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+def model_label(model):
+    """
+    Return the label that records of a model are stored under
+    """
+    return '%s.%s' % (model._meta.app_label, model.__name__)
+
+
+def serialize(instance):
+    """
+    Return a dict of the field values of an unsaved instance
+    """
+    fields = {}
+    for field in instance._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        value = getattr(instance, field.attname)
+        if value is not None:
+            value = field.value_to_string(instance)
+        fields[field.attname] = value
+    return {'model': model_label(type(instance)), 'fields': fields}
+
+
+def deserialize(record, models):
+    """
+    Return an unsaved instance for a journal record
+
+    :models: Dict of model label to model class
+    """
+    model = models[record['model']]
+    fields = dict(
+        (field.attname, field.to_python(record['fields'][field.attname]))
+        for field in model._meta.concrete_fields
+        if field.attname in record['fields'])
+    return model(**fields)
+
+
+class Journal(object):
+    """
+    Appends records to segment files in a directory.
+
+    :directory: Directory to write segments to
+    :segment_size: Size in bytes at which a new segment is started
+    :fsync: Whether to wait for each record to be synced to disk.  If not,
+            records survive the process crashing but not the host.
+    """
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE,
+                 fsync=True):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.pid = os.getpid()
+        self.prefix = '%s-%d-' % (socket.gethostname(), self.pid)
+        # Protects the segment file and the write counters
+        self.lock = threading.Lock()
+        # Held while syncing, so that threads queue up behind one sync
+        self.sync_lock = threading.Lock()
+        self.file = None
+        self.path = None
+        self.sequence = 0
+        self.size = 0
+        self.written = 0
+        self.synced = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        close_abandoned_segments(directory)
+
+    def append(self, *records):
+        """
+        Append records (dicts) to the journal.  Return once they are
+        durable.
+        """
+        data = b''.join(
+            json.dumps(record, sort_keys=True,
+                       separators=(',', ':')).encode('utf-8') + b'\n'
+            for record in records)
+        with self.lock:
+            if self.file is None:
+                self._open_segment()
+            self.file.write(data)
+            self.size += len(data)
+            self.written += 1
+            position = self.written
+        self._sync(position)
+
+    def _sync(self, position):
+        with self.sync_lock:
+            with self.lock:
+                if self.synced >= position:
+                    # Another thread's sync covered this record
+                    return
+                self.file.flush()
+                target = self.written
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            with self.lock:
+                self.synced = target
+                if self.size >= self.segment_size:
+                    self._close_segment()
+
+    def _open_segment(self):
+        while True:
+            self.sequence += 1
+            path = os.path.join(self.directory, '%s%06d' % (
+                self.prefix, self.sequence))
+            # Segments of an earlier journal with the same PID are kept
+            if not (os.path.exists(path + '.open') or
+                    os.path.exists(path + '.log')):
+                break
+        self.path = path + '.open'
+        self.file = io.open(self.path, 'ab')
+        self.size = 0
+
+    def _close_segment(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        os.rename(self.path, self.path[:-len('.open')] + '.log')
+        self.synced = self.written
+        self.file = None
+
+    def close(self):
+        """
+        Close the current segment, marking it ready for ingesting
+        """
+        with self.sync_lock:
+            with self.lock:
+                if self.file is not None:
+                    self._close_segment()
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == 1  # EPERM: exists but belongs to another user
+    return True
+
+
+def close_abandoned_segments(directory):
+    """
+    Mark the open segments of processes on this host that have died as
+    ready for ingesting.
+    """
+    host = socket.gethostname()
+    for path in glob.glob(os.path.join(directory, '%s-*.open' % host)):
+        try:
+            pid = int(os.path.basename(path)[len(host) + 1:].split('-')[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _process_exists(pid):
+            os.rename(path, path[:-len('.open')] + '.log')
+
+
+def read_segment(path):
+    """
+    Yield the records in a segment.  A partly written last line (from a
+    crash mid-write) is skipped.
+    """
+    with io.open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                logger.warning("Skipping incomplete record at end of %s",
+                               path)
+                break
+            yield json.loads(line.decode('utf-8'))
+
+
+def ingest(directory, models, batch_size=500, include_open=False):
+    """
+    Save the journalled rows that aren't in the database yet, and delete the
+    closed segments once they are ingested.  Return the number of rows
+    saved.
+
+    :models: Transaction models to ingest rows for
+    :include_open: Whether to also ingest segments that are still being
+                   written to.  They aren't deleted.
+    """
+    close_abandoned_segments(directory)
+    labels = dict((model_label(model), model) for model in models)
+    paths = sorted(glob.glob(os.path.join(directory, '*.log')))
+    if include_open:
+        paths += sorted(glob.glob(os.path.join(directory, '*.open')))
+    saved = 0
+    for path in paths:
+        records = [record for record in read_segment(path)
+                   if record['model'] in labels]
+        for i in range(0, len(records), batch_size):
+            saved += _ingest_batch(records[i:i + batch_size], labels)
+        if path.endswith('.log'):
+            os.remove(path)
+    return saved
+
+
+def _ingest_batch(records, models):
+    instances = [deserialize(record, models) for record in records]
+    saved = 0
+    for model in set(type(instance) for instance in instances):
+        batch = [instance for instance in instances
+                 if type(instance) is model]
+        existing = set(model._default_manager.filter(
+            journal_id__in=[instance.journal_id for instance in batch]
+        ).values_list('journal_id', flat=True))
+        new = [instance for instance in batch
+               if instance.journal_id not in existing]
+        model._default_manager.bulk_create(new)
+        saved += len(new)
+    return saved
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """
+    Return this process's journal, or None if journalling isn't enabled
+    """
+    global _journal
+    directory = getattr(settings, 'PAYPAL_JOURNAL_DIR', None)
+    if not directory:
+        return None
+    # A forked worker needs its own segments
+    if (_journal is None or _journal.pid != os.getpid() or
+            _journal.directory != directory):
+        with _journal_lock:
+            if (_journal is None or _journal.pid != os.getpid() or
+                    _journal.directory != directory):
+                _journal = Journal(
+                    directory,
+                    segment_size=getattr(settings,
+                                         'PAYPAL_JOURNAL_SEGMENT_SIZE',
+                                         DEFAULT_SEGMENT_SIZE),
+                    fsync=getattr(settings, 'PAYPAL_JOURNAL_FSYNC', True))
+    return _journal
+
+
+def record(*instances):
+    """
+    Give unsaved transactions a journal ID and append them to the journal,
+    if journalling is enabled.
+    """
+    journal = get_journal()
+    if journal is not None and instances:
+        for instance in instances:
+            instance.hide_sensitive_data()
+            instance.journal_id = uuid.uuid4().hex
+        journal.append(*[serialize(instance) for instance in instances])
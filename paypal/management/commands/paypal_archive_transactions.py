@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from paypal import archive
+from paypal.express.models import ExpressTransaction
+from paypal.payflow.models import PayflowTransaction
+
+
+class Command(BaseCommand):
+    help = ("Move PayPal transactions older than a cutoff into monthly "
+            "archives and delete them from the database")
+    option_list = BaseCommand.option_list + (
+        make_option('--directory', default=None,
+                    help="Archive directory (defaults to PAYPAL_ARCHIVE_DIR)"),
+        make_option('--days', type='int', default=None,
+                    help=("Archive transactions older than this many days "
+                          "(defaults to PAYPAL_ARCHIVE_AFTER_DAYS)")),
+        make_option('--chunk-size', type='int',
+                    default=archive.DEFAULT_CHUNK_SIZE,
+                    help="Number of rows to read per query"),
+        make_option('--delete-batch-size', type='int',
+                    default=archive.DEFAULT_DELETE_BATCH_SIZE,
+                    help="Number of rows to delete per transaction"),
+        make_option('--pause', type='float', default=0,
+                    help="Seconds to wait between delete batches"),
+        make_option('--every', type='int', default=None,
+                    help=("Keep running, archiving every this many "
+                          "seconds.  Only run one archiver at a time.")),
+    )
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or archive.get_directory()
+        while True:
+            cutoff = archive.get_cutoff(options['days'])
+            for model in (ExpressTransaction, PayflowTransaction):
+                count = archive.archive(
+                    model, directory, cutoff,
+                    chunk_size=options['chunk_size'],
+                    delete_batch_size=options['delete_batch_size'],
+                    pause=options['pause'])
+                self.stdout.write("Archived %d %s rows created before %s" % (
+                    count, model.__name__, cutoff.strftime('%Y-%m-%d')))
+            if not options['every']:
+                return
+            close_old_connections()
+            time.sleep(options['every'])
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+from optparse import make_option
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from paypal.express.models import ExpressTransaction
+
+
+class Command(BaseCommand):
+    help = ("Copy the transaction ID, payer and payment status of existing "
+            "Express transactions from their raw response into their own "
+            "columns")
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+                    help="Number of rows to update per transaction"),
+    )
+
+    def handle(self, *args, **options):
+        count, last_pk = 0, 0
+        while True:
+            txns = list(ExpressTransaction.objects.filter(
+                pk__gt=last_pk).order_by('pk').only('pk', 'raw_response')[
+                    :options['batch_size']])
+            if not txns:
+                break
+            with transaction.atomic():
+                for txn in txns:
+                    values = txn.promote_fields()
+                    if values:
+                        ExpressTransaction.objects.filter(
+                            pk=txn.pk).update(**values)
+                        count += 1
+            last_pk = txns[-1].pk
+        self.stdout.write("Updated %d ExpressTransaction rows" % count)
@@ -0,0 +1,42 @@
+from __future__ import unicode_literals
+from optparse import make_option
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from paypal import compression
+from paypal.express.models import ExpressTransaction
+from paypal.payflow.models import PayflowTransaction
+
+
+class Command(BaseCommand):
+    help = "Compress the raw request and response of existing transactions"
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+                    help="Number of rows to update per transaction"),
+    )
+
+    def handle(self, *args, **options):
+        for model in (ExpressTransaction, PayflowTransaction):
+            count = self.compress(model, options['batch_size'])
+            self.stdout.write("Compressed %d %s rows" % (
+                count, model.__name__))
+
+    def compress(self, model, batch_size):
+        count, last_pk = 0, 0
+        while True:
+            # values_list returns the stored values, compressed or not
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', 'raw_request', 'raw_response')[
+                    :batch_size])
+            if not rows:
+                return count
+            with transaction.atomic():
+                for pk, raw_request, raw_response in rows:
+                    request = compression.compress(raw_request)
+                    response = compression.compress(raw_response)
+                    if (request, response) != (raw_request, raw_response):
+                        model.objects.filter(pk=pk).update(
+                            raw_request=request, raw_response=response)
+                        count += 1
+            last_pk = rows[-1][0]
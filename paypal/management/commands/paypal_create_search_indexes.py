@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from paypal import search
+from paypal.express.models import ExpressTransaction
+from paypal.payflow.models import PayflowTransaction
+
+# Columns that the dashboards search by substring when
+# PAYPAL_DASHBOARD_TRIGRAM_SEARCH is set
+TRIGRAM_COLUMNS = (
+    (ExpressTransaction, ('token', 'correlation_id', 'payer_email')),
+    (PayflowTransaction, ('comment1', 'pnref')),
+)
+
+
+class Command(BaseCommand):
+    help = ("Create the PostgreSQL trigram indexes used for substring "
+            "searches of PayPal transactions in the dashboard")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                "Trigram indexes need PostgreSQL.  Leave "
+                "PAYPAL_DASHBOARD_TRIGRAM_SEARCH off to search by exact "
+                "match, which the regular indexes serve.")
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for model, columns in TRIGRAM_COLUMNS:
+            table = model._meta.db_table
+            for column in columns:
+                # Indexes on the bare column, made by earlier versions of
+                # this command, can't serve the searches
+                cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS %s" % qn(
+                    '%s_%s_trgm' % (table, column)))
+                name = '%s_%s_upper_trgm' % (table, column)
+                cursor.execute(
+                    "SELECT 1 FROM pg_indexes WHERE indexname = %s", [name])
+                if cursor.fetchone():
+                    continue
+                # CONCURRENTLY so that writes carry on while it is built
+                cursor.execute(
+                    "CREATE INDEX CONCURRENTLY %s ON %s USING gin "
+                    "((%s) gin_trgm_ops)" % (
+                        qn(name), qn(table),
+                        search.trigram_index_expression(
+                            connection.ops, column)))
+                self.stdout.write("Created %s" % name)
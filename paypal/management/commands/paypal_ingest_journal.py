@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from paypal import journal
+from paypal.express.models import ExpressTransaction
+from paypal.payflow.models import PayflowTransaction
+
+
+class Command(BaseCommand):
+    help = ("Save the PayPal transactions in the journal that aren't in the "
+            "database yet")
+    option_list = BaseCommand.option_list + (
+        make_option('--directory', default=None,
+                    help="Journal directory (defaults to PAYPAL_JOURNAL_DIR)"),
+        make_option('--include-open', action='store_true', default=False,
+                    help=("Also ingest segments that are still being "
+                          "written to by running processes")),
+    )
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or getattr(
+            settings, 'PAYPAL_JOURNAL_DIR', None)
+        if not directory:
+            raise CommandError(
+                "Pass --directory or set PAYPAL_JOURNAL_DIR")
+        saved = journal.ingest(
+            directory, [ExpressTransaction, PayflowTransaction],
+            batch_size=getattr(settings, 'PAYPAL_BATCH_SIZE', 500),
+            include_open=options['include_open'])
+        self.stdout.write("Saved %d transactions from the journal" % saved)
@@ -0,0 +1,55 @@
+from __future__ import unicode_literals
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paypal import simulator
+
+
+class Command(BaseCommand):
+    args = '[addrport]'
+    help = ("Run a local simulator of the PayPal Express and Payflow APIs "
+            "for load testing")
+    option_list = BaseCommand.option_list + (
+        make_option('--latency', action='append', default=[],
+                    metavar='METHOD=SPEC',
+                    help=("Latency of a method (or Payflow TRXTYPE, or "
+                          "'default'), eg 'DoCapture=lognormal:300,0.5'. "
+                          "Can be given more than once.")),
+        make_option('--error', action='append', default=[],
+                    metavar='METHOD=CODE:PROBABILITY',
+                    help=("Error to return for a proportion of calls to a "
+                          "method, eg 'DoCapture=10001:0.05'. Can be given "
+                          "more than once.")),
+        make_option('--seed', type='int', default=None,
+                    help="Seed for the choice of injected errors"),
+    )
+
+    def handle(self, addrport='127.0.0.1:8999', *args, **options):
+        host, _, port = addrport.rpartition(':')
+        if not port.isdigit():
+            raise CommandError("'%s' is not a valid port" % port)
+        try:
+            latency = dict(spec.split('=', 1) for spec in options['latency'])
+            sim = simulator.Simulator(
+                latency=latency,
+                errors=simulator.parse_errors(options['error']),
+                seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(e)
+        server = simulator.SimulatorServer(
+            (host or '127.0.0.1', int(port)), sim,
+            verbose=int(options.get('verbosity', 1)) > 1)
+        base_url = 'http://%s:%s' % server.server_address[:2]
+        self.stdout.write(
+            "PayPal simulator running at %s\n"
+            "Set PAYPAL_API_URL = '%s/nvp', "
+            "PAYPAL_EXPRESS_URL = '%s/webscr' and "
+            "PAYPAL_PAYFLOW_URL = '%s/' to use it.\n"
+            "Quit with CONTROL-C." % (base_url, base_url, base_url, base_url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,129 @@
+"""
+Encoding and decoding of PayPal's name-value pair (NVP) format.
+
+Both the Express and Payflow APIs take a request body of ``NAME=value`` pairs
+joined with ``&`` and respond in the same format.  Express values are URL
+encoded.  Payflow values are sent as-is and a value containing ``&`` or ``=``
+is given a length tag instead: ``NAME[len]=value``, where ``len`` is the
+length of the value in bytes.
+"""
+from __future__ import unicode_literals
+import re
+
+from django.utils import six
+
+# Bytes that never need quoting
+_SAFE = (b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+         b'0123456789_.-~')
+
+# Quoted form of each byte, indexed by the byte value
+_QUOTED = [six.int2byte(i) if six.int2byte(i) in _SAFE
+           else ('%%%02X' % i).encode('ascii') for i in range(256)]
+_QUOTED[ord(' ')] = b'+'
+
+# Payflow values that need a length tag.  '%' and '+' aren't special to
+# Payflow but are tagged so that recorded requests decode to the values sent.
+_NEEDS_TAG = re.compile(b'[&=%+]')
+
+# Byte for each two-digit hex escape, in any case
+_HEX = '0123456789ABCDEFabcdef'
+_UNQUOTED = dict(
+    ((high + low).encode('ascii'), six.int2byte(int(high + low, 16)))
+    for high in _HEX for low in _HEX)
+_ESCAPE = re.compile(b'%([0-9A-Fa-f]{2})')
+
+
+def _to_bytes(value):
+    if isinstance(value, six.binary_type):
+        return value
+    if not isinstance(value, six.text_type):
+        value = six.text_type(value)
+    return value.encode('utf-8')
+
+
+def _quote(value):
+    if not value.rstrip(_SAFE):
+        return value
+    return b''.join([_QUOTED[byte] for byte in bytearray(value)])
+
+
+def _unescape(match):
+    return _UNQUOTED[match.group(1)]
+
+
+def _unquote(value):
+    if b'%' in value or b'+' in value:
+        value = _ESCAPE.sub(_unescape, value.replace(b'+', b' '))
+    return value.decode('utf-8', 'replace')
+
+
+def encode(params, length_tags=False):
+    """
+    Encode the parameters as a request body.  Return bytes.
+
+    :params: Dict or sequence of (name, value) pairs.  Values are converted
+             to text, so Decimals, ints and bools can be passed directly.
+    :length_tags: Whether to send values as-is, with a length tag where
+                  needed, as Payflow expects.  Otherwise values are URL
+                  encoded.
+    """
+    if hasattr(params, 'items'):
+        params = params.items()
+    parts = []
+    for name, value in params:
+        name, value = _to_bytes(name), _to_bytes(value)
+        if not length_tags:
+            parts.append(_quote(name) + b'=' + _quote(value))
+        elif _NEEDS_TAG.search(value):
+            parts.append(b''.join([name, b'[', str(len(value)).encode('ascii'),
+                                   b']=', value]))
+        else:
+            parts.append(name + b'=' + value)
+    return b'&'.join(parts)
+
+
+def decode(data):
+    """
+    Decode a request or response body into a dict of names to values.
+
+    Length-tagged values are read as-is and others are URL decoded.  As with
+    ``parse_qs``, pairs with a blank value are dropped and the first value is
+    kept if a name is repeated.
+
+    :data: Body as bytes or text
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    pairs = {}
+    if b']=' not in data:
+        # No length tags so every '&' is a delimiter
+        for part in data.split(b'&'):
+            name, _, value = part.partition(b'=')
+            if value:
+                pairs.setdefault(_unquote(name), _unquote(value))
+        return pairs
+
+    pos, end = 0, len(data)
+    while pos < end:
+        amp = data.find(b'&', pos)
+        if amp == -1:
+            amp = end
+        eq = data.find(b'=', pos, amp)
+        if eq == -1:
+            # A name without a value
+            pos = amp + 1
+            continue
+        name = data[pos:eq]
+        bracket = name.find(b'[')
+        if (bracket != -1 and name.endswith(b']') and
+                name[bracket + 1:-1].isdigit()):
+            # Length-tagged value, which can contain '&' and '='
+            amp = eq + 1 + int(name[bracket + 1:-1])
+            name, value = name[:bracket], data[eq + 1:amp]
+            value = value.decode('utf-8', 'replace')
+        else:
+            value = _unquote(data[eq + 1:amp])
+        if value:
+            pairs.setdefault(_unquote(name), value)
+        pos = amp + 1
+    return pairs
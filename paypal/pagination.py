@@ -0,0 +1,172 @@
+"""
+Keyset pagination for the transaction dashboards.
+
+OFFSET pagination reads and discards every row before the page, and needs a
+``COUNT(*)`` of the whole table for the page links, so deep pages of a large
+table are slow.  ``KeysetPaginationMixin`` pages on ``(date_created, id)``
+instead: each page is fetched with a ``WHERE`` on the last (or first) row of
+the page before, so every page costs the same.  Pages are linked with
+next/previous cursors rather than numbers, and the total shown is an
+estimate.
+"""
+from __future__ import unicode_literals
+import base64
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+# Number of seconds that a count of a filtered queryset is cached for
+DEFAULT_COUNT_TIMEOUT = 300
+
+
+def encode_cursor(instance):
+    """
+    Return the cursor for a row
+    """
+    value = '%s,%d' % (instance.date_created.isoformat(), instance.pk)
+    return base64.urlsafe_b64encode(value.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Return the (date_created, pk) of a cursor, or raise ValueError
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode('ascii')).decode(
+            'ascii')
+        date_created, pk = value.rsplit(',', 1)
+        date_created = parse_datetime(date_created)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if date_created is None:
+        raise ValueError("Invalid cursor")
+    return date_created, int(pk)
+
+
+def estimate_count(queryset):
+    """
+    Return an estimate of the number of rows in a queryset.
+
+    For a whole table on PostgreSQL this is the planner's estimate.
+    Otherwise it is a count, cached for ``PAYPAL_DASHBOARD_COUNT_TIMEOUT``
+    seconds.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        cursor = connection.cursor()
+        # The table of that name that queries see, whatever the schema
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s "
+                       "AND pg_table_is_visible(oid)",
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        if row is not None and row[0] > 0:
+            return int(row[0])
+    sql, params = queryset.query.sql_with_params()
+    key = 'paypal-count-%s' % hashlib.md5(
+        ('%s %r' % (sql, params)).encode('utf-8')).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(
+            settings, 'PAYPAL_DASHBOARD_COUNT_TIMEOUT', DEFAULT_COUNT_TIMEOUT))
+    return count
+
+
+class KeysetPage(object):
+    """
+    A page of rows, with the cursors of the pages either side
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor,
+                 count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Estimated number of rows on all pages
+        self.count = count
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate(queryset, page_size, after=None, before=None):
+    """
+    Return the page of a queryset, newest first, that follows the ``after``
+    cursor, precedes the ``before`` cursor or, without either, the first
+    page.  Raise ValueError for an invalid cursor.
+    """
+    if before:
+        date_created, pk = decode_cursor(before)
+        rows = list(queryset.filter(
+            Q(date_created__gt=date_created) |
+            Q(date_created=date_created, pk__gt=pk)).order_by(
+                'date_created', 'pk')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        if rows:
+            date_created, pk = rows[-1].date_created, rows[-1].pk
+        # Look for an older row, as the cursor's row may have gone
+        has_next = queryset.filter(
+            Q(date_created__lt=date_created) |
+            Q(date_created=date_created, pk__lt=pk)).exists()
+    else:
+        if after:
+            date_created, pk = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(date_created__lt=date_created) |
+                Q(date_created=date_created, pk__lt=pk))
+        rows = list(queryset.order_by('-date_created', '-pk')[
+            :page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = bool(after)
+    return KeysetPage(
+        rows,
+        encode_cursor(rows[-1]) if rows and has_next else None,
+        encode_cursor(rows[0]) if rows and has_previous else None)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Mixin for list views of transactions that pages with the ``after`` and
+    ``before`` cursors instead of page numbers.  ``page_obj`` is a
+    ``KeysetPage`` and ``paginator`` is None.  ``pagination_params`` is the
+    query string without the cursors, for the page links (see
+    ``paypal/partials/keyset_pagination.html``).
+    """
+    paginate_by = 50
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = paginate(queryset, page_size,
+                            after=self.request.GET.get('after'),
+                            before=self.request.GET.get('before'))
+        except ValueError:
+            raise Http404("Invalid page")
+        page.count = estimate_count(queryset)
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        ctx = super(KeysetPaginationMixin, self).get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        ctx['pagination_params'] = params.urlencode()
+        return ctx
@@ -25,6 +25,12 @@ class TxnAdmin(admin.ModelAdmin):
         'raw_request',
         'raw_response',
         'response_time',
+        'pool_wait_time',
+        'connect_time',
+        'tls_time',
+        'first_byte_time',
+        'read_time',
+        'decode_time',
         'date_created',
     ]
 
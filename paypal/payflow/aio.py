@@ -0,0 +1,52 @@
+"""
+Asynchronous versions of the Payflow gateway functions.
+
+Each function takes the same arguments as its counterpart in
+``paypal.payflow.gateway``.  Transactions are recorded in a worker thread as
+the ORM is synchronous.
+"""
+from paypal import aio
+from paypal.payflow import gateway, codes
+
+
+async def _transaction(extra_params):
+    """
+    Perform a transaction with PayPal.
+    """
+    url, params, headers = gateway._build_request(extra_params)
+    response = await aio.async_retry(
+        lambda: aio.async_post(url, params, headers, length_tags=True),
+        idempotent=True)
+    return await aio.run_sync(gateway._record_response, params, response)
+
+
+async def authorize(order_number, card_number, cvv, expiry_date, amt,
+                    **kwargs):
+    return await _transaction(gateway._payment_details_params(
+        codes.AUTHORIZATION, order_number, card_number, cvv, expiry_date,
+        amt, **kwargs))
+
+
+async def sale(order_number, card_number, cvv, expiry_date, amt, **kwargs):
+    return await _transaction(gateway._payment_details_params(
+        codes.SALE, order_number, card_number, cvv, expiry_date, amt,
+        **kwargs))
+
+
+async def delayed_capture(order_number, pnref, amt=None):
+    return await _transaction(gateway._delayed_capture_params(
+        order_number, pnref, amt))
+
+
+async def reference_transaction(order_number, pnref, amt):
+    return await _transaction(gateway._reference_transaction_params(
+        order_number, pnref, amt))
+
+
+async def credit(order_number, pnref, amt=None):
+    return await _transaction(gateway._credit_params(
+        order_number, pnref, amt))
+
+
+async def void(order_number, pnref):
+    return await _transaction(gateway._void_params(order_number, pnref))
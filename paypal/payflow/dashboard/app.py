@@ -9,12 +9,15 @@ from . import views
 class PayFlowDashboardApplication(Application):
     name = None
     list_view = views.TransactionListView
+    archive_view = views.ArchivedTransactionListView
     detail_view = views.TransactionDetailView
 
     def get_urls(self):
         urlpatterns = patterns('',
             url(r'^transactions/$', self.list_view.as_view(),
                 name='paypal-payflow-list'),
+            url(r'^transactions/archived/$', self.archive_view.as_view(),
+                name='paypal-payflow-archive'),
             url(r'^transactions/(?P<pk>\d+)/$', self.detail_view.as_view(),
                 name='paypal-payflow-detail'),
         )
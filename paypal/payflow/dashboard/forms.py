@@ -0,0 +1,21 @@
+from django import forms
+from django.utils.translation import ugettext_lazy as _
+
+from paypal.search import TransactionSearchForm
+
+
+class PayflowTransactionSearchForm(TransactionSearchForm):
+    identifier_fields = (
+        ('comment1', 'comment1'),
+        ('pnref', 'pnref'),
+    )
+
+    comment1 = forms.CharField(label=_("Order number"), required=False)
+    pnref = forms.CharField(label=_("PN reference"), required=False)
+    result = forms.CharField(label=_("Response code"), required=False)
+
+    def filter(self, queryset):
+        queryset = super(PayflowTransactionSearchForm, self).filter(queryset)
+        if self.cleaned_data.get('result'):
+            queryset = queryset.filter(result=self.cleaned_data['result'])
+        return queryset
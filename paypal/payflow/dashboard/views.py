@@ -6,14 +6,27 @@ from django.conf import settings
 from django import http
 from django.utils.translation import ugettext as _
 
+from paypal import archive, pagination, search
 from paypal.payflow import models
 from paypal.payflow import facade
+from paypal.payflow.dashboard import forms
 
 
-class TransactionListView(generic.ListView):
+class TransactionListView(search.TransactionSearchMixin,
+                          pagination.KeysetPaginationMixin,
+                          generic.ListView):
     model = models.PayflowTransaction
     template_name = 'paypal/payflow/transaction_list.html'
     context_object_name = 'transactions'
+    search_form_class = forms.PayflowTransactionSearchForm
+
+
+class ArchivedTransactionListView(archive.ArchiveListMixin,
+                                  generic.ListView):
+    model = models.PayflowTransaction
+    template_name = 'paypal/payflow/archived_transaction_list.html'
+    context_object_name = 'transactions'
+    paginate_by = 50
 
 
 class TransactionDetailView(generic.DetailView):
@@ -21,6 +34,9 @@ class TransactionDetailView(generic.DetailView):
     template_name = 'paypal/payflow/transaction_detail.html'
     context_object_name = 'txn'
 
+    def get_queryset(self):
+        return self.model.objects.with_payloads()
+
     def get_context_data(self, **kwargs):
         ctx = super(TransactionDetailView, self).get_context_data(**kwargs)
         ctx['show_form_buttons'] = getattr(
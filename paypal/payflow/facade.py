@@ -4,6 +4,7 @@ Bridging module between Oscar and the gateway module (which is Oscar agnostic)
 from __future__ import unicode_literals
 from oscar.apps.payment import exceptions
 
+from paypal import audit
 from paypal.payflow import gateway, models, codes
 
 
@@ -100,6 +101,7 @@ def delayed_capture(order_number, pnref=None, amt=None):
     if pnref is None:
         # No PNREF specified, look-up the auth transaction for this order number
         # to get the PNREF from there.
+        audit.flush()
         try:
             auth_txn = models.PayflowTransaction.objects.get(
                 comment1=order_number, trxtype=codes.AUTHORIZATION)
@@ -167,6 +169,7 @@ def credit(order_number, pnref=None, amt=None):
     if pnref is None:
         # No PNREF specified, look-up the auth/sale transaction for this order number
         # to get the PNREF from there.
+        audit.flush()
         try:
             auth_txn = models.PayflowTransaction.objects.get(
                 comment1=order_number, trxtype__in=(codes.AUTHORIZATION,
@@ -3,12 +3,15 @@ Gateway module - this module should be ignorant of Oscar and could be used in a
 non-Oscar project.  All Oscar-related functionality should be in the facade.
 """
 from __future__ import unicode_literals
+import functools
 import logging
+import uuid
 
 from django.conf import settings
 from django.core import exceptions
 
-from paypal import gateway
+from paypal import audit, gateway
+from paypal import exceptions as paypal_exceptions
 from paypal.payflow import models
 from paypal.payflow import codes
 
@@ -44,7 +47,13 @@ def _submit_payment_details(trxtype, order_number, card_number, cvv, expiry_date
     """
     Submit payment details to PayPal.
     """
-    params = {
+    return _transaction(_payment_details_params(
+        trxtype, order_number, card_number, cvv, expiry_date, amt, **kwargs))
+
+
+def _payment_details_params(trxtype, order_number, card_number, cvv,
+                            expiry_date, amt, **kwargs):
+    return {
         'TRXTYPE': trxtype,
         'TENDER': codes.BANKCARD,
         'AMT': amt,
@@ -66,7 +75,6 @@ def _submit_payment_details(trxtype, order_number, card_number, cvv, expiry_date
         'EMAIL': kwargs.get('user_email', ''),
         'PHONENUM': kwargs.get('billing_phone_number', ''),
     }
-    return _transaction(params)
 
 
 def delayed_capture(order_number, pnref, amt=None):
@@ -75,6 +83,10 @@ def delayed_capture(order_number, pnref, amt=None):
 
     This captures money that was previously authorised.
     """
+    return _transaction(_delayed_capture_params(order_number, pnref, amt))
+
+
+def _delayed_capture_params(order_number, pnref, amt=None):
     params = {
         'COMMENT1': order_number,
         'TRXTYPE': codes.DELAYED_CAPTURE,
@@ -82,7 +94,7 @@ def delayed_capture(order_number, pnref, amt=None):
     }
     if amt:
         params['AMT'] = amt
-    return _transaction(params)
+    return params
 
 
 def reference_transaction(order_number, pnref, amt):
@@ -91,7 +103,11 @@ def reference_transaction(order_number, pnref, amt):
 
     * The PNREF of the original txn is valid for 12 months
     """
-    params = {
+    return _transaction(_reference_transaction_params(order_number, pnref, amt))
+
+
+def _reference_transaction_params(order_number, pnref, amt):
+    return {
         'COMMENT1': order_number,
         # Use SALE as we are effectively authorising and settling a new
         # transaction
@@ -100,13 +116,16 @@ def reference_transaction(order_number, pnref, amt):
         'ORIGID': pnref,
         'AMT': amt,
     }
-    return _transaction(params)
 
 
 def credit(order_number, pnref, amt=None):
     """
     Refund money back to a bankcard.
     """
+    return _transaction(_credit_params(order_number, pnref, amt))
+
+
+def _credit_params(order_number, pnref, amt=None):
     params = {
         'COMMENT1': order_number,
         'TRXTYPE': codes.CREDIT,
@@ -114,19 +133,22 @@ def credit(order_number, pnref, amt=None):
     }
     if amt:
         params['AMT'] = amt
-    return _transaction(params)
+    return params
 
 
 def void(order_number, pnref):
     """
     Prevent a transaction from being settled
     """
-    params = {
+    return _transaction(_void_params(order_number, pnref))
+
+
+def _void_params(order_number, pnref):
+    return {
         'COMMENT1': order_number,
         'TRXTYPE': codes.VOID,
         'ORIGID': pnref
     }
-    return _transaction(params)
 
 
 def _transaction(extra_params):
@@ -136,6 +158,61 @@ def _transaction(extra_params):
     :extra_params: Additional parameters to include in the payload other than
     the user credentials.
     """
+    url, params, headers = _build_request(extra_params)
+    response = gateway.retry(
+        lambda: gateway.post(url, params, headers, length_tags=True),
+        idempotent=True)
+    return _record_response(params, response)
+
+
+def transaction_many(calls, max_workers=None):
+    """
+    Perform many transactions with PayPal concurrently, eg to capture a batch
+    of authorizations.
+
+    Return a list with a transaction object or PayPalError for each call, in
+    the same order as the calls.  The transactions are saved in bulk so they
+    won't have a primary key set on most databases.
+
+    :calls: List of dicts of parameters, as passed to ``_transaction``
+    :max_workers: The number of threads to use
+    """
+    requests = [_build_request(extra_params) for extra_params in calls]
+
+    def fetch(url, params, headers):
+        return gateway.retry(
+            lambda: gateway.post(url, params, headers, length_tags=True),
+            idempotent=True)
+    responses = gateway.run_many(
+        [functools.partial(fetch, *request) for request in requests],
+        max_workers)
+
+    results, rows = [], []
+    try:
+        for (url, params, headers), response in zip(requests, responses):
+            if isinstance(response, paypal_exceptions.PayPalError):
+                results.append(response)
+                continue
+            try:
+                txn = _build_txn(params, response)
+            except Exception:
+                logger.exception("Invalid response to %s from PayPal",
+                                 params['TRXTYPE'])
+                results.append(paypal_exceptions.PayPalError(
+                    "Invalid response from PayPal"))
+                continue
+            rows.append((txn, txn.trxtype, txn.is_approved))
+            results.append(txn)
+    finally:
+        # Calls that did go through are recorded whatever happens to the rest
+        audit.save_many(models.PayflowTransaction, rows)
+    return results
+
+
+def _build_request(extra_params):
+    """
+    Return the URL, full set of parameters and HTTP headers for a transaction.
+    """
     if 'TRXTYPE' not in extra_params:
         raise RuntimeError("All transactions must specify a 'TRXTYPE' paramter")
 
@@ -180,34 +257,59 @@ def _transaction(extra_params):
                                          'PAYPAL_PAYFLOW_CURRENCY', 'USD')
         params['AMT'] = "%.2f" % params['AMT']
 
-    if getattr(settings, 'PAYPAL_PAYFLOW_PRODUCTION_MODE', False):
+    if getattr(settings, 'PAYPAL_PAYFLOW_URL', None):
+        url = settings.PAYPAL_PAYFLOW_URL
+    elif getattr(settings, 'PAYPAL_PAYFLOW_PRODUCTION_MODE', False):
         url = 'https://payflowpro.paypal.com'
     else:
         url = 'https://pilot-payflowpro.paypal.com'
 
+    # PayPal use the request ID to spot duplicate submissions, returning the
+    # response of the original transaction rather than processing it again.
+    # This makes it safe to retry any transaction type.
+    headers = {'X-VPS-REQUEST-ID': uuid.uuid4().hex}
+
     logger.info("Performing %s transaction (trxtype=%s)",
                 codes.trxtype_map[trxtype], trxtype)
-    pairs = gateway.post(url, params)
+    return url, params, headers
 
+
+def _record_response(params, response):
+    """
+    Record the response from PayPal and return a transaction object.
+    """
+    txn = _build_txn(params, response)
+    audit.save(txn, txn.trxtype, txn.is_approved)
+    return txn
+
+
+def _build_txn(params, response):
+    """
+    Return an unsaved transaction object for a response from PayPal.
+    """
     # Beware - this log information will contain the Payflow credentials
     # only use it in development, not production.
-    logger.debug("Raw request: %s", pairs['_raw_request'])
-    logger.debug("Raw response: %s", pairs['_raw_response'])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw request: %s", response.raw_request)
+        logger.debug("Raw response: %s", response.raw_response)
 
-    return models.PayflowTransaction.objects.create(
+    pairs = response.pairs
+    txn = models.PayflowTransaction(
         comment1=params['COMMENT1'],
         trxtype=params['TRXTYPE'],
         tender=params.get('TENDER', None),
         amount=params.get('AMT', None),
-        pnref=pairs.get('PNREF', None),
+        pnref=response.pnref,
         ppref=pairs.get('PPREF', None),
         cvv2match=pairs.get('CVV2MATCH', None),
         avsaddr=pairs.get('AVSADDR', None),
         avszip=pairs.get('AVSZIP', None),
-        result=pairs.get('RESULT', None),
-        respmsg=pairs.get('RESPMSG', None),
+        result=response.result,
+        respmsg=response.respmsg,
         authcode=pairs.get('AUTHCODE', None),
-        raw_request=pairs['_raw_request'],
-        raw_response=pairs['_raw_response'],
-        response_time=pairs['_response_time']
+        raw_request=response.raw_request,
+        raw_response=response.raw_response,
+        response_time=response.response_time
     )
+    txn.record_timings(response.timings)
+    return txn
@@ -24,7 +24,7 @@ class PayflowTransaction(base.ResponseModel):
 
     # Response params
     pnref = models.CharField(_("Payflow transaction ID"), max_length=32,
-                             null=True)
+                             null=True, db_index=True)
     ppref = models.CharField(_("Payment transaction ID"), max_length=32,
                              unique=True, null=True)
     result = models.CharField(max_length=32, null=True, blank=True)
@@ -43,12 +43,29 @@ class PayflowTransaction(base.ResponseModel):
     class Meta:
         ordering = ('-date_created',)
         app_label = 'paypal'
+        # The facade looks up transactions by order number and type
+        index_together = (('comment1', 'trxtype', 'date_created'),)
 
     def save(self, *args, **kwargs):
+        self.hide_sensitive_data()
+        return super(PayflowTransaction, self).save(*args, **kwargs)
+
+    def hide_sensitive_data(self):
+        """
+        Mask the password and bankcard details in the raw request.  This is
+        called on save but needs calling explicitly when rows are created
+        with bulk_create.
+        """
         self.raw_request = re.sub(r'PWD=.+?&', 'PWD=XXXXXX&', self.raw_request)
+        # A length-tagged password can contain '&' so is masked by its length
+        match = re.search(r'PWD\[(\d+)\]=', self.raw_request)
+        if match:
+            rest = self.raw_request[match.end():].encode('utf-8')
+            self.raw_request = '%sPWD=XXXXXX%s' % (
+                self.raw_request[:match.start()],
+                rest[int(match.group(1)):].decode('utf-8'))
         self.raw_request = re.sub(r'ACCT=\d+(\d{4})&', 'ACCT=XXXXXXXXXXXX\1&', self.raw_request)
         self.raw_request = re.sub(r'CVV2=\d+&', 'CVV2=XXX&', self.raw_request)
-        return super(PayflowTransaction, self).save(*args, **kwargs)
 
     def get_trxtype_display(self):
         return ugettext(codes.trxtype_map.get(self.trxtype, self.trxtype))
@@ -0,0 +1,147 @@
+"""
+Search of the transaction dashboards.
+
+Each search is kept to an index.  Identifiers (tokens, references, order
+numbers and emails) are matched exactly, which their indexes serve, or by
+substring once the trigram indexes of the ``paypal_create_search_indexes``
+command exist and ``PAYPAL_DASHBOARD_TRIGRAM_SEARCH`` is set.  Searches
+without an identifier are limited to a range of ``date_created``, which is
+also indexed: the last ``PAYPAL_DASHBOARD_SEARCH_DAYS`` days unless a range
+is given, and never more than ``PAYPAL_DASHBOARD_MAX_SEARCH_DAYS`` days.
+"""
+from __future__ import unicode_literals
+import datetime
+
+from django import forms
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+# Number of days searched when no identifier or date range is given, and the
+# longest date range that can be searched
+DEFAULT_SEARCH_DAYS = 30
+DEFAULT_MAX_SEARCH_DAYS = 366
+
+# Shortest substring that a trigram index can serve
+TRIGRAM_MIN_LENGTH = 3
+
+# Lookup used for substring searches.  PostgreSQL compiles it to
+# UPPER("col"::text) LIKE UPPER(%s), so the trigram indexes are built on the
+# same expression (see trigram_index_expression).
+TRIGRAM_LOOKUP = 'icontains'
+
+
+def _trigram_search():
+    return getattr(settings, 'PAYPAL_DASHBOARD_TRIGRAM_SEARCH', False)
+
+
+def trigram_index_expression(ops, column):
+    """
+    Return the expression that a trigram index on a column must be built
+    on to serve ``TRIGRAM_LOOKUP`` searches
+
+    :ops: The database backend's operations (``connection.ops``)
+    """
+    return ops.lookup_cast(TRIGRAM_LOOKUP) % ops.quote_name(column)
+
+
+def _start_of_day(date):
+    value = datetime.datetime.combine(date, datetime.time.min)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_current_timezone())
+    return value
+
+
+class TransactionSearchForm(forms.Form):
+    """
+    Base form for searching transactions.  Subclasses add a form field for
+    each identifier and list them in ``identifier_fields``, and may add other
+    filters by overriding ``filter``.
+    """
+    # (form field, model field) pairs of the identifiers that are searched
+    identifier_fields = ()
+
+    amount_from = forms.DecimalField(label=_("Amount from"), required=False,
+                                     decimal_places=2)
+    amount_to = forms.DecimalField(label=_("Amount to"), required=False,
+                                   decimal_places=2)
+    date_from = forms.DateField(label=_("Date from"), required=False)
+    date_to = forms.DateField(label=_("Date to"), required=False)
+
+    def clean(self):
+        data = super(TransactionSearchForm, self).clean()
+        identifiers = [data.get(name) for name, field
+                       in self.identifier_fields if data.get(name)]
+        if _trigram_search() and any(
+                len(value) < TRIGRAM_MIN_LENGTH for value in identifiers):
+            raise forms.ValidationError(
+                _("Search for at least %d characters") % TRIGRAM_MIN_LENGTH)
+
+        date_from, date_to = data.get('date_from'), data.get('date_to')
+        if not identifiers:
+            # Without an identifier the date range bounds the search
+            if date_to is None:
+                date_to = timezone.now().date()
+            if date_from is None:
+                date_from = date_to - datetime.timedelta(days=getattr(
+                    settings, 'PAYPAL_DASHBOARD_SEARCH_DAYS',
+                    DEFAULT_SEARCH_DAYS))
+        if date_from is not None and date_to is not None:
+            if date_from > date_to:
+                raise forms.ValidationError(
+                    _("The start date is after the end date"))
+            max_days = getattr(settings, 'PAYPAL_DASHBOARD_MAX_SEARCH_DAYS',
+                               DEFAULT_MAX_SEARCH_DAYS)
+            if (date_to - date_from).days > max_days:
+                raise forms.ValidationError(
+                    _("Search at most %d days at a time") % max_days)
+        data['date_from'], data['date_to'] = date_from, date_to
+        return data
+
+    def filter(self, queryset):
+        """
+        Return the queryset filtered by the search
+        """
+        data = self.cleaned_data
+        lookup = TRIGRAM_LOOKUP if _trigram_search() else 'exact'
+        for name, field in self.identifier_fields:
+            if data.get(name):
+                queryset = queryset.filter(
+                    **{'%s__%s' % (field, lookup): data[name]})
+        if data.get('amount_from') is not None:
+            queryset = queryset.filter(amount__gte=data['amount_from'])
+        if data.get('amount_to') is not None:
+            queryset = queryset.filter(amount__lte=data['amount_to'])
+        if data.get('date_from') is not None:
+            queryset = queryset.filter(
+                date_created__gte=_start_of_day(data['date_from']))
+        if data.get('date_to') is not None:
+            queryset = queryset.filter(date_created__lt=_start_of_day(
+                data['date_to'] + datetime.timedelta(days=1)))
+        return queryset
+
+
+class TransactionSearchMixin(object):
+    """
+    Mixin for list views of transactions that filters them by
+    ``search_form_class``, a ``TransactionSearchForm``, when any of its
+    fields are in the query string.  The form is in the context as
+    ``search_form``.
+    """
+    search_form_class = None
+
+    def get_queryset(self):
+        queryset = super(TransactionSearchMixin, self).get_queryset()
+        params = self.request.GET
+        if any(name in params for name in self.search_form_class.base_fields):
+            self.search_form = self.search_form_class(params)
+            if not self.search_form.is_valid():
+                return queryset.none()
+            return self.search_form.filter(queryset)
+        self.search_form = self.search_form_class()
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        ctx = super(TransactionSearchMixin, self).get_context_data(**kwargs)
+        ctx['search_form'] = self.search_form
+        return ctx
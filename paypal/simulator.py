@@ -0,0 +1,618 @@
+"""
+A local simulator of PayPal's Express (NVP) and Payflow APIs.
+
+The simulator answers the calls made by ``paypal.express.gateway`` and
+``paypal.payflow.gateway`` without any network access, keeping tokens,
+transactions and PNREFs in memory so that whole checkouts (including the
+redirect to PayPal and back) can be driven against it.  Response latency can
+be drawn from a distribution and error codes injected with a given
+probability, per method, to approximate production behaviour under load.
+
+Run it with the ``paypal_simulator`` management command and point the
+gateway at it with the ``PAYPAL_API_URL``, ``PAYPAL_EXPRESS_URL`` and
+``PAYPAL_PAYFLOW_URL`` settings, or use ``SimulatorTransport`` to call it
+in-process.
+"""
+from __future__ import unicode_literals
+from decimal import Decimal as D, InvalidOperation
+import collections
+import datetime
+import random
+import string
+import threading
+import time
+
+from django.utils import six
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib.parse import urlencode, urlparse, parse_qs
+
+from paypal import exceptions, nvp, transport
+from paypal.payflow import codes
+
+# Express error codes and their long messages
+EXPRESS_ERRORS = {
+    '10001': "Internal Error",
+    '10002': "Security header is not valid",
+    '10004': "Transaction id is invalid",
+    '10009': "The partial refund amount must be less than or equal to the "
+             "remaining amount",
+    '10400': "Order total is missing",
+    '10410': "Invalid token",
+    '10415': "A successful transaction has already been completed for this "
+             "token",
+    '10417': "Instruct the customer to retry the transaction using an "
+             "alternative payment method",
+    '10445': "This transaction cannot be processed at this time",
+    '10471': "ReturnURL is missing",
+    '10472': "CancelURL is missing",
+    '10486': "This transaction couldn't be completed",
+    '10602': "Authorization has already been completed",
+    '10609': "Transaction id is invalid",
+    '81002': "Unspecified Method",
+}
+
+# Payflow RESULT codes and their messages
+PAYFLOW_RESULTS = {
+    '0': "Approved",
+    '1': "User authentication failed",
+    '4': "Invalid amount",
+    '7': "Field format error",
+    '12': "Declined",
+    '19': "Original transaction ID not found",
+    '23': "Invalid account number",
+    '24': "Invalid expiration date",
+    '105': "Credit error",
+    '108': "Void error",
+    '111': "Capture error",
+    '126': "Under review by Fraud Service",
+}
+
+# Number of Payflow responses kept for replaying duplicate submissions
+REQUEST_ID_CACHE_SIZE = 10000
+
+# Details of the simulated buyer
+BUYER = {
+    'EMAIL': 'buyer@example.com',
+    'PAYERSTATUS': 'verified',
+    'FIRSTNAME': 'Sam',
+    'LASTNAME': 'Buyer',
+    'COUNTRYCODE': 'GB',
+    'SHIPTONAME': 'Sam Buyer',
+    'SHIPTOSTREET': '1 Main Street',
+    'SHIPTOCITY': 'London',
+    'SHIPTOZIP': 'N1 9ET',
+    'SHIPTOCOUNTRYCODE': 'GB',
+    'SHIPTOCOUNTRYNAME': 'United Kingdom',
+    'ADDRESSSTATUS': 'Confirmed',
+}
+
+
+def parse_latency(spec, rng=None):
+    """
+    Return a function that returns a latency in seconds for the passed
+    spec, drawn from ``rng`` (a ``random.Random``) if given.  All times are
+    in milliseconds:
+
+    * ``'200'`` - a fixed latency
+    * ``'uniform:100,300'`` - uniformly distributed between two bounds
+    * ``'normal:200,50'`` - normally distributed with a mean and deviation
+    * ``'lognormal:200,0.5'`` - log-normally distributed with a median and
+      shape, which gives the long tail that real services have
+    * ``'exponential:200'`` - exponentially distributed with a mean
+    """
+    spec = spec.strip()
+    if ':' in spec:
+        name, args = spec.split(':', 1)
+        args = [float(arg) for arg in args.split(',')]
+    else:
+        name, args = 'fixed', [float(spec)]
+    if rng is None:
+        rng = random.Random()
+    samplers = {
+        'fixed': lambda ms: ms,
+        'uniform': rng.uniform,
+        'normal': rng.gauss,
+        'lognormal': lambda median, sigma: rng.lognormvariate(
+            0, sigma) * median,
+        'exponential': lambda mean: rng.expovariate(1.0 / mean),
+    }
+    if name not in samplers:
+        raise ValueError("Unknown latency distribution '%s'" % name)
+    sampler = samplers[name]
+    sampler(*args)
+    return lambda: max(sampler(*args), 0) / 1000.0
+
+
+def parse_errors(specs):
+    """
+    Return a dict of method to a list of (code, probability) tuples for specs
+    of the form ``'DoCapture=10001:0.05'``.  Payflow transaction types are
+    given by their TRXTYPE, eg ``'S=12:0.1'``.
+    """
+    errors = collections.defaultdict(list)
+    for spec in specs:
+        method, rest = spec.split('=', 1)
+        code, probability = rest.split(':', 1)
+        errors[method.strip()].append((code.strip(), float(probability)))
+    return dict(errors)
+
+
+def _timestamp():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _amount(value):
+    try:
+        return D(value).quantize(D('0.01'))
+    except (InvalidOperation, TypeError):
+        return None
+
+
+class Simulator(object):
+    """
+    In-memory simulation of the Express and Payflow APIs.
+
+    :latency: Dict of method (or TRXTYPE) to latency spec (see
+              ``parse_latency``).  The ``'default'`` key applies to methods
+              without their own spec.
+    :errors: Dict of method (or TRXTYPE) to a list of (code, probability)
+             tuples of errors to return instead of processing the call.
+    :seed: Seed for the latencies, injected errors and IDs, so that a run
+           can be repeated
+    """
+
+    def __init__(self, latency=None, errors=None, seed=None):
+        self.random = random.Random(seed)
+        self.latency = dict((method, parse_latency(spec, self.random))
+                            for method, spec in (latency or {}).items())
+        self.errors = errors or {}
+        self.tokens = {}
+        self.transactions = {}
+        self.pnrefs = {}
+        self.responses = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _random_id(self, length, prefix=''):
+        chars = string.ascii_uppercase + string.digits
+        return prefix + ''.join(
+            self.random.choice(chars) for __ in range(length))
+
+    # Entry points
+
+    def post(self, body, headers=None):
+        """
+        Handle an API call and return the response body as bytes
+        """
+        params = nvp.decode(body)
+        if 'TRXTYPE' in params:
+            method = params['TRXTYPE']
+        else:
+            method = params.get('METHOD')
+        self._sleep(method)
+        if 'TRXTYPE' in params:
+            request_id = (headers or {}).get('X-VPS-REQUEST-ID')
+            pairs = self._payflow(params, request_id)
+        else:
+            pairs = self._express(params)
+        return nvp.encode(pairs, length_tags='TRXTYPE' in params)
+
+    def approve(self, token):
+        """
+        Simulate the buyer approving the payment on PayPal's site.  Return
+        the URL to redirect the buyer to, or None if the token is unknown.
+        """
+        with self.lock:
+            checkout = self.tokens.get(token)
+            if checkout is None:
+                return None
+            if not checkout.get('PAYERID'):
+                checkout['PAYERID'] = self._random_id(13)
+            url = checkout['params']['RETURNURL']
+            payer_id = checkout['PAYERID']
+        separator = '&' if '?' in url else '?'
+        return '%s%s%s' % (url, separator, urlencode(
+            [('token', token), ('PayerID', payer_id)]))
+
+    def __call__(self, environ, start_response):
+        """
+        WSGI interface: POSTs are API calls and GETs to ``/webscr`` are the
+        buyer's redirect to PayPal.
+        """
+        if environ['REQUEST_METHOD'] == 'POST':
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = self.post(environ['wsgi.input'].read(length), {
+                'X-VPS-REQUEST-ID': environ.get('HTTP_X_VPS_REQUEST_ID')})
+            start_response(str('200 OK'), [
+                (str('Content-Type'), str('text/plain')),
+                (str('Content-Length'), str(len(body)))])
+            return [body]
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        url = self.approve(query.get('token', [''])[0])
+        if url is None:
+            start_response(str('404 Not Found'),
+                           [(str('Content-Type'), str('text/plain'))])
+            return [b'Unknown token']
+        start_response(str('302 Found'), [(str('Location'), str(url))])
+        return [b'']
+
+    # Helpers
+
+    def _sleep(self, method):
+        latency = self.latency.get(method, self.latency.get('default'))
+        if latency:
+            time.sleep(latency())
+
+    def _injected_error(self, method):
+        for code, probability in self.errors.get(method, ()):
+            if self.random.random() < probability:
+                return code
+
+    # Express
+
+    def _express(self, params):
+        method = params.get('METHOD')
+        handler = {
+            'SetExpressCheckout': self._set_express_checkout,
+            'GetExpressCheckoutDetails': self._get_express_checkout_details,
+            'DoExpressCheckoutPayment': self._do_express_checkout_payment,
+            'DoCapture': self._do_capture,
+            'DoVoid': self._do_void,
+            'RefundTransaction': self._refund_transaction,
+        }.get(method)
+        code = self._injected_error(method)
+        if handler is None:
+            code = '81002'
+        if code:
+            pairs = self._express_error(code)
+        else:
+            with self.lock:
+                pairs = handler(params)
+        pairs.update({
+            'TIMESTAMP': _timestamp(),
+            'CORRELATIONID': self._random_id(13).lower(),
+            'VERSION': params.get('VERSION', ''),
+            'BUILD': '1',
+        })
+        if 'TOKEN' in params and 'TOKEN' not in pairs:
+            pairs['TOKEN'] = params['TOKEN']
+        return pairs
+
+    def _express_error(self, code):
+        message = EXPRESS_ERRORS.get(code, "Error")
+        return {
+            'ACK': 'Failure',
+            'L_ERRORCODE0': code,
+            'L_SHORTMESSAGE0': message,
+            'L_LONGMESSAGE0': message,
+            'L_SEVERITYCODE0': 'Error',
+        }
+
+    def _set_express_checkout(self, params):
+        if _amount(params.get('PAYMENTREQUEST_0_AMT')) is None:
+            return self._express_error('10400')
+        if 'RETURNURL' not in params:
+            return self._express_error('10471')
+        if 'CANCELURL' not in params:
+            return self._express_error('10472')
+        token = self._random_id(17, 'EC-')
+        self.tokens[token] = {'params': params, 'PAYERID': None,
+                              'transaction_id': None}
+        return {'ACK': 'Success', 'TOKEN': token}
+
+    def _get_express_checkout_details(self, params):
+        checkout = self.tokens.get(params.get('TOKEN'))
+        if checkout is None:
+            return self._express_error('10410')
+        set_params = checkout['params']
+        pairs = dict(BUYER)
+        # Echo back the payment request, as PayPal do
+        for key, value in set_params.items():
+            if key.startswith(('PAYMENTREQUEST_0_', 'L_PAYMENTREQUEST_0_',
+                               'SHIPTO')):
+                pairs[key] = value
+        for key in ('NAME', 'STREET', 'CITY', 'ZIP', 'COUNTRYCODE'):
+            pairs.setdefault('PAYMENTREQUEST_0_SHIPTO%s' % key,
+                             pairs['SHIPTO%s' % key])
+        if 'L_SHIPPINGOPTIONNAME0' in set_params:
+            pairs['SHIPPINGOPTIONNAME'] = set_params['L_SHIPPINGOPTIONNAME0']
+            pairs['SHIPPINGOPTIONAMOUNT'] = set_params.get(
+                'L_SHIPPINGOPTIONAMOUNT0', '0.00')
+        pairs.update({
+            'ACK': 'Success',
+            'CHECKOUTSTATUS': ('PaymentActionCompleted'
+                               if checkout['transaction_id'] else
+                               'PaymentActionNotInitiated'),
+            'AMT': set_params['PAYMENTREQUEST_0_AMT'],
+            'CURRENCYCODE': set_params.get('PAYMENTREQUEST_0_CURRENCYCODE',
+                                           'USD'),
+        })
+        if checkout['PAYERID']:
+            pairs['PAYERID'] = checkout['PAYERID']
+        return pairs
+
+    def _do_express_checkout_payment(self, params):
+        checkout = self.tokens.get(params.get('TOKEN'))
+        if checkout is None:
+            return self._express_error('10410')
+        if checkout['transaction_id']:
+            return self._express_error('10415')
+        amount = _amount(params.get('PAYMENTREQUEST_0_AMT'))
+        if amount is None:
+            return self._express_error('10400')
+        action = params.get('PAYMENTREQUEST_0_PAYMENTACTION', 'Sale')
+        transaction_id = self._random_id(17)
+        checkout['transaction_id'] = transaction_id
+        self.transactions[transaction_id] = {
+            'amount': amount,
+            'currency': params.get('PAYMENTREQUEST_0_CURRENCYCODE', 'USD'),
+            'status': 'Completed' if action == 'Sale' else 'Pending',
+            'refunded': D('0.00'),
+        }
+        pairs = {
+            'ACK': 'Success',
+            'PAYMENTINFO_0_TRANSACTIONID': transaction_id,
+            'PAYMENTINFO_0_TRANSACTIONTYPE': 'expresscheckout',
+            'PAYMENTINFO_0_PAYMENTTYPE': 'instant',
+            'PAYMENTINFO_0_ORDERTIME': _timestamp(),
+            'PAYMENTINFO_0_AMT': six.text_type(amount),
+            'PAYMENTINFO_0_CURRENCYCODE': params.get(
+                'PAYMENTREQUEST_0_CURRENCYCODE', 'USD'),
+            'PAYMENTINFO_0_PAYMENTSTATUS': (
+                'Completed' if action == 'Sale' else 'Pending'),
+            'PAYMENTINFO_0_PENDINGREASON': (
+                'None' if action == 'Sale' else 'authorization'),
+            'PAYMENTINFO_0_REASONCODE': 'None',
+            'PAYMENTINFO_0_ERRORCODE': '0',
+            'PAYMENTINFO_0_ACK': 'Success',
+        }
+        return pairs
+
+    def _authorization(self, params):
+        """
+        Return the pending authorization for a capture or void, or an error
+        """
+        authorization = self.transactions.get(params.get('AUTHORIZATIONID'))
+        if authorization is None:
+            return None, self._express_error('10609')
+        if authorization['status'] != 'Pending':
+            return None, self._express_error('10602')
+        return authorization, None
+
+    def _do_capture(self, params):
+        authorization, error = self._authorization(params)
+        if error:
+            return error
+        amount = _amount(params.get('AMT')) or authorization['amount']
+        authorization['status'] = 'Completed'
+        transaction_id = self._random_id(17)
+        self.transactions[transaction_id] = {
+            'amount': amount,
+            'currency': authorization['currency'],
+            'status': 'Completed',
+            'refunded': D('0.00'),
+        }
+        return {
+            'ACK': 'Success',
+            'AUTHORIZATIONID': params['AUTHORIZATIONID'],
+            'TRANSACTIONID': transaction_id,
+            'PARENTTRANSACTIONID': params['AUTHORIZATIONID'],
+            'AMT': six.text_type(amount),
+            'CURRENCYCODE': authorization['currency'],
+            'PAYMENTSTATUS': 'Completed',
+            'PENDINGREASON': 'None',
+        }
+
+    def _do_void(self, params):
+        authorization, error = self._authorization(params)
+        if error:
+            return error
+        authorization['status'] = 'Voided'
+        return {'ACK': 'Success',
+                'AUTHORIZATIONID': params['AUTHORIZATIONID']}
+
+    def _refund_transaction(self, params):
+        txn = self.transactions.get(params.get('TRANSACTIONID'))
+        if txn is None or txn['status'] != 'Completed':
+            return self._express_error('10004')
+        remaining = txn['amount'] - txn['refunded']
+        if params.get('REFUNDTYPE') == 'Partial':
+            amount = _amount(params.get('AMT'))
+        else:
+            amount = remaining
+        if amount is None or amount <= 0 or amount > remaining:
+            return self._express_error('10009')
+        txn['refunded'] += amount
+        return {
+            'ACK': 'Success',
+            'REFUNDTRANSACTIONID': self._random_id(17),
+            'FEEREFUNDAMT': '0.00',
+            'GROSSREFUNDAMT': six.text_type(amount),
+            'NETREFUNDAMT': six.text_type(amount),
+            'TOTALREFUNDEDAMOUNT': six.text_type(txn['refunded']),
+            'CURRENCYCODE': txn['currency'],
+            'REFUNDSTATUS': 'Instant',
+            'PENDINGREASON': 'None',
+        }
+
+    # Payflow
+
+    def _payflow(self, params, request_id=None):
+        with self.lock:
+            # PayPal return the original response for a duplicate request ID
+            if request_id and request_id in self.responses:
+                return self.responses[request_id]
+            code = self._injected_error(params['TRXTYPE'])
+            if code:
+                pairs = self._payflow_result(code)
+            else:
+                pairs = self._payflow_transaction(params)
+            if request_id:
+                self.responses[request_id] = pairs
+                if len(self.responses) > REQUEST_ID_CACHE_SIZE:
+                    self.responses.popitem(last=False)
+        return pairs
+
+    def _payflow_result(self, code, **extra):
+        pairs = {'RESULT': code,
+                 'RESPMSG': PAYFLOW_RESULTS.get(code, "Error"),
+                 'PNREF': self._random_id(12)}
+        pairs.update(extra)
+        return pairs
+
+    def _payflow_transaction(self, params):
+        trxtype = params['TRXTYPE']
+        origin = None
+        if 'ORIGID' in params:
+            origin = self.pnrefs.get(params['ORIGID'])
+            if origin is None:
+                return self._payflow_result('19')
+
+        if trxtype in (codes.SALE, codes.AUTHORIZATION):
+            amount = _amount(params.get('AMT'))
+            if amount is None or amount <= 0:
+                return self._payflow_result('4')
+            if origin is None:
+                error = self._check_card(params)
+                if error:
+                    return self._payflow_result(error)
+            status = 'settled' if trxtype == codes.SALE else 'authorized'
+        elif trxtype == codes.DELAYED_CAPTURE:
+            if origin is None or origin['status'] != 'authorized':
+                return self._payflow_result('111')
+            amount = _amount(params.get('AMT')) or origin['amount']
+            origin['status'] = 'captured'
+            status = 'settled'
+        elif trxtype == codes.CREDIT:
+            if origin is None or origin['status'] != 'settled':
+                return self._payflow_result('105')
+            amount = (_amount(params.get('AMT')) or
+                      origin['amount'] - origin['credited'])
+            if amount <= 0 or amount > origin['amount'] - origin['credited']:
+                return self._payflow_result('105')
+            origin['credited'] += amount
+            status = 'credit'
+        elif trxtype == codes.VOID:
+            if origin is None or origin['status'] not in ('authorized',
+                                                          'settled'):
+                return self._payflow_result('108')
+            amount = origin['amount']
+            origin['status'] = 'voided'
+            status = 'void'
+        else:
+            return self._payflow_result('7')
+
+        pnref = self._random_id(12)
+        self.pnrefs[pnref] = {'trxtype': trxtype, 'amount': amount,
+                              'status': status, 'credited': D('0.00')}
+        extra = {}
+        if trxtype in (codes.SALE, codes.AUTHORIZATION):
+            extra = {'AUTHCODE': self._random_id(6), 'AVSADDR': 'Y',
+                     'AVSZIP': 'Y', 'CVV2MATCH': 'Y'}
+        return dict(self._payflow_result('0', **extra), PNREF=pnref)
+
+    def _check_card(self, params):
+        """
+        Return the RESULT code for an invalid card number or expiry date
+        """
+        number = params.get('ACCT', '')
+        if not number.isdigit() or not _luhn_valid(number):
+            return '23'
+        expiry = params.get('EXPDATE', '')
+        if len(expiry) != 4 or not expiry.isdigit():
+            return '24'
+        today = datetime.date.today()
+        if (2000 + int(expiry[2:]), int(expiry[:2])) < (today.year,
+                                                         today.month):
+            return '24'
+
+
+def _luhn_valid(number):
+    digits = [int(digit) for digit in reversed(number)]
+    total = sum(digits[0::2])
+    for digit in digits[1::2]:
+        total += sum(divmod(digit * 2, 10))
+    return total % 10 == 0
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep connections alive, as they would
+    # with PayPal
+    protocol_version = str('HTTP/1.1')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.server.simulator.post(self.rfile.read(length), {
+            'X-VPS-REQUEST-ID': self.headers.get('X-VPS-REQUEST-ID')})
+        self._respond(200, body, 'text/plain')
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = self.server.simulator.approve(query.get('token', [''])[0])
+        if url is None:
+            self._respond(404, b'Unknown token', 'text/plain')
+        else:
+            self._respond(302, b'', 'text/plain', Location=url)
+
+    def _respond(self, status, body, content_type, **headers):
+        self.send_response(status)
+        headers['Content-Type'] = content_type
+        headers['Content-Length'] = len(body)
+        for name, value in headers.items():
+            self.send_header(str(name), str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class SimulatorServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Threaded HTTP server for a ``Simulator``
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, simulator, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _RequestHandler)
+        self.simulator = simulator
+        self.verbose = verbose
+
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator():
+    """
+    Return the process-wide simulator used by ``SimulatorTransport``, which
+    is configured by the ``PAYPAL_SIMULATOR_LATENCY``,
+    ``PAYPAL_SIMULATOR_ERRORS`` and ``PAYPAL_SIMULATOR_SEED`` settings.
+    """
+    global _simulator
+    if _simulator is None:
+        from django.conf import settings
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = Simulator(
+                    latency=getattr(settings, 'PAYPAL_SIMULATOR_LATENCY',
+                                    None),
+                    errors=getattr(settings, 'PAYPAL_SIMULATOR_ERRORS', None),
+                    seed=getattr(settings, 'PAYPAL_SIMULATOR_SEED', None))
+    return _simulator
+
+
+class SimulatorTransport(transport.Transport):
+    """
+    Transport that answers calls from an in-process simulator rather than
+    sending them anywhere.
+    """
+
+    def post(self, url, body, headers, timeout, timings):
+        try:
+            return 200, get_simulator().post(body, headers)
+        except Exception as e:
+            raise exceptions.TransportError(e)
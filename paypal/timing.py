@@ -0,0 +1,143 @@
+"""
+Per-phase timings of gateway calls.
+
+The wall-clock response time of a call covers everything from waiting for a
+pooled connection to decoding the response.  To tell whether a slow call was
+slow on our side or PayPal's, the gateway also records how long each phase
+took, in milliseconds:
+
+* ``pool_wait`` - waiting for a connection from the pool
+* ``connect`` - DNS lookup and TCP connect (only when a new connection is
+  made)
+* ``tls`` - the TLS handshake (only when a new connection is made)
+* ``first_byte`` - from sending the request to receiving the response
+  headers, which is mostly PayPal's processing time
+* ``read`` - reading the response body
+* ``decode`` - decoding the NVP response
+"""
+from __future__ import unicode_literals
+from contextlib import contextmanager
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import (
+    HTTPConnection, HTTPSConnection)
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool, HTTPSConnectionPool)
+
+PHASES = ('pool_wait', 'connect', 'tls', 'first_byte', 'read', 'decode')
+
+_local = threading.local()
+
+
+@contextmanager
+def collect(timings=None):
+    """
+    Collect the timings of the phases run by this thread within the block
+    into a dict, which can be passed in.
+    """
+    if timings is None:
+        timings = {}
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = None
+
+
+def record(phase, start_time, timings=None):
+    """
+    Record the time since ``start_time`` against the phase, in the passed
+    dict or else the one being collected by this thread.
+    """
+    if timings is None:
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return
+    elapsed = (time.time() - start_time) * 1000.0
+    timings[phase] = timings.get(phase, 0) + elapsed
+
+
+class TimedHTTPConnection(HTTPConnection):
+
+    def _new_conn(self):
+        start_time = time.time()
+        try:
+            return super(TimedHTTPConnection, self)._new_conn()
+        finally:
+            record('connect', start_time)
+
+    def getresponse(self, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return super(TimedHTTPConnection, self).getresponse(
+                *args, **kwargs)
+        finally:
+            record('first_byte', start_time)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+
+    def _new_conn(self):
+        start_time = time.time()
+        try:
+            return super(TimedHTTPSConnection, self)._new_conn()
+        finally:
+            record('connect', start_time)
+
+    def connect(self):
+        # The handshake is whatever connecting takes beyond the TCP connect
+        timings = getattr(_local, 'timings', None)
+        connect_time = timings.get('connect', 0) if timings else 0
+        start_time = time.time()
+        super(TimedHTTPSConnection, self).connect()
+        if timings is not None:
+            record('tls', start_time, timings)
+            timings['tls'] -= timings.get('connect', 0) - connect_time
+
+    def getresponse(self, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return super(TimedHTTPSConnection, self).getresponse(
+                *args, **kwargs)
+        finally:
+            record('first_byte', start_time)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+    def _get_conn(self, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return super(TimedHTTPConnectionPool, self)._get_conn(
+                *args, **kwargs)
+        finally:
+            record('pool_wait', start_time)
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+    def _get_conn(self, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return super(TimedHTTPSConnectionPool, self)._get_conn(
+                *args, **kwargs)
+        finally:
+            record('pool_wait', start_time)
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Adapter whose connections record the time spent in each phase of a
+    request.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,112 @@
+"""
+Transports that carry encoded requests to PayPal and bring back the response.
+
+The gateway modules build, encode and record calls but leave the I/O to a
+transport, chosen with the ``PAYPAL_TRANSPORT`` setting (and
+``PAYPAL_ASYNC_TRANSPORT`` for the asynchronous API).  This makes it
+possible to change how requests are sent, or to not send them at all, without
+touching the API modules.
+"""
+from __future__ import unicode_literals
+import time
+
+import requests
+from requests.packages.urllib3 import exceptions as urllib3_exceptions
+
+from paypal import exceptions, gateway, timing
+
+
+class Transport(object):
+    """
+    Base class for transports.  Subclasses must be safe to share between
+    threads, as one instance is used by the whole process.
+    """
+
+    def post(self, url, body, headers, timeout, timings):
+        """
+        Send a POST request and return a ``(status_code, content)`` tuple,
+        where ``content`` is the response body as bytes.  Raise a
+        ``TransportError`` if PayPal can't be reached.
+
+        :url: URL to post to
+        :body: Request body as bytes
+        :headers: Dict of HTTP headers to send
+        :timeout: Tuple of (connect, read) timeouts in seconds
+        :timings: Dict to record phase timings in (see ``paypal.timing``)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release any connections held by the transport.
+        """
+
+
+class AsyncTransport(object):
+    """
+    Base class for transports used by the asynchronous API.  ``post`` takes
+    the same arguments as ``Transport.post`` but is a coroutine.
+    """
+
+    def post(self, url, body, headers, timeout, timings):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Coroutine that releases any connections held by the transport.
+        """
+        raise NotImplementedError
+
+
+# Largest number of bytes read at a time while a deadline is set
+READ_CHUNK_SIZE = 1024
+
+
+def read_body(response):
+    """
+    Return the body of a streamed ``requests`` response.  If a deadline is
+    set, raise a ``TransportError`` once it passes rather than wait for the
+    rest of a body that is arriving slowly.
+    """
+    if gateway.time_remaining() is None:
+        return response.content
+    raw = response.raw
+    if hasattr(raw, 'read1'):
+        # urllib3 2+ returns whatever has arrived, so each check of the
+        # deadline waits for at most one read
+        chunks = iter(lambda: raw.read1(READ_CHUNK_SIZE, decode_content=True),
+                      b'')
+    else:
+        chunks = raw.stream(READ_CHUNK_SIZE, decode_content=True)
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        if gateway.time_remaining() <= 0:
+            response.close()
+            raise exceptions.TransportError(
+                "Deadline exceeded while reading the response")
+    return b''.join(content)
+
+
+class RequestsTransport(Transport):
+    """
+    Transport that uses ``requests`` with a pool of keep-alive connections
+    per endpoint.  This is the default.
+    """
+
+    def post(self, url, body, headers, timeout, timings):
+        try:
+            with timing.collect(timings):
+                response = gateway.get_pool(url).post(
+                    url, body, timeout=timeout, headers=headers, stream=True)
+                read_start = time.time()
+                content = read_body(response)
+                timing.record('read', read_start)
+        except (requests.RequestException, urllib3_exceptions.HTTPError) as e:
+            # urllib3's errors are only wrapped by requests when it reads the
+            # body itself
+            raise exceptions.TransportError(e)
+        return response.status_code, content
+
+    def close(self):
+        gateway.close_pools()
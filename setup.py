@@ -23,7 +23,9 @@ setup(
         'requests>=1.0',
         'django-localflavor'],
     extras_require={
-        'oscar': ["django-oscar>=0.6"]
+        'oscar': ["django-oscar>=0.6"],
+        # paypal.aio and the express/payflow aio modules need Python 3.7+
+        'async': ["aiohttp>=3.3"],
     },
     # See http://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
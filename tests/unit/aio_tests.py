@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+from decimal import Decimal as D
+import time
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+import mock
+
+try:
+    import asyncio
+    from paypal import aio
+    from paypal.express import aio as express_aio
+    from paypal.payflow import aio as payflow_aio
+except (ImportError, SyntaxError):
+    # Python < 3.7 or aiohttp isn't installed
+    aio = express_aio = payflow_aio = None
+
+from paypal import exceptions, transport
+from paypal.gateway import Response
+
+
+def run_inline(func, *args, **kwargs):
+    return asyncio.sleep(0, result=func(*args, **kwargs))
+
+
+def returning(value):
+    return lambda *args, **kwargs: asyncio.sleep(0, result=value)
+
+
+class StubTransport(transport.AsyncTransport):
+    """
+    Returns (or raises) each of the passed responses in turn, after a delay
+    """
+
+    def __init__(self, responses, delay=0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.calls = 0
+
+    def post(self, url, body, headers, timeout, timings):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            future = asyncio.get_event_loop().create_future()
+            future.set_exception(response)
+            return future
+        return asyncio.sleep(self.delay, result=response)
+
+
+@skipIf(aio is None, "asyncio support is not available")
+@override_settings(PAYPAL_BREAKER_THRESHOLD=2)
+class TestAsyncPost(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self, stub):
+        with mock.patch('paypal.aio.get_transport', return_value=stub):
+            return asyncio.run(aio.async_post(
+                'http://example.com', {'METHOD': 'DoCapture'}))
+
+    def test_successful_call_returns_response(self):
+        stub = StubTransport([(200, b'ACK=Success')])
+        self.assertEqual('Success', self.post(stub)['ACK'])
+
+    def test_breaker_opens_after_threshold_failures(self):
+        stub = StubTransport([exceptions.TransportError(), (500, b'')])
+        for i in range(2):
+            with self.assertRaises(exceptions.PayPalError):
+                self.post(stub)
+        with self.assertRaises(exceptions.CircuitOpenError):
+            self.post(stub)
+        self.assertEqual(2, stub.calls)
+
+    def test_transport_errors_are_retried(self):
+        stub = StubTransport([exceptions.TransportError(),
+                              (200, b'ACK=Success')])
+        with mock.patch('paypal.aio.get_transport', return_value=stub), \
+                mock.patch('paypal.gateway.backoff', return_value=0):
+            response = asyncio.run(aio.async_retry(
+                lambda: aio.async_post('http://example.com',
+                                       {'METHOD': 'DoCapture'}),
+                idempotent=True))
+        self.assertEqual('Success', response['ACK'])
+        self.assertEqual(2, stub.calls)
+
+    def test_deadline_bounds_the_whole_call(self):
+        stub = StubTransport([(200, b'ACK=Success')], delay=5)
+        start = time.time()
+        with aio.deadline(0.2):
+            with self.assertRaises(exceptions.PayPalError):
+                self.post(stub)
+        self.assertLess(time.time() - start, 2)
+
+
+@skipIf(express_aio is None, "asyncio support is not available")
+class TestAsyncExpressGateway(TestCase):
+
+    def fetch(self, response):
+        with mock.patch('paypal.aio.async_post', returning(response)), \
+                mock.patch('paypal.aio.run_sync', run_inline):
+            return asyncio.run(express_aio.get_txn('EC-8P797793UC466090M'))
+
+    def test_successful_call_returns_txn(self):
+        txn = self.fetch(Response(
+            b'', b'ACK=Success&CORRELATIONID=ab8a263eb440'
+            b'&PAYMENTREQUEST_0_AMT=6.99&PAYMENTREQUEST_0_CURRENCYCODE=GBP',
+            10))
+        self.assertEqual(D('6.99'), txn.amount)
+        self.assertEqual('EC-8P797793UC466090M', txn.token)
+
+    def test_error_raises_exception(self):
+        with self.assertRaises(exceptions.PayPalError):
+            self.fetch(Response(
+                b'', b'ACK=Failure&L_ERRORCODE0=10410', 10))
+
+
+@skipIf(payflow_aio is None, "asyncio support is not available")
+class TestAsyncPayflowGateway(TestCase):
+
+    def test_returns_a_txn_instance(self):
+        response = Response(
+            b'', b'RESULT=0&PNREF=V25A2BB645A7&RESPMSG=Approved', 10)
+        with mock.patch('paypal.aio.async_post', returning(response)), \
+                mock.patch('paypal.aio.run_sync', run_inline):
+            txn = asyncio.run(payflow_aio.void('1234', 'V25A2BB645A6'))
+        self.assertTrue(txn.is_approved)
@@ -0,0 +1,95 @@
+from __future__ import unicode_literals
+import datetime
+import shutil
+import tempfile
+
+from django.http import Http404
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.views import generic
+
+from paypal import archive
+from paypal.express.models import ExpressTransaction as Transaction
+
+
+def create_txn(token, days_old):
+    return Transaction.objects.create(
+        method='GetExpressCheckoutDetails', token=token, ack='Success',
+        response_time=12.5, raw_request='METHOD=GetExpressCheckoutDetails',
+        raw_response='ACK=Success&TOKEN=%s' % token,
+        date_created=timezone.now() - datetime.timedelta(days=days_old))
+
+
+class ArchivedTransactionListView(archive.ArchiveListMixin,
+                                  generic.ListView):
+    model = Transaction
+    template_name = 'paypal/express/dashboard/archived_transaction_list.html'
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cutoff = timezone.now() - datetime.timedelta(days=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_old_rows_are_moved_to_the_archive(self):
+        old = [create_txn('EC-%d' % i, 40 + i) for i in range(5)]
+        create_txn('EC-NEW', 1)
+        count = archive.archive(Transaction, self.directory, self.cutoff,
+                                chunk_size=2, delete_batch_size=1)
+        self.assertEqual(5, count)
+        self.assertEqual(['EC-NEW'], list(
+            Transaction.objects.values_list('token', flat=True)))
+        loader = archive.Archive(Transaction, self.directory)
+        rows = [txn for month in loader.months()
+                for txn in loader.rows(month)]
+        self.assertEqual(sorted(txn.pk for txn in old),
+                         sorted(txn.pk for txn in rows))
+        self.assertEqual('ACK=Success&TOKEN=EC-0',
+                         [txn for txn in rows
+                          if txn.token == 'EC-0'][0].raw_response)
+
+    def test_archived_rows_can_be_searched(self):
+        create_txn('EC-FIND', 40)
+        create_txn('EC-OTHER', 40)
+        archive.archive(Transaction, self.directory, self.cutoff)
+        found = archive.Archive(Transaction, self.directory).search('ec-find')
+        self.assertEqual(['EC-FIND'], [txn.token for txn in found])
+
+    def test_rows_archived_twice_are_read_once(self):
+        txn = create_txn('EC-1', 40)
+        archive._write(self.directory, Transaction, [txn])
+        archive.archive(Transaction, self.directory, self.cutoff)
+        loader = archive.Archive(Transaction, self.directory)
+        month, = loader.months()
+        self.assertEqual([txn.pk], [row.pk for row in loader.rows(month)])
+
+
+class TestArchiveListMixin(TestCase):
+
+    def get(self):
+        view = ArchivedTransactionListView.as_view()
+        return view(RequestFactory().get('/', {'q': 'ec-1'}))
+
+    @override_settings(PAYPAL_ARCHIVE_DIR=None)
+    def test_view_is_not_found_without_archive(self):
+        with self.assertRaises(Http404):
+            self.get()
+
+    def test_archived_rows_are_listed(self):
+        directory = tempfile.mkdtemp()
+        try:
+            create_txn('EC-1', 40)
+            create_txn('EC-2', 40)
+            archive.archive(Transaction, directory, timezone.now())
+            with override_settings(PAYPAL_ARCHIVE_DIR=directory):
+                response = self.get()
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(['EC-1'], [
+            txn.token for txn in response.context_data['object_list']])
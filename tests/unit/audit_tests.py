@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+import mock
+
+from paypal import audit
+from paypal.express.models import ExpressTransaction as Transaction
+
+
+def create_txn(method, token='EC-123'):
+    return Transaction(
+        method=method, token=token, ack='Success', response_time=0,
+        raw_request='METHOD=%s&PWD=secret' % method, raw_response='')
+
+
+class TestSave(TestCase):
+
+    def tearDown(self):
+        audit.flush()
+
+    def test_rows_are_saved_immediately_by_default(self):
+        audit.save(create_txn('GetExpressCheckoutDetails'),
+                   'GetExpressCheckoutDetails')
+        self.assertEqual(1, Transaction.objects.count())
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True,
+                       PAYPAL_AUDIT_FLUSH_INTERVAL=60)
+    def test_rows_are_buffered_until_flushed(self):
+        audit.save(create_txn('GetExpressCheckoutDetails'),
+                   'GetExpressCheckoutDetails')
+        self.assertEqual(0, Transaction.objects.count())
+        audit.flush()
+        txn = Transaction.objects.get()
+        self.assertNotIn('secret', txn.raw_request)
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True,
+                       PAYPAL_AUDIT_FLUSH_INTERVAL=60)
+    def test_money_moving_calls_are_saved_immediately(self):
+        audit.save(create_txn('DoExpressCheckoutPayment'),
+                   'DoExpressCheckoutPayment')
+        self.assertEqual(1, Transaction.objects.count())
+
+
+class TestBufferedWriter(TestCase):
+
+    def setUp(self):
+        self.writer = audit.BufferedWriter(batch_size=100, interval=60,
+                                           max_buffer=2)
+
+    def tearDown(self):
+        self.writer.stop()
+
+    def test_flush_writes_buffered_rows(self):
+        self.writer.write(create_txn('SetExpressCheckout', 'EC-1'))
+        self.writer.write(create_txn('SetExpressCheckout', 'EC-2'))
+        self.assertEqual(2, self.writer.flush())
+        self.assertEqual(2, Transaction.objects.count())
+        self.assertEqual(0, self.writer.flush())
+
+    def test_rows_already_saved_by_the_journal_are_skipped(self):
+        ingested = create_txn('SetExpressCheckout', 'EC-1')
+        ingested.journal_id = 'a' * 32
+        ingested.save()
+        buffered = create_txn('SetExpressCheckout', 'EC-1')
+        buffered.journal_id = 'a' * 32
+        self.writer.write(buffered)
+        self.writer.write(create_txn('SetExpressCheckout', 'EC-2'))
+        self.assertEqual(1, self.writer.flush())
+        self.assertEqual(['EC-1', 'EC-2'], sorted(
+            Transaction.objects.values_list('token', flat=True)))
+        self.assertEqual(0, len(self.writer.buffer))
+
+    def test_duplicate_rows_dont_block_the_buffer(self):
+        self.writer.write(create_txn('SetExpressCheckout', 'EC-1'))
+        duplicate = create_txn('SetExpressCheckout', 'EC-2')
+        duplicate.journal_id = 'a' * 32
+        self.writer.write(duplicate)
+        # Saved after the buffer checked for it
+        ingested = create_txn('SetExpressCheckout', 'EC-2')
+        ingested.journal_id = 'a' * 32
+        ingested.save()
+        with mock.patch('paypal.audit._unsaved',
+                        lambda model, instances, batch_size: instances):
+            self.assertEqual(1, self.writer.flush())
+        self.assertEqual(['EC-1', 'EC-2'], sorted(
+            Transaction.objects.values_list('token', flat=True)))
+        self.assertEqual(0, len(self.writer.buffer))
+
+    def test_oldest_rows_are_dropped_when_buffer_is_full(self):
+        for token in ('EC-1', 'EC-2', 'EC-3'):
+            self.writer.write(create_txn('SetExpressCheckout', token))
+        self.writer.flush()
+        self.assertEqual(['EC-2', 'EC-3'], sorted(
+            Transaction.objects.values_list('token', flat=True)))
+
+
+@override_settings(PAYPAL_AUDIT_POLICY={
+    'GetExpressCheckoutDetails': 'slim',
+    'SetExpressCheckout': 'none',
+    'default': 'sample:0'})
+class TestPolicy(TestCase):
+
+    def test_slim_rows_have_no_payloads(self):
+        txn = create_txn('GetExpressCheckoutDetails')
+        txn.raw_response = 'ACK=Success&PAYERID=123'
+        audit.save(txn, 'GetExpressCheckoutDetails')
+        row = Transaction.objects.get()
+        self.assertEqual('', row.raw_response)
+        self.assertEqual('EC-123', row.token)
+        # The caller's transaction keeps its response
+        self.assertEqual('123', txn.value('PAYERID'))
+
+    def test_rows_can_be_skipped(self):
+        audit.save(create_txn('SetExpressCheckout'), 'SetExpressCheckout')
+        audit.save(create_txn('DoExpressCheckoutPayment'),
+                   'DoExpressCheckoutPayment')
+        self.assertEqual(['DoExpressCheckoutPayment'], list(
+            Transaction.objects.values_list('method', flat=True)))
+
+    def test_failures_are_always_stored_in_full(self):
+        audit.save(create_txn('SetExpressCheckout'), 'SetExpressCheckout',
+                   successful=False)
+        self.assertNotEqual('', Transaction.objects.get().raw_request)
+
+    def test_unsampled_rows_are_skipped(self):
+        self.assertEqual(audit.NONE, audit.get_policy('GetBalance', True))
+        self.assertEqual(audit.FULL, audit.get_policy('GetBalance', False))
+
+    def test_money_moving_calls_are_always_stored_in_full(self):
+        self.assertEqual(audit.FULL, audit.get_policy('DoCapture', True))
+        self.assertEqual(audit.FULL, audit.get_policy('S', True))
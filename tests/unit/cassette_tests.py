@@ -0,0 +1,77 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from paypal import cassette, exceptions, gateway, transport
+
+
+class RecordingTransport(transport.Transport):
+
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, body, headers, timeout, timings):
+        self.calls += 1
+        timings['first_byte'] = 100.0
+        return 200, ('ACK=Success&TOKEN=EC-%d' % self.calls).encode('ascii')
+
+
+class TestCassette(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'calls.jsonl.gz')
+        self.params = {'METHOD': 'SetExpressCheckout', 'USER': 'merchant',
+                       'PWD': 'secret', 'PAYMENTREQUEST_0_AMT': '10.00',
+                       'RETURNURL': 'http://example.com/success/1/'}
+        self.recorder = RecordingTransport()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        cache.clear()
+
+    def record(self, *calls):
+        recording = cassette.CassetteTransport(
+            cassette.Cassette(self.path), 'record', recorder=self.recorder)
+        with gateway.use_transport(recording):
+            for params in calls:
+                gateway.post('http://example.com/nvp', params)
+
+    def test_credentials_are_redacted(self):
+        self.record(self.params)
+        with cassette._open(self.path, 'rb') as f:
+            contents = f.read()
+        self.assertNotIn(b'secret', contents)
+        self.assertNotIn(b'merchant', contents)
+
+    def test_recorded_calls_are_replayed_in_order(self):
+        self.record(self.params, self.params)
+        with cassette.use_cassette(self.path, latency=0):
+            tokens = [gateway.post('http://example.com/nvp',
+                                   self.params).token for __ in range(3)]
+        self.assertEqual(['EC-1', 'EC-2', 'EC-2'], tokens)
+        self.assertEqual(2, self.recorder.calls)
+
+    def test_volatile_params_are_ignored_when_matching(self):
+        self.record(self.params)
+        self.params['RETURNURL'] = 'http://example.com/success/2/'
+        self.params['PWD'] = 'another'
+        with cassette.use_cassette(self.path, latency=0):
+            response = gateway.post('http://example.com/nvp', self.params)
+        self.assertEqual('EC-1', response.token)
+
+    def test_latencies_are_scaled(self):
+        self.record(self.params)
+        with cassette.use_cassette(self.path, latency=0):
+            response = gateway.post('http://example.com/nvp', self.params)
+        self.assertEqual(0, response.timings['first_byte'])
+
+    def test_unrecorded_calls_raise_paypal_error(self):
+        self.record(self.params)
+        with cassette.use_cassette(self.path, latency=0):
+            with self.assertRaises(exceptions.PayPalError):
+                gateway.post('http://example.com/nvp', {'METHOD': 'DoVoid'})
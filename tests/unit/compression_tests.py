@@ -0,0 +1,54 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+import mock
+
+from paypal import compression
+from paypal.express.models import ExpressTransaction as Transaction
+
+RESPONSE = 'TOKEN=EC%2d8P797793UC466090M&CHECKOUTSTATUS=PaymentActionNotInitiated&TIMESTAMP=2012%2d04%2d16T11%3a51%3a57Z&CORRELATIONID=ab8a263eb440&ACK=Success&VERSION=60%2e0&BUILD=2808426&EMAIL=david%2e_1332854868_per%40gmail%2ecom&PAYERID=7ZTRBDFYYA47W&PAYERSTATUS=verified&FIRSTNAME=David&LASTNAME=Winterbottom&COUNTRYCODE=GB&SHIPTONAME=David%20Winterbottom&SHIPTOSTREET=1%20Main%20Terrace&SHIPTOCITY=Wolverhampton&SHIPTOSTATE=West%20Midlands&SHIPTOZIP=W12%204LQ&SHIPTOCOUNTRYCODE=GB&SHIPTOCOUNTRYNAME=United%20Kingdom&ADDRESSSTATUS=Confirmed&CURRENCYCODE=GBP&AMT=6%2e99&SHIPPINGAMT=0%2e00&HANDLINGAMT=0%2e00&TAXAMT=0%2e00&INSURANCEAMT=0%2e00&SHIPDISCAMT=0%2e00'
+
+
+class TestCompression(TestCase):
+
+    def test_payloads_are_compressed(self):
+        compressed = compression.compress(RESPONSE)
+        self.assertTrue(len(compressed) < len(RESPONSE) * 0.6)
+        self.assertEqual(RESPONSE, compression.decompress(compressed))
+
+    def test_short_payloads_are_left_alone(self):
+        self.assertEqual('ACK=Success', compression.compress('ACK=Success'))
+
+    def test_uncompressed_values_are_read_as_they_are(self):
+        self.assertEqual(RESPONSE, compression.decompress(RESPONSE))
+
+    def test_compressing_is_idempotent(self):
+        compressed = compression.compress(RESPONSE)
+        self.assertEqual(compressed, compression.compress(compressed))
+
+    def test_dictionary_values_are_left_alone_without_zdict(self):
+        value = compression.PREFIX + 'c3RvcmVk'
+        with mock.patch('paypal.compression.HAS_ZDICT', False):
+            self.assertEqual(value, compression.decompress(value))
+
+
+class TestCompressedField(TestCase):
+
+    def stored_response(self):
+        return Transaction.objects.values_list(
+            'raw_response', flat=True).get()
+
+    def test_payloads_are_stored_compressed(self):
+        Transaction.objects.create(raw_request='', raw_response=RESPONSE,
+                                   response_time=0)
+        self.assertTrue(self.stored_response().startswith(
+            (compression.PREFIX, compression.PLAIN_PREFIX)))
+        txn = Transaction.objects.with_payloads().get()
+        self.assertEqual('Winterbottom', txn.value('LASTNAME'))
+
+    @override_settings(PAYPAL_COMPRESS_PAYLOADS=False)
+    def test_compression_can_be_turned_off(self):
+        Transaction.objects.create(raw_request='', raw_response=RESPONSE,
+                                   response_time=0)
+        self.assertEqual(RESPONSE, self.stored_response())
@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 from decimal import Decimal as D
+from django.core.cache import cache
 from django.test import TestCase
 from mock import patch, Mock
 
@@ -29,10 +30,11 @@ class MockedResponseTestCase(TestCase):
 
     def tearDown(self):
         Transaction.objects.all().delete()
+        cache.clear()
 
     def create_mock_response(self, body, status_code=200):
         response = Mock()
-        response.text = body
+        response.content = body.encode('utf8')
         response.status_code = status_code
         return response
 
@@ -43,7 +45,7 @@ class ErrorResponseTests(MockedResponseTestCase):
         response_body = 'TIMESTAMP=2012%2d03%2d26T16%3a33%3a09Z&CORRELATIONID=3bea2076bb9c3&ACK=Failure&VERSION=0%2e000000&BUILD=2649250&L_ERRORCODE0=10002&L_SHORTMESSAGE0=Security%20error&L_LONGMESSAGE0=Security%20header%20is%20not%20valid&L_SEVERITYCODE0=Error'
         response = self.create_mock_response(response_body)
 
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             with self.assertRaises(exceptions.PayPalError):
                 gateway.set_txn(self.basket, self.methods, 'GBP', 'http://localhost:8000/success',
@@ -52,7 +54,7 @@ class ErrorResponseTests(MockedResponseTestCase):
     def test_non_200_response_raises_exception(self):
         response = self.create_mock_response(body='', status_code=500)
 
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             with self.assertRaises(exceptions.PayPalError):
                 gateway.set_txn(self.basket, self.methods, 'GBP', 'http://localhost:8000/success',
@@ -66,7 +68,7 @@ class SuccessResponseTests(MockedResponseTestCase):
         response_body = 'TOKEN=EC%2d6469953681606921P&TIMESTAMP=2012%2d03%2d26T17%3a19%3a38Z&CORRELATIONID=50a8d895e928f&ACK=Success&VERSION=60%2e0&BUILD=2649250'
         response = self.create_mock_response(response_body)
 
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             self.url = gateway.set_txn(self.basket, self.methods, 'GBP',
                                        'http://localhost:8000/success',
@@ -106,3 +108,58 @@ class TestOrderTotal(TestCase):
             with self.assertRaises(InvalidBasket):
                 gateway.set_txn(basket, shipping_methods, 'GBP',
                                 'http://example.com', 'http://example.com')
+
+
+class FetchManyTests(MockedResponseTestCase):
+
+    def test_transactions_are_saved_in_bulk(self):
+        success = self.create_mock_response(
+            'ACK=Success&CORRELATIONID=abc&AUTHORIZATIONID=1')
+        failure = self.create_mock_response(
+            'ACK=Failure&CORRELATIONID=def&L_ERRORCODE0=10602'
+            '&L_LONGMESSAGE0=Authorization%20has%20already%20been%20completed')
+        with patch('requests.Session.post') as post:
+            post.side_effect = [success, failure]
+            results = gateway.fetch_many(
+                [(gateway.DO_VOID, {'AUTHORIZATIONID': '1'}),
+                 (gateway.DO_VOID, {'AUTHORIZATIONID': '2'})],
+                max_workers=1)
+        self.assertTrue(results[0].is_successful)
+        self.assertIsInstance(results[1], exceptions.PayPalError)
+        self.assertEqual(2, Transaction.objects.filter(
+            method=gateway.DO_VOID).count())
+
+    def test_unexpected_exceptions_dont_lose_the_other_rows(self):
+        success = self.create_mock_response(
+            'ACK=Success&CORRELATIONID=abc&AUTHORIZATIONID=1')
+        with patch('requests.Session.post') as post:
+            post.side_effect = [ValueError("Unexpected"), success]
+            results = gateway.fetch_many(
+                [(gateway.DO_VOID, {'AUTHORIZATIONID': '1'}),
+                 (gateway.DO_VOID, {'AUTHORIZATIONID': '2'})],
+                max_workers=1)
+        self.assertIsInstance(results[0], exceptions.PayPalError)
+        self.assertTrue(results[1].is_successful)
+        self.assertEqual(1, Transaction.objects.filter(
+            method=gateway.DO_VOID).count())
+
+    def test_rows_are_saved_when_a_response_cant_be_recorded(self):
+        success = self.create_mock_response(
+            'ACK=Success&CORRELATIONID=abc&AUTHORIZATIONID=1')
+        build_txn = gateway._build_txn
+
+        def fail_second(method, params, response):
+            if params['AUTHORIZATIONID'] == '2':
+                raise ValueError("Unexpected")
+            return build_txn(method, params, response)
+        with patch('requests.Session.post') as post:
+            post.return_value = success
+            with patch('paypal.express.gateway._build_txn', fail_second):
+                results = gateway.fetch_many(
+                    [(gateway.DO_VOID, {'AUTHORIZATIONID': '1'}),
+                     (gateway.DO_VOID, {'AUTHORIZATIONID': '2'})],
+                    max_workers=1)
+        self.assertTrue(results[0].is_successful)
+        self.assertIsInstance(results[1], exceptions.PayPalError)
+        self.assertEqual(1, Transaction.objects.filter(
+            method=gateway.DO_VOID).count())
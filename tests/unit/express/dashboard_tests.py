@@ -0,0 +1,111 @@
+from __future__ import unicode_literals
+from decimal import Decimal as D
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from oscar.core.loading import get_model
+from oscar.test.factories import create_order
+
+from paypal.express.dashboard import views
+from paypal.express.models import (
+    ExpressTransaction as Transaction, ExpressTransactionPreAuth as PreAuth)
+
+PaymentEventType = get_model('order', 'PaymentEventType')
+PaymentEvent = get_model('order', 'PaymentEvent')
+User = get_user_model()
+
+
+def create_txn(correlation_id, method='DoExpressCheckoutPayment',
+               token='EC-123'):
+    return Transaction.objects.create(
+        method=method, token=token, correlation_id=correlation_id,
+        ack='Success', response_time=0, raw_request='', raw_response='')
+
+
+def create_view(view_class, path='/'):
+    view = view_class()
+    view.request = RequestFactory().get(path)
+    view.args, view.kwargs = (), {}
+    return view
+
+
+class TestTransactionListView(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_emails(self):
+        # Counts of filtered lists are cached
+        cache.clear()
+        view = create_view(views.TransactionListView)
+        return view.get(view.request).context_data['emails']
+
+    def test_emails_are_fetched_in_one_query(self):
+        for i in range(4):
+            token = 'EC-%d' % i
+            create_txn('correlation-%d' % i, token=token)
+            if i % 2:
+                PreAuth.objects.create(
+                    token=token, email='buyer%d@example.com' % i)
+            else:
+                customer = User.objects.create_user(
+                    'customer%d' % i, 'customer%d@example.com' % i, 'secret')
+                PreAuth.objects.create(token=token, customer=customer)
+            # The page, its count and the pre-auth rows with their customers
+            with self.assertNumQueries(3):
+                emails = self.get_emails()
+            self.assertEqual(i + 1, len(emails))
+        self.assertEqual('buyer1@example.com', emails['EC-1'])
+        self.assertEqual('customer2@example.com', emails['EC-2'])
+
+    def test_pre_auth_without_email_or_customer_is_skipped(self):
+        create_txn('correlation', token='EC-123')
+        PreAuth.objects.create(token='EC-123')
+        self.assertEqual({}, self.get_emails())
+
+
+class TestTransactionWoOrderListView(TestCase):
+
+    def setUp(self):
+        self.settled = PaymentEventType.objects.create(
+            name='Settled', code='settled')
+        self.order = create_order()
+
+    def settle(self, correlation_id, event_type=None):
+        PaymentEvent.objects.create(
+            order=self.order, amount=D('10.00'), reference=correlation_id,
+            event_type=event_type or self.settled)
+
+    def correlation_ids(self):
+        view = create_view(views.TransactionWoOrderListView)
+        return sorted(txn.correlation_id or ''
+                      for txn in view.get_queryset())
+
+    def test_settled_transactions_are_excluded(self):
+        create_txn('settled')
+        create_txn('unsettled')
+        self.settle('settled')
+        self.assertEqual(['unsettled'], self.correlation_ids())
+
+    def test_other_events_dont_exclude_transactions(self):
+        create_txn('paid')
+        self.settle('paid', PaymentEventType.objects.create(
+            name='Paid', code='paid'))
+        self.assertEqual(['paid'], self.correlation_ids())
+
+    def test_transactions_without_correlation_id_are_included(self):
+        create_txn(None)
+        self.settle('settled')
+        self.assertEqual([''], self.correlation_ids())
+
+    def test_set_express_checkout_calls_are_excluded(self):
+        create_txn('set', method='SetExpressCheckout')
+        self.assertEqual([], self.correlation_ids())
+
+    def test_all_transactions_are_listed_without_settled_event_type(self):
+        create_txn('unsettled')
+        self.settled.delete()
+        self.assertEqual(['unsettled'], self.correlation_ids())
@@ -8,7 +8,8 @@ from django.utils.six.moves.urllib.parse import parse_qs
 from oscar.apps.shipping.methods import Free
 
 from paypal.models import ExpressTransaction as Transaction
-from paypal.express.facade import get_paypal_url, fetch_transaction_details
+from paypal.express.facade import (
+    get_paypal_url, fetch_transaction_details, refund_transactions)
 
 
 class MockedResponseTests(TestCase):
@@ -17,9 +18,9 @@ class MockedResponseTests(TestCase):
 
     def setUp(self):
         response = Mock()
-        response.text = self.response_body
+        response.content = self.response_body.encode('utf8')
         response.status_code = 200
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             self.perform_action()
             self.mocked_post = post
@@ -33,7 +34,7 @@ class MockedResponseTests(TestCase):
 
 class BaseSetExpressCheckoutTests(MockedResponseTests):
     def _get_paypal_params(self):
-        return parse_qs(self.mocked_post.call_args[0][1])
+        return parse_qs(self.mocked_post.call_args[0][1].decode('utf8'))
 
     def assertPaypalParamEqual(self, key, value):
         self.assertEqual(self._get_paypal_params()[key], [value])
@@ -147,3 +148,29 @@ class SuccessfulGetExpressCheckoutTests(MockedResponseTests):
         ]
         for k, v in values:
             self.assertEqual(v, ctx[k])
+
+
+class RefundTransactionsTests(TestCase):
+
+    def setUp(self):
+        Transaction.objects.create(
+            method='DoExpressCheckoutPayment', token='EC-123',
+            transaction_id='51K14287DL123456', amount=D('20.00'),
+            currency='GBP', ack='Success', response_time=0,
+            raw_request='', raw_response='')
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+
+    def test_each_refund_of_a_token_keeps_its_amount(self):
+        with patch('paypal.express.facade.fetch_many') as fetch_many:
+            fetch_many.side_effect = lambda calls: list(calls)
+            results = refund_transactions([
+                ('EC-123', D('5.00'), 'GBP'), ('EC-999', D('1.00'), 'GBP'),
+                ('EC-123', D('7.50'), 'GBP')])
+        calls = fetch_many.call_args[0][0]
+        self.assertEqual([D('5.00'), D('7.50')],
+                         [params['AMT'] for method, params in calls])
+        self.assertEqual(calls[0], results[0])
+        self.assertTrue(isinstance(results[1], Exception))
+        self.assertEqual(calls[1], results[2])
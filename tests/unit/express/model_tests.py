@@ -1,6 +1,10 @@
 from __future__ import unicode_literals
 from unittest import TestCase
 
+from django import test
+import mock
+
+from paypal import nvp
 from paypal.express.models import ExpressTransaction as Transaction
 
 
@@ -19,9 +23,62 @@ class TransactionTests(TestCase):
                                          response_time=0)
         self.assertEqual('PaymentActionNotInitiated', txn.value('CHECKOUTSTATUS'))
 
+    def test_response_is_parsed_once(self):
+        txn = Transaction(raw_request='', raw_response='ACK=Success&AMT=6.99',
+                          response_time=0)
+        with mock.patch('paypal.nvp.decode', wraps=nvp.decode) as decode:
+            txn.value('ACK')
+            txn.value('AMT')
+            txn.context
+        self.assertEqual(1, decode.call_count)
+
+    def test_response_is_parsed_again_when_changed(self):
+        txn = Transaction(raw_request='', raw_response='ACK=Success',
+                          response_time=0)
+        self.assertEqual('Success', txn.value('ACK'))
+        txn.raw_response = 'ACK=Failure'
+        self.assertEqual('Failure', txn.value('ACK'))
+
+    def test_key_response_values_are_promoted(self):
+        txn = Transaction(
+            raw_request='', response_time=0,
+            raw_response=('EMAIL=david%40example%2ecom&PAYERID=7ZTRBDFYYA47W&'
+                          'PAYMENTINFO_0_TRANSACTIONID=51963679RW630412N&'
+                          'PAYMENTINFO_0_PAYMENTSTATUS=Pending'))
+        txn.promote_fields()
+        self.assertEqual('51963679RW630412N', txn.transaction_id)
+        self.assertEqual('7ZTRBDFYYA47W', txn.payer_id)
+        self.assertEqual('david@example.com', txn.payer_email)
+        self.assertEqual('Pending', txn.payment_status)
+
     def test_warnings_are_successful(self):
         txn = Transaction.objects.create(raw_request='',
                                          raw_response='',
                                          ack='SuccessWithWarning',
                                          response_time=0)
         self.assertTrue(txn.is_successful)
+
+    def test_phase_timings_are_recorded(self):
+        txn = Transaction(raw_request='', raw_response='', response_time=12)
+        txn.record_timings({'first_byte': 10.5, 'decode': 0.1})
+        self.assertEqual(10.5, txn.first_byte_time)
+        self.assertEqual(0.1, txn.decode_time)
+        self.assertIsNone(txn.connect_time)
+
+
+class PayloadTests(test.TestCase):
+
+    def setUp(self):
+        Transaction.objects.create(raw_request='METHOD=DoVoid',
+                                   raw_response='ACK=Success',
+                                   response_time=0)
+
+    def test_payloads_are_deferred(self):
+        txn = Transaction.objects.get()
+        with self.assertNumQueries(1):
+            self.assertEqual('Success', txn.value('ACK'))
+
+    def test_payloads_can_be_loaded_up_front(self):
+        txn = Transaction.objects.with_payloads().get()
+        with self.assertNumQueries(0):
+            self.assertEqual('Success', txn.value('ACK'))
@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from paypal import exceptions, faults, gateway, transport
+
+
+class StaticTransport(transport.Transport):
+
+    def post(self, url, body, headers, timeout, timings):
+        if b'TRXTYPE' in body:
+            return 200, b'RESULT=0&PNREF=V19A2E2CFF3D&RESPMSG=Approved'
+        return 200, b'ACK=Success&TOKEN=EC-123'
+
+
+class TestFaultInjection(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self, params=None, **kwargs):
+        return gateway.post('http://example.com/nvp',
+                            params or {'METHOD': 'DoCapture'}, **kwargs)
+
+    def test_methods_without_faults_are_passed_on(self):
+        with gateway.use_transport(StaticTransport()):
+            with faults.inject({'DoVoid': {'drop': 1}}):
+                self.assertEqual('EC-123', self.post().token)
+
+    def test_dropped_connections_raise_paypal_error(self):
+        with gateway.use_transport(StaticTransport()):
+            with faults.inject({'default': {'drop': 1}}):
+                with self.assertRaises(exceptions.PayPalError):
+                    self.post()
+
+    def test_status_codes_raise_paypal_error(self):
+        with gateway.use_transport(StaticTransport()):
+            with faults.inject({'DoCapture': {'status': {503: 1}}}):
+                with self.assertRaises(exceptions.PayPalError):
+                    self.post()
+
+    def test_express_error_codes_are_returned(self):
+        with gateway.use_transport(StaticTransport()):
+            with faults.inject({'DoCapture': {'error': {'10001': 1}}}):
+                response = self.post()
+        self.assertEqual('Failure', response.ack)
+        self.assertEqual('10001', response.errors[0]['code'])
+
+    def test_payflow_result_codes_are_returned(self):
+        with gateway.use_transport(StaticTransport()):
+            with faults.inject({'S': {'error': {'12': 1}}}):
+                response = self.post({'TRXTYPE': 'S', 'AMT': '1.00'},
+                                      length_tags=True)
+        self.assertEqual('12', response.result)
+        self.assertEqual('Declined', response.respmsg)
+
+    def test_latency_is_added(self):
+        with gateway.use_transport(StaticTransport()):
+            with faults.inject({'DoCapture': {'latency': '50'}}):
+                start_time = time.time()
+                self.post()
+        self.assertTrue(time.time() - start_time >= 0.05)
+
+    def test_latency_beyond_read_timeout_times_out(self):
+        wrapper = faults.FaultInjectingTransport(
+            {'DoCapture': {'latency': '50'}}, StaticTransport())
+        with self.assertRaises(exceptions.TransportError):
+            wrapper.post('http://example.com/nvp', b'METHOD=DoCapture', {},
+                         (0.01, 0.01), {})
+
+    def test_seeded_faults_are_repeatable(self):
+        def responses(seed):
+            wrapper = faults.FaultInjectingTransport(
+                {'default': {'error': {'10001': 0.5}},
+                 'S': {'error': {'12': 0.5}}},
+                StaticTransport(), seed=seed)
+            return [
+                wrapper.post('http://example.com/nvp', body, {}, (1, 1), {})
+                for body in [b'METHOD=DoCapture'] * 10 +
+                [b'TRXTYPE=S&AMT=1.00'] * 10]
+
+        def ids(responses):
+            return [(gateway.Response(b'', content, 0).get('CORRELATIONID'),
+                     gateway.Response(b'', content, 0).get('PNREF'))
+                    for status, content in responses]
+        self.assertEqual(ids(responses(1)), ids(responses(1)))
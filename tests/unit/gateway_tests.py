@@ -1,7 +1,17 @@
 from __future__ import unicode_literals
+import socket
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six.moves import BaseHTTPServer
 import mock
+import requests
 
+from paypal import gateway, exceptions, timing, transport
 from paypal.gateway import post
 
 # Fixtures
@@ -11,10 +21,10 @@ ERROR_RESPONSE = 'RESULT=126&PNREF=V25A2BB645A7&RESPMSG=Under review by Fraud Se
 class TestErrorResponse(TestCase):
 
     def setUp(self):
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             response = mock.Mock()
             response.status_code = 200
-            response.text = ERROR_RESPONSE
+            response.content = ERROR_RESPONSE.encode('utf8')
             mock_post.return_value = response
             self.pairs = post('http://example.com', {})
 
@@ -38,3 +48,306 @@ class TestErrorResponse(TestCase):
                     '_response_time']
         for key in expected:
             self.assertTrue(key in self.pairs)
+
+
+class TestConnectionPools(TestCase):
+
+    def tearDown(self):
+        gateway.close_pools()
+
+    def test_same_pool_is_used_for_same_host(self):
+        self.assertIs(gateway.get_pool('https://api-3t.paypal.com/nvp'),
+                      gateway.get_pool('https://api-3t.paypal.com/nvp'))
+
+    def test_different_pool_is_used_for_each_host(self):
+        self.assertIsNot(
+            gateway.get_pool('https://api-3t.paypal.com/nvp'),
+            gateway.get_pool('https://api-3t.sandbox.paypal.com/nvp'))
+
+    def test_stats_are_reported_per_endpoint(self):
+        gateway.get_pool('https://payflowpro.paypal.com')
+        stats = gateway.pool_stats()
+        self.assertEqual({'requests': 0, 'connections': 0, 'reused': 0},
+                         stats['https://payflowpro.paypal.com'])
+
+
+class DripHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Sends a response body a byte at a time, slowly
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', '20')
+        self.end_headers()
+        try:
+            for i in range(20):
+                self.wfile.write(b'x')
+                self.wfile.flush()
+                time.sleep(0.1)
+        except socket.error:
+            # The client gave up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTimeouts(TestCase):
+
+    @override_settings(PAYPAL_TIMEOUT=(2, 10),
+                       PAYPAL_TIMEOUTS={'DoCapture': (1, 45)})
+    def test_method_specific_timeouts_are_used(self):
+        self.assertEqual((1, 45), gateway.get_timeout('DoCapture'))
+        self.assertEqual((2, 10), gateway.get_timeout('S'))
+
+    @override_settings(PAYPAL_TIMEOUT=(2, 10))
+    def test_deadline_shortens_timeout(self):
+        with gateway.deadline(5):
+            connect, read = gateway.get_timeout('SetExpressCheckout')
+        self.assertEqual(2, connect)
+        self.assertTrue(read <= 5)
+
+    def test_expired_deadline_raises_error(self):
+        with gateway.deadline(0):
+            with self.assertRaises(exceptions.PayPalError):
+                gateway.get_timeout('SetExpressCheckout')
+
+    def test_deadline_bounds_slowly_arriving_responses(self):
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), DripHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:%d/nvp' % server.server_address[1]
+        start_time = time.time()
+        try:
+            with gateway.deadline(0.5):
+                with self.assertRaises(exceptions.PayPalError):
+                    post(url, {'METHOD': 'DoCapture'})
+            # Each read waits for a byte, which takes 0.1s
+            self.assertLess(time.time() - start_time, 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+            cache.clear()
+
+    def test_timeouts_raise_paypal_error(self):
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.side_effect = requests.Timeout()
+            with self.assertRaises(exceptions.PayPalError):
+                post('http://example.com', {'METHOD': 'DoCapture'})
+
+
+@override_settings(PAYPAL_BREAKER_THRESHOLD=2,
+                   PAYPAL_BREAKER_RESET_TIMEOUT=30)
+class TestCircuitBreaker(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def fail_call(self):
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.side_effect = requests.ConnectionError()
+            with self.assertRaises(exceptions.PayPalError):
+                post('http://example.com', {'METHOD': 'DoCapture'})
+
+    def test_opens_after_threshold_failures(self):
+        self.fail_call()
+        self.fail_call()
+        breaker = gateway.get_breaker('http://example.com', 'DoCapture')
+        self.assertEqual(breaker.OPEN, breaker.state)
+
+    def test_open_breaker_fails_fast(self):
+        self.fail_call()
+        self.fail_call()
+        with mock.patch('requests.Session.post') as mock_post:
+            with self.assertRaises(exceptions.CircuitOpenError):
+                post('http://example.com', {'METHOD': 'DoCapture'})
+            self.assertFalse(mock_post.called)
+
+    def test_breakers_are_per_method(self):
+        self.fail_call()
+        self.fail_call()
+        breaker = gateway.get_breaker('http://example.com', 'DoVoid')
+        self.assertEqual(breaker.CLOSED, breaker.state)
+
+    def test_successful_trial_call_closes_breaker(self):
+        self.fail_call()
+        self.fail_call()
+        later = time.time() + 60
+        with mock.patch('time.time') as mock_time:
+            mock_time.return_value = later
+            with mock.patch('requests.Session.post') as mock_post:
+                mock_post.return_value = mock.Mock(
+                    status_code=200,
+                    content=ERROR_RESPONSE.encode('utf8'))
+                post('http://example.com', {'METHOD': 'DoCapture'})
+        breaker = gateway.get_breaker('http://example.com', 'DoCapture')
+        self.assertEqual(breaker.CLOSED, breaker.state)
+
+
+@mock.patch('time.sleep')
+class TestRetry(TestCase):
+
+    def failing_call(self, failures):
+        responses = [exceptions.PayPalError()] * failures + ['ok']
+        return mock.Mock(side_effect=responses)
+
+    def test_idempotent_calls_are_retried(self, mock_sleep):
+        call = self.failing_call(2)
+        self.assertEqual('ok', gateway.retry(call, idempotent=True))
+        self.assertEqual(3, call.call_count)
+
+    def test_non_idempotent_calls_are_not_retried(self, mock_sleep):
+        call = self.failing_call(1)
+        with self.assertRaises(exceptions.PayPalError):
+            gateway.retry(call, idempotent=False)
+        self.assertEqual(1, call.call_count)
+
+    @override_settings(PAYPAL_RETRIES=1)
+    def test_gives_up_after_configured_retries(self, mock_sleep):
+        call = self.failing_call(2)
+        with self.assertRaises(exceptions.PayPalError):
+            gateway.retry(call, idempotent=True)
+        self.assertEqual(2, call.call_count)
+
+    def test_open_circuit_is_not_retried(self, mock_sleep):
+        call = mock.Mock(side_effect=exceptions.CircuitOpenError())
+        with self.assertRaises(exceptions.CircuitOpenError):
+            gateway.retry(call, idempotent=True)
+        self.assertEqual(1, call.call_count)
+
+    def test_retries_results_classified_as_retryable(self, mock_sleep):
+        call = mock.Mock(side_effect=[{'L_ERRORCODE0': '10001'},
+                                      {'ACK': 'Success'}])
+        result = gateway.retry(
+            call, idempotent=True,
+            should_retry=lambda pairs: 'L_ERRORCODE0' in pairs)
+        self.assertEqual({'ACK': 'Success'}, result)
+
+
+class TestPostMany(TestCase):
+
+    def test_results_are_returned_in_order(self):
+        calls = [lambda i=i: i for i in range(5)]
+        self.assertEqual(list(range(5)), gateway.run_many(calls, 3))
+
+    def test_errors_are_returned_as_results(self):
+        error = exceptions.PayPalError()
+
+        def fail_call():
+            raise error
+        self.assertEqual([1, error],
+                         gateway.run_many([lambda: 1, fail_call]))
+
+    def test_unexpected_exceptions_are_returned_as_errors(self):
+        def fail_call():
+            raise ValueError("Unexpected")
+        results = gateway.run_many([fail_call, lambda: 1])
+        self.assertIsInstance(results[0], exceptions.PayPalError)
+        self.assertEqual(1, results[1])
+
+    def test_posts_each_job(self):
+        response = mock.Mock(status_code=200, content=b'ACK=Success')
+        with mock.patch('requests.Session.post') as post:
+            post.return_value = response
+            results = gateway.post_many([
+                ('http://example.com', {'METHOD': 'DoVoid'}),
+                ('http://example.com', {'METHOD': 'DoCapture'})])
+        self.assertEqual(2, post.call_count)
+        self.assertEqual(['Success', 'Success'],
+                         [pairs['ACK'] for pairs in results])
+
+
+class TestResponse(TestCase):
+
+    def setUp(self):
+        self.response = gateway.Response(
+            b'METHOD=DoVoid',
+            b'ACK=Failure&CORRELATIONID=3bea2076bb9c3&TOKEN=EC%2d123'
+            b'&L_ERRORCODE0=10002&L_LONGMESSAGE0=Security%20error'
+            b'&L_ERRORCODE1=10001&L_LONGMESSAGE1=Internal%20Error',
+            100)
+
+    def test_accessors(self):
+        self.assertEqual('Failure', self.response.ack)
+        self.assertEqual('EC-123', self.response.token)
+        self.assertEqual('3bea2076bb9c3', self.response.correlation_id)
+
+    def test_errors(self):
+        self.assertEqual([{'code': '10002', 'msg': 'Security error'},
+                          {'code': '10001', 'msg': 'Internal Error'}],
+                         self.response.errors)
+
+    def test_response_is_decoded_lazily(self):
+        self.assertIsNone(self.response._pairs)
+        self.response.ack
+        self.assertIsNotNone(self.response._pairs)
+
+    def test_raw_payloads(self):
+        self.assertEqual('METHOD=DoVoid', self.response['_raw_request'])
+        self.assertEqual(100, self.response['_response_time'])
+
+
+class TestTimings(TestCase):
+
+    def test_read_time_is_recorded(self):
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200,
+                                               content=b'ACK=Success')
+            response = post('http://example.com', {'METHOD': 'DoVoid'})
+        self.assertTrue('read' in response.timings)
+
+    def test_decode_time_is_recorded_on_first_access(self):
+        response = gateway.Response(b'', b'ACK=Success', 10)
+        self.assertFalse('decode' in response.timings)
+        response.ack
+        self.assertTrue('decode' in response.timings)
+
+    def test_phases_are_only_recorded_while_collecting(self):
+        timing.record('connect', time.time())
+        with timing.collect() as timings:
+            timing.record('connect', time.time())
+        timing.record('connect', time.time())
+        self.assertEqual(['connect'], list(timings.keys()))
+
+
+class StaticTransport(transport.Transport):
+    status_code, content = 200, b'ACK=Success&TOKEN=EC-123'
+
+    def post(self, url, body, headers, timeout, timings):
+        if url.startswith('http://unreachable'):
+            raise exceptions.TransportError("Connection refused")
+        return self.status_code, self.content
+
+
+@override_settings(PAYPAL_TRANSPORT='tests.unit.gateway_tests.StaticTransport')
+class TestTransport(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_configured_transport_is_used(self):
+        response = post('http://example.com', {'METHOD': 'DoVoid'})
+        self.assertEqual('EC-123', response.token)
+
+    def test_transport_is_shared(self):
+        self.assertIs(gateway.get_transport(), gateway.get_transport())
+
+    def test_transport_errors_raise_paypal_error(self):
+        with self.assertRaises(exceptions.PayPalError):
+            post('http://unreachable.example.com', {'METHOD': 'DoVoid'})
+
+    @override_settings(PAYPAL_TRANSPORT='paypal.transport.MissingTransport')
+    def test_unknown_transport_is_improperly_configured(self):
+        with self.assertRaises(ImproperlyConfigured):
+            gateway.get_transport()
+
+    def test_transport_can_be_overridden_for_a_block(self):
+        static = StaticTransport()
+        static.content = b'ACK=Success&TOKEN=EC-456'
+        with gateway.use_transport(static):
+            response = post('http://example.com', {'METHOD': 'DoVoid'})
+        self.assertEqual('EC-456', response.token)
+        self.assertIsNot(static, gateway.get_transport())
@@ -0,0 +1,70 @@
+from __future__ import unicode_literals
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from paypal.express.models import (
+    ExpressTransaction, ExpressTransactionPreAuth)
+from paypal.payflow import codes
+from paypal.payflow.models import PayflowTransaction
+
+
+def query_plan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    return ' '.join(row[-1] for row in cursor.fetchall())
+
+
+class TestDeclaredIndexes(TestCase):
+
+    def assertIndexed(self, model, name):
+        self.assertTrue(model._meta.get_field(name).db_index,
+                        "%s.%s isn't indexed" % (model.__name__, name))
+
+    def test_express_indexes(self):
+        self.assertIn(('token', 'method', 'date_created'),
+                      ExpressTransaction._meta.index_together)
+        for name in ('correlation_id', 'date_created'):
+            self.assertIndexed(ExpressTransaction, name)
+        self.assertIndexed(ExpressTransactionPreAuth, 'token')
+
+    def test_payflow_indexes(self):
+        self.assertIn(('comment1', 'trxtype', 'date_created'),
+                      PayflowTransaction._meta.index_together)
+        for name in ('comment1', 'date_created'):
+            self.assertIndexed(PayflowTransaction, name)
+
+
+@skipUnless(connection.vendor == 'sqlite', "query plans are SQLite's")
+class TestQueryPlans(TestCase):
+
+    def assertUsesIndex(self, queryset, sorts=False):
+        plan = query_plan(queryset)
+        self.assertRegexpMatches(plan, 'USING (COVERING )?INDEX')
+        if not sorts:
+            # Ordered by the index rather than sorted
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_express_lookup_by_token(self):
+        self.assertUsesIndex(ExpressTransaction.objects.filter(
+            token='EC-123', method='DoExpressCheckoutPayment'))
+
+    def test_express_lookup_by_correlation_id(self):
+        # The few rows for a correlation ID are sorted by date
+        self.assertUsesIndex(ExpressTransaction.objects.filter(
+            correlation_id='ab8a263eb440'), sorts=True)
+
+    def test_pre_auth_lookup_by_token(self):
+        self.assertUsesIndex(ExpressTransactionPreAuth.objects.filter(
+            token__in=['EC-123', 'EC-456']))
+
+    def test_payflow_lookup_by_order_number(self):
+        self.assertUsesIndex(PayflowTransaction.objects.filter(
+            comment1='100001', trxtype=codes.AUTHORIZATION))
+
+    def test_lists_are_ordered_by_index(self):
+        for model in (ExpressTransaction, PayflowTransaction):
+            self.assertUsesIndex(
+                model.objects.order_by('-date_created', '-pk')[:50])
@@ -0,0 +1,117 @@
+from __future__ import unicode_literals
+import glob
+import io
+import os
+import shutil
+import tempfile
+
+from django.db import DatabaseError, transaction
+from django.test import TestCase
+from django.test.utils import override_settings
+import mock
+
+from paypal import audit, journal
+from paypal.express.models import ExpressTransaction as Transaction
+
+
+def create_txn(token='EC-123'):
+    return Transaction(
+        method='DoExpressCheckoutPayment', token=token, ack='Success',
+        amount='10.00', response_time=12.5,
+        raw_request='METHOD=DoExpressCheckoutPayment&PWD=123456&',
+        raw_response='ACK=Success')
+
+
+class JournalTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def segments(self, extension):
+        return glob.glob(os.path.join(self.directory, '*.%s' % extension))
+
+
+class TestJournal(JournalTestCase):
+
+    def test_records_are_appended_to_an_open_segment(self):
+        log = journal.Journal(self.directory)
+        log.append({'n': 1})
+        log.append({'n': 2}, {'n': 3})
+        segment, = self.segments('open')
+        self.assertEqual([{'n': 1}, {'n': 2}, {'n': 3}],
+                         list(journal.read_segment(segment)))
+
+    def test_full_segments_are_closed(self):
+        log = journal.Journal(self.directory, segment_size=5)
+        log.append({'n': 1})
+        log.append({'n': 2})
+        self.assertEqual(2, len(self.segments('log')))
+        self.assertEqual([], self.segments('open'))
+
+    def test_incomplete_last_record_is_skipped(self):
+        path = os.path.join(self.directory, 'host-1-000001.log')
+        with io.open(path, 'wb') as f:
+            f.write(b'{"n":1}\n{"n":')
+        self.assertEqual([{'n': 1}], list(journal.read_segment(path)))
+
+    def test_transactions_survive_serialization(self):
+        txn = create_txn()
+        copy = journal.deserialize(journal.serialize(txn), {
+            'paypal.ExpressTransaction': Transaction})
+        self.assertEqual('EC-123', copy.token)
+        self.assertEqual(txn.amount, copy.amount)
+        self.assertEqual(txn.date_created, copy.date_created)
+
+
+class TestIngest(JournalTestCase):
+
+    def ingest(self):
+        return journal.ingest(self.directory, [Transaction],
+                              include_open=True)
+
+    def test_unsaved_rows_are_ingested_once(self):
+        with override_settings(PAYPAL_JOURNAL_DIR=self.directory):
+            audit.save(create_txn('EC-1'), 'DoExpressCheckoutPayment')
+            journal.record(create_txn('EC-2'))
+        self.assertEqual(1, self.ingest())
+        self.assertEqual(0, self.ingest())
+        self.assertEqual(['EC-1', 'EC-2'], sorted(
+            Transaction.objects.values_list('token', flat=True)))
+
+    def test_passwords_are_not_journalled(self):
+        with override_settings(PAYPAL_JOURNAL_DIR=self.directory):
+            journal.record(create_txn())
+        segment, = self.segments('open')
+        with io.open(segment, 'rb') as f:
+            self.assertNotIn(b'123456', f.read())
+
+    def test_database_errors_are_logged_for_journalled_rows(self):
+        txn = create_txn()
+        with override_settings(PAYPAL_JOURNAL_DIR=self.directory):
+            with mock.patch.object(txn, 'save', side_effect=DatabaseError):
+                audit.save(txn, 'DoExpressCheckoutPayment')
+        self.assertEqual(1, self.ingest())
+
+    def duplicate_journal_id(self):
+        # Saving a row with this journal ID fails in the database
+        existing = create_txn('EC-0')
+        existing.journal_id = 'a' * 32
+        existing.save()
+        return mock.patch('paypal.journal.uuid.uuid4',
+                          return_value=mock.Mock(hex='a' * 32))
+
+    def test_failed_saves_dont_abort_the_transaction(self):
+        with override_settings(PAYPAL_JOURNAL_DIR=self.directory):
+            with self.duplicate_journal_id(), transaction.atomic():
+                audit.save(create_txn('EC-1'), 'DoExpressCheckoutPayment')
+                self.assertEqual(1, Transaction.objects.count())
+
+    def test_failed_bulk_saves_dont_abort_the_transaction(self):
+        with override_settings(PAYPAL_JOURNAL_DIR=self.directory):
+            with self.duplicate_journal_id(), transaction.atomic():
+                audit.save_many(Transaction, [
+                    (create_txn('EC-1'), 'DoExpressCheckoutPayment', True)])
+                self.assertEqual(1, Transaction.objects.count())
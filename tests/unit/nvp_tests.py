@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from decimal import Decimal as D
+
+from django.test import TestCase
+from django.utils.six.moves.urllib.parse import parse_qs
+
+from paypal import nvp
+
+
+class TestEncode(TestCase):
+
+    def test_returns_bytes(self):
+        self.assertEqual(b'METHOD=DoVoid', nvp.encode({'METHOD': 'DoVoid'}))
+
+    def test_values_are_converted_to_text(self):
+        payload = nvp.encode([('AMT', D('10.00')), ('NOSHIPPING', 1)])
+        self.assertEqual(b'AMT=10.00&NOSHIPPING=1', payload)
+
+    def test_values_are_url_encoded(self):
+        payload = nvp.encode({'DESC': 'Café & crème = 5%'})
+        self.assertEqual({'DESC': ['Café & crème = 5%']},
+                         parse_qs(payload.decode('utf8')))
+
+    def test_payflow_values_are_sent_as_is(self):
+        payload = nvp.encode({'STREET': 'Flat 1 Caxton Court'},
+                             length_tags=True)
+        self.assertEqual(b'STREET=Flat 1 Caxton Court', payload)
+
+    def test_payflow_values_with_delimiters_are_length_tagged(self):
+        payload = nvp.encode({'PWD': 'p&ss=é'}, length_tags=True)
+        self.assertEqual('PWD[7]=p&ss=é'.encode('utf8'), payload)
+
+
+class TestDecode(TestCase):
+
+    def test_matches_parse_qs(self):
+        body = ('TIMESTAMP=2012%2d03%2d26T16%3a33%3a09Z&ACK=Failure'
+                '&L_LONGMESSAGE0=Security%20header%20is%20not+valid'
+                '&EMAIL=david%2e_1332854868_per%40gmail%2ecom')
+        expected = dict((k, v[0]) for k, v in parse_qs(body).items())
+        self.assertEqual(expected, nvp.decode(body))
+
+    def test_decodes_bytes(self):
+        self.assertEqual({'NAME': 'Crème'},
+                         nvp.decode(b'NAME=Cr%C3%A8me'))
+
+    def test_blank_values_are_dropped(self):
+        self.assertEqual({'ACK': 'Success'},
+                         nvp.decode('ACK=Success&TOKEN=&PAYERID'))
+
+    def test_first_value_is_kept(self):
+        self.assertEqual({'ACK': 'Success'},
+                         nvp.decode('ACK=Success&ACK=Failure'))
+
+    def test_length_tagged_values(self):
+        self.assertEqual({'RESPMSG': 'A&B=C', 'RESULT': '0'},
+                         nvp.decode('RESPMSG[5]=A&B=C&RESULT=0'))
+
+    def test_round_trip(self):
+        params = {'PWD': 'p&ss=%+é', 'USER': 'oscar paypal'}
+        for length_tags in (False, True):
+            self.assertEqual(params, nvp.decode(nvp.encode(params, length_tags)))
@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+import base64
+import datetime
+
+from django.http import Http404
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import timezone
+from django.views import generic
+
+from paypal import pagination
+from paypal.express.models import ExpressTransaction as Transaction
+
+
+class TransactionListView(pagination.KeysetPaginationMixin,
+                          generic.ListView):
+    model = Transaction
+    template_name = 'paypal/express/dashboard/transaction_list.html'
+
+
+class TestKeysetPagination(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        # Two rows share a date_created, so the pk breaks the tie
+        self.txns = [Transaction.objects.create(
+            method='SetExpressCheckout', token='EC-%d' % i, ack='Success',
+            response_time=0, raw_request='', raw_response='',
+            date_created=now - datetime.timedelta(minutes=min(i, 3)))
+            for i in range(5)]
+        self.newest_first = sorted(
+            self.txns, key=lambda txn: (txn.date_created, txn.pk),
+            reverse=True)
+
+    def tokens(self, page):
+        return [txn.token for txn in page]
+
+    def test_pages_can_be_walked_forwards_and_backwards(self):
+        queryset = Transaction.objects.all()
+        first = pagination.paginate(queryset, 2)
+        second = pagination.paginate(queryset, 2, after=first.next_cursor)
+        third = pagination.paginate(queryset, 2, after=second.next_cursor)
+        self.assertEqual(
+            [txn.token for txn in self.newest_first],
+            self.tokens(first) + self.tokens(second) + self.tokens(third))
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+
+        back = pagination.paginate(queryset, 2,
+                                   before=third.previous_cursor)
+        self.assertEqual(self.tokens(second), self.tokens(back))
+        back = pagination.paginate(queryset, 2, before=back.previous_cursor)
+        self.assertEqual(self.tokens(first), self.tokens(back))
+        self.assertFalse(back.has_previous())
+
+    def test_ties_are_paged_by_pk_in_both_directions(self):
+        queryset = Transaction.objects.all()
+        pages = [pagination.paginate(queryset, 1)]
+        while pages[-1].has_next():
+            pages.append(pagination.paginate(
+                queryset, 1, after=pages[-1].next_cursor))
+        self.assertEqual([txn.token for txn in self.newest_first],
+                         [self.tokens(page)[0] for page in pages])
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(pagination.paginate(
+                queryset, 1, before=back[-1].previous_cursor))
+        self.assertEqual([self.tokens(page) for page in pages],
+                         [self.tokens(page) for page in reversed(back)])
+
+    def test_backward_pages_link_to_the_next_page(self):
+        queryset = Transaction.objects.all()
+        first = pagination.paginate(queryset, 2)
+        second = pagination.paginate(queryset, 2, after=first.next_cursor)
+        back = pagination.paginate(queryset, 2,
+                                   before=second.previous_cursor)
+        self.assertTrue(back.has_next())
+        forward = pagination.paginate(queryset, 2, after=back.next_cursor)
+        self.assertEqual(self.tokens(second), self.tokens(forward))
+
+    def test_backward_pages_without_older_rows_have_no_next_page(self):
+        queryset = Transaction.objects.all()
+        page = pagination.paginate(queryset, 2)
+        while page.has_next():
+            page = pagination.paginate(queryset, 2, after=page.next_cursor)
+        # The only row on the last page, and the row of its cursor
+        self.newest_first[-1].delete()
+        back = pagination.paginate(queryset, 2, before=page.previous_cursor)
+        self.assertEqual([txn.token for txn in self.newest_first[2:4]],
+                         self.tokens(back))
+        self.assertFalse(back.has_next())
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('nope', base64.urlsafe_b64encode(
+                b'yesterday,1').decode('ascii')):
+            with self.assertRaises(ValueError):
+                pagination.paginate(Transaction.objects.all(), 2,
+                                    after=cursor)
+            with self.assertRaises(ValueError):
+                pagination.paginate(Transaction.objects.all(), 2,
+                                    before=cursor)
+
+    def test_invalid_cursors_are_not_found(self):
+        view = TransactionListView.as_view()
+        for param in ('after', 'before'):
+            request = RequestFactory().get('/', {param: 'nope'})
+            with self.assertRaises(Http404):
+                view(request)
+
+    def test_counts_are_cached(self):
+        queryset = Transaction.objects.filter(method='SetExpressCheckout')
+        self.assertEqual(5, pagination.estimate_count(queryset))
+        Transaction.objects.all().delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(5, pagination.estimate_count(queryset))
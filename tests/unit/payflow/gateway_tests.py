@@ -4,23 +4,22 @@ from decimal import Decimal as D
 from django.test import TestCase
 import mock
 
+from paypal.exceptions import PayPalError
+from paypal.gateway import Response
 from paypal.payflow import gateway
+from paypal.payflow.models import PayflowTransaction
 
 
 class TestAuthorizeFunction(TestCase):
 
     def test_returns_a_txn_instance(self):
         with mock.patch('paypal.gateway.post') as mock_post:
-            mock_post.return_value = {
-                'RESULT': '126',
-                'PNREF': 'V25A2BB645A7',
-                'RESPMSG': 'Under review by Fraud Service',
-                'AUTHCODE': '525PNI',
-                'POSTFPSMSG': 'Review',
-                '_raw_request': '',
-                '_raw_response': '',
-                '_response_time': 1000
-            }
+            mock_post.return_value = Response(
+                b'',
+                b'RESULT=126&PNREF=V25A2BB645A7'
+                b'&RESPMSG=Under review by Fraud Service'
+                b'&AUTHCODE=525PNI&POSTFPSMSG=Review',
+                1000)
             txn = gateway.authorize(
                 order_number='1234',
                 card_number='4111111111111111',
@@ -31,16 +30,16 @@ class TestAuthorizeFunction(TestCase):
 
     def test_hides_card_details(self):
         with mock.patch('paypal.gateway.post') as mock_post:
-            mock_post.return_value = {
-                'RESULT': '126',
-                'PNREF': 'V25A2BB645A7',
-                'RESPMSG': 'Under review by Fraud Service',
-                'AUTHCODE': '525PNI',
-                'POSTFPSMSG': 'Review',
-                '_raw_request': 'VENDOR=oscarpaypal&TRXTYPE=A&ZIP=n12+9et&LASTNAME=&COMMENT1=100010&EXPDATE=0113&COMMENT2=&STATE=&STREET=Flat+1+Caxton+Court&USER=oscarpaypal&CVV2=123&TENDER=C&ACCT=5555555555554444&CITY=&FIRSTNAME=&PWD=secret&AMT=6.99',
-                '_raw_response': '',
-                '_response_time': 1000
-            }
+            mock_post.return_value = Response(
+                b'VENDOR=oscarpaypal&TRXTYPE=A&ZIP=n12+9et&LASTNAME='
+                b'&COMMENT1=100010&EXPDATE=0113&COMMENT2=&STATE='
+                b'&STREET=Flat+1+Caxton+Court&USER=oscarpaypal&CVV2=123'
+                b'&TENDER=C&ACCT=5555555555554444&CITY=&FIRSTNAME='
+                b'&PWD=secret&AMT=6.99',
+                b'RESULT=126&PNREF=V25A2BB645A7'
+                b'&RESPMSG=Under review by Fraud Service'
+                b'&AUTHCODE=525PNI&POSTFPSMSG=Review',
+                1000)
             txn = gateway.authorize(
                 order_number='1234',
                 card_number='5555555555554444',
@@ -53,13 +52,8 @@ class TestAuthorizeFunction(TestCase):
 
     def test_error_handled_gracefully(self):
         with mock.patch('paypal.gateway.post') as mock_post:
-            mock_post.return_value = {
-                'RESULT': '4',
-                'RESPMSG': 'Invalid amount',
-                '_raw_request': '',
-                '_raw_response': 'RESULT=4&RESPMSG=Invalid amount',
-                '_response_time': 1000
-            }
+            mock_post.return_value = Response(
+                b'', b'RESULT=4&RESPMSG=Invalid amount', 1000)
             txn = gateway.authorize(
                 order_number='1234',
                 card_number='5555555555554444',
@@ -72,13 +66,37 @@ class TestReferenceTransaction(TestCase):
 
     def test_for_smoke(self):
         with mock.patch('paypal.gateway.post') as mock_post:
-            mock_post.return_value = {
-                'RESULT': '1',
-                'RESPMSG': '',
-                '_raw_request': '',
-                '_raw_response': '',
-                '_response_time': 1000
-            }
+            mock_post.return_value = Response(
+                b'', b'RESULT=1&RESPMSG=', 1000)
             gateway.reference_transaction(order_number='12345',
                                           pnref='111222',
                                           amt=D('12.23'))
+
+
+class TestRequestId(TestCase):
+
+    def test_request_id_header_is_sent(self):
+        with mock.patch('paypal.gateway.post') as mock_post:
+            mock_post.return_value = Response(
+                b'', b'RESULT=0&RESPMSG=Approved', 1000)
+            gateway.void(order_number='12345', pnref='111222')
+        url, params, headers = mock_post.call_args[0]
+        self.assertTrue(headers['X-VPS-REQUEST-ID'])
+
+
+class TestTransactionMany(TestCase):
+
+    def test_unexpected_exceptions_dont_lose_the_other_rows(self):
+        def post(url, params, headers, length_tags):
+            if params['ORIGID'] == '111222':
+                raise ValueError("Unexpected")
+            return Response(b'', b'RESULT=0&RESPMSG=Approved', 1000)
+        with mock.patch('paypal.gateway.post', post):
+            results = gateway.transaction_many(
+                [gateway._void_params('12345', '111222'),
+                 gateway._void_params('12346', '333444')],
+                max_workers=1)
+        self.assertIsInstance(results[0], PayPalError)
+        self.assertTrue(results[1].is_approved)
+        self.assertEqual(['12346'], list(
+            PayflowTransaction.objects.values_list('comment1', flat=True)))
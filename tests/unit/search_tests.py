@@ -0,0 +1,82 @@
+from __future__ import unicode_literals
+import datetime
+from decimal import Decimal as D
+
+from django.db.backends.postgresql_psycopg2.operations import (
+    DatabaseOperations as PostgresOperations)
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from paypal import search
+from paypal.express.dashboard.forms import ExpressTransactionSearchForm
+from paypal.express.models import ExpressTransaction as Transaction
+
+
+def create_txn(token, days_old=0, **kwargs):
+    return Transaction.objects.create(
+        method='DoExpressCheckoutPayment', token=token, ack='Success',
+        response_time=0, raw_request='', raw_response='',
+        date_created=timezone.now() - datetime.timedelta(days=days_old),
+        **kwargs)
+
+
+class TestSearchForm(TestCase):
+
+    def search(self, **data):
+        form = ExpressTransactionSearchForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        return sorted(txn.token for txn in form.filter(
+            Transaction.objects.all()))
+
+    def test_identifiers_are_matched_exactly(self):
+        create_txn('EC-1', correlation_id='abc123')
+        create_txn('EC-2', correlation_id='abc1234')
+        self.assertEqual(['EC-1'], self.search(correlation_id='abc123'))
+
+    def test_identifier_searches_are_not_limited_to_recent_rows(self):
+        create_txn('EC-1', days_old=400)
+        self.assertEqual(['EC-1'], self.search(token='EC-1'))
+
+    def test_other_searches_are_limited_to_recent_rows(self):
+        create_txn('EC-1', amount=D('10.00'))
+        create_txn('EC-2', amount=D('10.00'), days_old=60)
+        self.assertEqual(['EC-1'], self.search(amount_from='5'))
+
+    def test_amount_and_error_code_are_filtered(self):
+        create_txn('EC-1', amount=D('10.00'), error_code='10486')
+        create_txn('EC-2', amount=D('20.00'), error_code='10486')
+        create_txn('EC-3', amount=D('10.00'))
+        self.assertEqual(['EC-1'], self.search(
+            amount_to='15', error_code='10486'))
+
+    def test_long_date_ranges_are_rejected(self):
+        form = ExpressTransactionSearchForm({
+            'date_from': '2012-01-01', 'date_to': '2014-01-01'})
+        self.assertFalse(form.is_valid())
+
+    @override_settings(PAYPAL_DASHBOARD_TRIGRAM_SEARCH=True)
+    def test_short_substrings_are_rejected_with_trigram_search(self):
+        form = ExpressTransactionSearchForm({'token': 'EC'})
+        self.assertFalse(form.is_valid())
+
+    @override_settings(PAYPAL_DASHBOARD_TRIGRAM_SEARCH=True)
+    def test_trigram_searches_use_the_trigram_lookup(self):
+        form = ExpressTransactionSearchForm({'token': 'EC-123'})
+        self.assertTrue(form.is_valid(), form.errors)
+        queryset = Transaction.objects.all()
+        expected = queryset.filter(
+            **{'token__%s' % search.TRIGRAM_LOOKUP: 'EC-123'})
+        self.assertEqual(str(expected.query), str(form.filter(queryset).query))
+
+
+class TestTrigramIndexes(TestCase):
+
+    def test_indexes_match_the_postgresql_lookup(self):
+        # Django compiles icontains to UPPER("col"::text) LIKE UPPER(%s) on
+        # PostgreSQL, and the index must be on that same expression
+        self.assertEqual('icontains', search.TRIGRAM_LOOKUP)
+        self.assertEqual(
+            'UPPER("token"::text)',
+            search.trigram_index_expression(PostgresOperations(None),
+                                            'token'))
@@ -0,0 +1,186 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from paypal import nvp, simulator
+
+
+class SimulatorTestCase(TestCase):
+
+    def setUp(self):
+        self.simulator = simulator.Simulator(seed=1)
+
+    def call(self, **params):
+        return nvp.decode(self.simulator.post(nvp.encode(params)))
+
+    def payflow(self, request_id=None, **params):
+        body = nvp.encode(params, length_tags=True)
+        return nvp.decode(self.simulator.post(
+            body, {'X-VPS-REQUEST-ID': request_id}))
+
+    def set_express_checkout(self, action='Sale'):
+        return self.call(METHOD='SetExpressCheckout',
+                         PAYMENTREQUEST_0_AMT='10.00',
+                         PAYMENTREQUEST_0_PAYMENTACTION=action,
+                         RETURNURL='http://example.com/success/',
+                         CANCELURL='http://example.com/cancel/')['TOKEN']
+
+    def do_payment(self, token, action='Sale'):
+        return self.call(METHOD='DoExpressCheckoutPayment', TOKEN=token,
+                         PAYERID='12345', PAYMENTREQUEST_0_AMT='10.00',
+                         PAYMENTREQUEST_0_PAYMENTACTION=action)
+
+
+class TestExpressCheckout(SimulatorTestCase):
+
+    def test_set_returns_a_token(self):
+        token = self.set_express_checkout()
+        self.assertTrue(token.startswith('EC-'))
+
+    def test_set_without_an_amount_fails(self):
+        response = self.call(METHOD='SetExpressCheckout',
+                             RETURNURL='http://example.com/success/',
+                             CANCELURL='http://example.com/cancel/')
+        self.assertEqual('Failure', response['ACK'])
+        self.assertEqual('10400', response['L_ERRORCODE0'])
+
+    def test_approval_redirects_to_return_url(self):
+        token = self.set_express_checkout()
+        url = self.simulator.approve(token)
+        self.assertTrue(url.startswith(
+            'http://example.com/success/?token=%s&PayerID=' % token))
+
+    def test_details_echo_the_payment_request(self):
+        token = self.set_express_checkout()
+        response = self.call(METHOD='GetExpressCheckoutDetails', TOKEN=token)
+        self.assertEqual('Success', response['ACK'])
+        self.assertEqual('10.00', response['PAYMENTREQUEST_0_AMT'])
+        self.assertEqual(token, response['TOKEN'])
+        self.assertIn('PAYMENTREQUEST_0_SHIPTOSTREET', response)
+
+    def test_details_for_unknown_token_fail(self):
+        response = self.call(METHOD='GetExpressCheckoutDetails',
+                             TOKEN='EC-UNKNOWN')
+        self.assertEqual('10410', response['L_ERRORCODE0'])
+
+    def test_payment_can_only_be_made_once(self):
+        token = self.set_express_checkout()
+        self.assertEqual('Success', self.do_payment(token)['ACK'])
+        self.assertEqual('10415', self.do_payment(token)['L_ERRORCODE0'])
+
+    def test_unknown_method_fails(self):
+        self.assertEqual('81002', self.call(METHOD='Foo')['L_ERRORCODE0'])
+
+
+class TestExpressAuthorizations(SimulatorTestCase):
+
+    def setUp(self):
+        super(TestExpressAuthorizations, self).setUp()
+        token = self.set_express_checkout('Authorization')
+        response = self.do_payment(token, 'Authorization')
+        self.assertEqual('Pending', response['PAYMENTINFO_0_PAYMENTSTATUS'])
+        self.authorization_id = response['PAYMENTINFO_0_TRANSACTIONID']
+
+    def test_authorization_can_only_be_captured_once(self):
+        response = self.call(METHOD='DoCapture',
+                             AUTHORIZATIONID=self.authorization_id)
+        self.assertEqual('Success', response['ACK'])
+        response = self.call(METHOD='DoCapture',
+                             AUTHORIZATIONID=self.authorization_id)
+        self.assertEqual('10602', response['L_ERRORCODE0'])
+
+    def test_capture_can_be_partially_refunded(self):
+        capture = self.call(METHOD='DoCapture',
+                            AUTHORIZATIONID=self.authorization_id)
+        transaction_id = capture['TRANSACTIONID']
+        response = self.call(METHOD='RefundTransaction',
+                             TRANSACTIONID=transaction_id,
+                             REFUNDTYPE='Partial', AMT='4.00')
+        self.assertEqual('Success', response['ACK'])
+        response = self.call(METHOD='RefundTransaction',
+                             TRANSACTIONID=transaction_id,
+                             REFUNDTYPE='Partial', AMT='7.00')
+        self.assertEqual('10009', response['L_ERRORCODE0'])
+
+    def test_voided_authorization_cant_be_captured(self):
+        response = self.call(METHOD='DoVoid',
+                             AUTHORIZATIONID=self.authorization_id)
+        self.assertEqual('Success', response['ACK'])
+        response = self.call(METHOD='DoCapture',
+                             AUTHORIZATIONID=self.authorization_id)
+        self.assertEqual('10602', response['L_ERRORCODE0'])
+
+
+class TestPayflow(SimulatorTestCase):
+
+    def authorize(self, request_id=None, **params):
+        card = {'TRXTYPE': 'A', 'TENDER': 'C', 'ACCT': '4111111111111111',
+                'EXPDATE': '1299', 'AMT': '10.00'}
+        card.update(params)
+        return self.payflow(request_id, **card)
+
+    def test_valid_card_is_approved(self):
+        response = self.authorize()
+        self.assertEqual('0', response['RESULT'])
+        self.assertEqual(12, len(response['PNREF']))
+
+    def test_invalid_card_number_is_rejected(self):
+        response = self.authorize(ACCT='4111111111111112')
+        self.assertEqual('23', response['RESULT'])
+
+    def test_expired_card_is_rejected(self):
+        self.assertEqual('24', self.authorize(EXPDATE='0110')['RESULT'])
+
+    def test_authorization_can_be_captured_once(self):
+        pnref = self.authorize()['PNREF']
+        response = self.payflow(TRXTYPE='D', ORIGID=pnref)
+        self.assertEqual('0', response['RESULT'])
+        response = self.payflow(TRXTYPE='D', ORIGID=pnref)
+        self.assertEqual('111', response['RESULT'])
+
+    def test_unknown_origid_is_rejected(self):
+        response = self.payflow(TRXTYPE='V', ORIGID='UNKNOWN')
+        self.assertEqual('19', response['RESULT'])
+
+    def test_duplicate_request_id_returns_original_response(self):
+        first = self.authorize('abc')
+        self.assertEqual(first, self.authorize('abc'))
+        self.assertNotEqual(first['PNREF'], self.authorize('def')['PNREF'])
+
+
+class TestBehaviour(TestCase):
+
+    def test_injected_errors_are_returned(self):
+        sim = simulator.Simulator(
+            errors=simulator.parse_errors(['DoVoid=10001:1', 'S=12:1']))
+        response = nvp.decode(sim.post(b'METHOD=DoVoid&AUTHORIZATIONID=1'))
+        self.assertEqual('10001', response['L_ERRORCODE0'])
+        response = nvp.decode(sim.post(b'TRXTYPE=S&AMT=1.00'))
+        self.assertEqual('12', response['RESULT'])
+        self.assertEqual('Declined', response['RESPMSG'])
+
+    def test_latency_specs(self):
+        self.assertEqual(0.2, simulator.parse_latency('200')())
+        latency = simulator.parse_latency('uniform:100,300')()
+        self.assertTrue(0.1 <= latency <= 0.3)
+        self.assertTrue(simulator.parse_latency('lognormal:200,0.5')() > 0)
+
+    def test_seeded_runs_are_repeatable(self):
+        def run(seed):
+            sim = simulator.Simulator(
+                latency={'default': 'uniform:0,1'}, seed=seed)
+            latency = sim.latency['default']()
+            response = nvp.decode(sim.post(
+                b'METHOD=SetExpressCheckout&PAYMENTREQUEST_0_AMT=10.00'
+                b'&RETURNURL=http://example.com/'
+                b'&CANCELURL=http://example.com/'))
+            pnref = nvp.decode(sim.post(
+                b'TRXTYPE=S&TENDER=C&ACCT=4111111111111111&EXPDATE=1230'
+                b'&AMT=1.00'))['PNREF']
+            return latency, response['TOKEN'], response['CORRELATIONID'], pnref
+        self.assertEqual(run(1), run(1))
+        self.assertNotEqual(run(1), run(2))
+
+    def test_unknown_latency_distribution_raises(self):
+        with self.assertRaises(ValueError):
+            simulator.parse_latency('gamma:1,2')